@@ -1,5 +1,40 @@
 from flask import Flask
 
-app = Flask(__name__)
+from app.json_backend import Request
 
-from app import routes, data
+
+def create_app(**settings):
+    """
+    Создает приложение с настройками из config.py, settings их переопределяют (например, DATABASE_URI).
+    Хранилище при этом не открывается: это происходит при первом обращении к нему в процессе (app/storage.py)
+    """
+    from app import commands
+    from app.admission import AssignQueue
+    from app.feed import OrderFeed
+    from app.idempotency import Idempotency
+    from app.metrics import Metrics
+    from app.profiling import Profiler
+    from app.routes import api
+    from app.storage import Storage
+
+    app = Flask(__name__)
+    app.request_class = Request
+    app.config.from_object('config')
+    app.config.update(settings)
+
+    metrics = Metrics(app.config['METRICS_LATENCY_BUCKETS'])
+    metrics.init_app(app)
+    Storage(metrics).init_app(app)
+    Idempotency(app.config['IDEMPOTENCY_CACHE_SIZE'], app.config['IDEMPOTENCY_TTL_SECONDS']).init_app(app)
+    Profiler(app.config['PROFILE_SAMPLE_RATE'], app.config['PROFILE_SLOW_SECONDS'],
+             app.config['PROFILE_DIR']).init_app(app)
+    AssignQueue(app.config['ASSIGN_QUEUE_SIZE'], app.config['ASSIGN_BATCH_SIZE'],
+                app.config['ASSIGN_RETRY_AFTER_SECONDS']).init_app(app)
+    OrderFeed(app.config['FEED_POLL_SECONDS'], app.config['FEED_EVENTS_KEEP'], app.config['FEED_MAX_WAITERS'],
+              app.config['FEED_RETRY_AFTER_SECONDS']).init_app(app)
+    app.register_blueprint(api)
+    commands.init_app(app)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,128 @@
+"""
+Допуск запросов на назначение заказов (POST /orders/assign). Запросы встают в ограниченную очередь, один поток
+процесса забирает из нее все, что накопилось (не больше batch_size), и назначает пачкой: одна выборка свободных
+заказов и одна транзакция записи на всю пачку вместо выборки и записи на каждого курьера. Пока пачка
+выполняется, копится следующая, так что без нагрузки запрос не ждет, а под нагрузкой пачки растут.
+
+Одновременно в очереди и в выполняемой пачке не больше maxsize запросов: каждый из них занимает поток воркера,
+так что назначение не займет больше maxsize потоков. Остальные запросы сразу получают отказ (429 с Retry-After),
+а не ждут блокировку записи базы до таймаута
+"""
+import os
+import queue
+import threading
+import typing as tp
+from concurrent.futures import Future
+
+from flask import Flask
+
+from app.metrics import SqlCounter, add_sql, count_sql
+from app.profiling import working_for
+
+
+class Overloaded(Exception):
+    pass
+
+
+class AssignQueue:
+    """
+    Очередь назначений процесса. Курьеры в пачке обслуживаются в порядке прихода запросов, каждому - как при
+    отдельном назначении: пачка из одного курьера - Order.orders_for_courier, из нескольких -
+    Order.orders_for_couriers с capacity_limit=False (распределение distribute_orders_by_hours)
+    """
+    def __init__(self, maxsize: int, batch_size: int, retry_after: int):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.retry_after = retry_after
+        self.queue = queue.Queue()
+        # Места для запросов в очереди и в выполняемой пачке
+        self.slots = threading.BoundedSemaphore(maxsize) if maxsize > 0 else None
+        self.lock = threading.Lock()
+        self.pid = None
+        self.batches = 0
+        self.assigned = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def init_app(self, app: Flask):
+        app.extensions['assign_queue'] = self
+
+    def assign(self, orders: tp.Any, courier: dict):
+        """
+        Назначает заказы курьеру через очередь. Возвращает (заказы, время назначения), как Order.orders_for_courier.
+        Если в очереди и в выполняемой пачке уже maxsize запросов, бросает Overloaded.
+        SQL-запросы пачки засчитываются в метрики запроса, а стеки потока очереди - в его профиль
+        """
+        self.start(orders)
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise Overloaded
+        sql = SqlCounter()
+        try:
+            future = Future()
+            self.queue.put((courier, future, threading.get_ident(), sql))
+            return future.result()
+        finally:
+            add_sql(sql)
+            self.slots.release()
+
+    def start(self, orders: tp.Any):
+        # Поток запускается в каждом процессе при первом назначении: после fork (--preload) потока родителя нет
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    thread = threading.Thread(target=self.run, args=(orders,), name='assign-queue', daemon=True)
+                    thread.start()
+                    self.pid = os.getpid()
+
+    def run(self, orders: tp.Any):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.process(orders, batch)
+
+    def process(self, orders: tp.Any, batch: tp.List[tp.Tuple[dict, Future, int, SqlCounter]]):
+        """
+        Назначает пачку. Элементы пачки - (курьер, результат, айди потока запроса, счетчик SQL запроса):
+        каждому запросу засчитывается работа всей пачки, как если бы он выполнял ее сам
+        """
+        couriers = dict()
+        for courier, future, thread_id, sql in batch:
+            couriers.setdefault(courier['courier_id'], courier)
+        try:
+            with count_sql([sql for courier, future, thread_id, sql in batch]), \
+                    working_for([thread_id for courier, future, thread_id, sql in batch]):
+                if len(couriers) == 1:
+                    # Один курьер - обычное назначение со своей выборкой кандидатов
+                    courier = next(iter(couriers.values()))
+                    matching_orders, assign_time = orders.orders_for_courier(courier)
+                    assigned = {courier['courier_id']: matching_orders}
+                else:
+                    assigned, assign_time = orders.orders_for_couriers(list(couriers.values()),
+                                                                       capacity_limit=False)
+        except Exception as e:
+            for courier, future, thread_id, sql in batch:
+                future.set_exception(e)
+            return
+        with self.lock:
+            self.batches += 1
+            self.assigned += len(batch)
+        # Повторный запрос того же курьера в пачке получает пустой список, как если бы пришел следом
+        answered = set()
+        for courier, future, thread_id, sql in batch:
+            courier_id = courier['courier_id']
+            matching_orders = assigned[courier_id] if courier_id not in answered else []
+            answered.add(courier_id)
+            future.set_result((matching_orders, assign_time if matching_orders else None))
+
+    def stats(self):
+        return {'queued': self.queue.qsize(), 'maxsize': self.maxsize, 'batches': self.batches,
+                'assigned': self.assigned, 'rejected': self.rejected}
@@ -0,0 +1,85 @@
+import threading
+import time
+import typing as tp
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Ограниченный по размеру кэш в памяти процесса с вытеснением давно не использованных записей.
+    Если задан ttl (секунды), запись живет не дольше ttl с момента записи.
+    Считает попадания и промахи. Потокобезопасен
+    """
+    def __init__(self, maxsize: int, ttl: tp.Optional[float] = None, clock: tp.Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tp.Hashable, default: tp.Any = None):
+        with self.lock:
+            try:
+                expires, value = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires <= self.clock():
+                del self.data[key]
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: tp.Hashable, value: tp.Any):
+        with self.lock:
+            self.store(key, value)
+
+    def add(self, key: tp.Hashable, value: tp.Any):
+        """
+        Записывает value, только если ключа нет (или его запись устарела). Возвращает, записано ли
+        """
+        with self.lock:
+            if key in self.data:
+                expires, _ = self.data[key]
+                if expires is None or expires > self.clock():
+                    return False
+            self.store(key, value)
+            return True
+
+    def get_or_add(self, key: tp.Hashable, value: tp.Any):
+        """
+        add и get под одной блокировкой: возвращает (запись, записано ли). Если ключ есть и запись не устарела,
+        возвращает ее, иначе записывает value
+        """
+        with self.lock:
+            if key in self.data:
+                expires, stored = self.data[key]
+                if expires is None or expires > self.clock():
+                    self.data.move_to_end(key)
+                    self.hits += 1
+                    return stored, False
+            self.misses += 1
+            self.store(key, value)
+            return value, True
+
+    def store(self, key: tp.Hashable, value: tp.Any):
+        self.data[key] = (self.clock() + self.ttl if self.ttl is not None else None, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+        # Устаревшие записи в начале очереди (давно не использованные) вытесняются сразу, остальные - при чтении
+        if self.ttl is not None:
+            now = self.clock()
+            while self.data and next(iter(self.data.values()))[0] <= now:
+                self.data.popitem(last=False)
+
+    def invalidate(self, key: tp.Hashable):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.data), 'maxsize': self.maxsize}
@@ -0,0 +1,48 @@
+import click
+from flask import Flask, current_app
+from flask.cli import with_appcontext
+
+from app.storage import Orders
+
+
+@click.command('migrate')
+@with_appcontext
+def migrate():
+    """
+    Создает или обновляет схему базы (в том числе всех шардов). Запускать перед стартом воркеров с AUTO_MIGRATE=0
+    """
+    if current_app.extensions['storage'].migrate():
+        click.echo('Schema is up to date')
+    else:
+        click.echo('Memory storage has no schema')
+
+
+@click.command('rebuild-stats')
+@click.option('--verify-only', is_flag=True, help='Только сверить агрегаты, не пересчитывая их')
+@with_appcontext
+def rebuild_stats(verify_only: bool):
+    """
+    Пересчитывает агрегаты курьеров (заработок, рейтинг) по таблице orders и сверяет их
+    """
+    mismatched = Orders.verify_stats()
+    click.echo(f'Couriers with mismatched stats: {len(mismatched)}')
+    if verify_only:
+        raise SystemExit(1 if mismatched else 0)
+    Orders.rebuild_stats()
+    mismatched = Orders.verify_stats()
+    click.echo(f'Rebuilt, mismatched after rebuild: {len(mismatched)}')
+    raise SystemExit(1 if mismatched else 0)
+
+
+@click.command('archive-orders')
+@with_appcontext
+def archive_orders():
+    """
+    Переносит выполненные заказы из горячей таблицы orders в архив (например, по расписанию из cron)
+    """
+    click.echo(f'Archived orders: {Orders.archive_completed()}')
+
+
+def init_app(app: Flask):
+    for command in (migrate, rebuild_stats, archive_orders):
+        app.cli.add_command(command)
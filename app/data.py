@@ -1,4 +1,4 @@
-import re
+import itertools
 from datetime import datetime, timezone
 import typing as tp
 
@@ -8,17 +8,56 @@ from sqlalchemy.engine import Engine
 
 from config import *
 from app.utils import *
+from app.cache import LRUCache
+from app.validation import validate_order, validate_courier, validate_courier_update, validate_completion, \
+    find_invalid
 
 
-def init_db():
+def create_engine(database_uri: str, profile: str):
+    """
+    Создает Engine с настройками из профиля хранилища STORAGE_PROFILES
+    """
+    settings = STORAGE_PROFILES[profile]
+    kwargs = dict()
+    if 'pool' in settings:
+        kwargs.update(poolclass=db.pool.QueuePool, **settings['pool'])
+        if database_uri.startswith('sqlite'):
+            # подключение из пула может достаться другому потоку, доступ к нему пул и так сериализует
+            kwargs['connect_args'] = {'check_same_thread': False}
+    engine = db.create_engine(database_uri, **kwargs)
+
+    pragmas = settings.get('pragmas')
+    if pragmas and engine.dialect.name == 'sqlite':
+        @db.event.listens_for(engine, 'connect')
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for key, value in pragmas.items():
+                cursor.execute(f'PRAGMA {key} = {value}')
+            cursor.close()
+    return engine
+
+
+def init_db(database_uri: str = DATABASE_URI, profile: str = STORAGE_PROFILE, migrate: bool = True):
     """
     Инициализируем Engine для нашей базы данных и 2 таблицы:
     orders: хранятся заказы и их статус (курьер и время его назначения, статус и время выполнения)
     couriers: хранится информация про курьеров
 
     Для простоты выбрал БД SQLite, но все на SQLAlchemy, поэтому можно на другие БД перейти относительно несложно
+
+    migrate=False - схема уже создана отдельным шагом (flask migrate), к базе при инициализации не обращаемся
+    """
+    engine = create_engine(database_uri, profile)
+    metadata, orders, couriers = define_tables()
+    if migrate:
+        migrate_db(engine, metadata)
+    return engine, orders, couriers
+
+
+def define_tables():
+    """
+    Описание схемы без обращения к базе. Возвращает MetaData и таблицы orders, couriers
     """
-    engine = db.create_engine(DATABASE_URI)
     metadata = db.MetaData()
     orders = db.Table('orders', metadata,
                       db.Column('order_id', db.Integer, nullable=False, primary_key=True),
@@ -31,146 +70,450 @@ def init_db():
                       db.Column('complete_time', db.DateTime, nullable=True),
                       db.Column('assigned_type_coef', db.Integer, nullable=False, default=0)
                       )
-    metadata.create_all(engine)
+    # Свободные заказы: частичный индекс, в него попадают только еще не назначенные заказы
+    db.Index('ix_orders_unassigned', orders.columns.region, orders.columns.weight,
+             sqlite_where=db.and_(orders.columns.courier_id == None, orders.columns.complete == False),
+             postgresql_where=db.and_(orders.columns.courier_id == None, orders.columns.complete == False))
+    # Заказы курьера (все или только выполненные). Свободные заказы сюда не попадают
+    db.Index('ix_orders_courier_complete', orders.columns.courier_id, orders.columns.complete,
+             sqlite_where=orders.columns.courier_id != None,
+             postgresql_where=orders.columns.courier_id != None)
+    # Интервалы доставки, распарсенные при загрузке заказа: по строке на интервал, в минутах от начала суток
+    order_hours = db.Table('order_hours', metadata,
+                           db.Column('order_id', db.Integer, nullable=False, index=True),
+                           db.Column('start_minute', db.Integer, nullable=False),
+                           db.Column('end_minute', db.Integer, nullable=False)
+                           )
+    # Накопленные агрегаты по выполненным заказам курьера в каждом регионе,
+    # обновляются при выполнении заказа. min_delivery_time хранится в секундах
+    courier_stats = db.Table('courier_stats', metadata,
+                             db.Column('courier_id', db.Integer, nullable=False, primary_key=True),
+                             db.Column('region', db.Integer, nullable=False, primary_key=True),
+                             db.Column('earnings', db.Integer, nullable=False, default=0),
+                             db.Column('completed', db.Integer, nullable=False, default=0),
+                             db.Column('min_delivery_time', db.Float, nullable=False),
+                             db.Column('last_complete_time', db.DateTime, nullable=False)
+                             )
+    # Архив выполненных заказов: те же колонки, что в orders. Горячая таблица orders
+    # остается размером с текущую работу, история (пересчет агрегатов, проверка повторов айди) смотрит в обе
+    orders_archive = db.Table('orders_archive', metadata,
+                              *(db.Column(column.name, column.type, nullable=column.nullable,
+                                          primary_key=column.primary_key)
+                                for column in orders.columns))
+    # История курьера с постраничной выдачей по (complete_time, order_id)
+    db.Index('ix_orders_archive_courier', orders_archive.columns.courier_id, orders_archive.columns.complete_time,
+             orders_archive.columns.order_id)
+
+    # События ленты свободных заказов (GET /couriers/<id>/feed): по строке на регион, в котором транзакция
+    # добавила или освободила заказы, с минимальным весом этих заказов. Воркеры читают новые строки по seq
+    db.Table('order_events', metadata,
+             db.Column('seq', db.Integer, nullable=False, primary_key=True),
+             db.Column('region', db.Integer, nullable=False),
+             db.Column('min_weight', db.Float, nullable=False),
+             sqlite_autoincrement=True)
 
     couriers = db.Table('couriers', metadata,
                         db.Column('courier_id', db.Integer, nullable=False, primary_key=True),
                         db.Column('courier_type', db.String, nullable=False),
                         db.Column('regions', db.String, nullable=False),
-                        db.Column('working_hours', db.String, nullable=False)
+                        db.Column('working_hours', db.String, nullable=False),
+                        # Увеличивается при каждом изменении курьера, по нему сверяются кэши профилей в воркерах
+                        db.Column('version', db.Integer, nullable=False, default=0, server_default='0')
                         )
+    return metadata, orders, couriers
+
+
+def migrate_db(engine: Engine, metadata: db.MetaData):
+    """
+    Создает недостающие таблицы, колонки и индексы и дозаполняет производные таблицы. Повторный запуск ничего не меняет
+    """
     metadata.create_all(engine)
-    return engine, orders, couriers
+    add_missing_columns(engine, metadata)
+    create_indexes(engine, metadata)
+    backfill_order_hours(engine, metadata.tables['orders'], metadata.tables['order_hours'])
+
+
+def add_missing_columns(engine: Engine, metadata: db.MetaData):
+    """
+    Миграция для существующих баз: create_all не добавляет новые колонки к уже созданным таблицам
+    """
+    inspector = db.inspect(engine)
+    for table in metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = db.schema.CreateColumn(column).compile(dialect=engine.dialect)
+                with engine.begin() as con:
+                    con.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+
+
+def create_indexes(engine: Engine, metadata: db.MetaData):
+    """
+    Миграция для существующих баз: create_all не добавляет индексы к уже созданным таблицам
+    """
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+def backfill_order_hours(engine: Engine, orders: db.Table, order_hours: db.Table):
+    """
+    Заполняет order_hours для заказов, записанных в базу до появления этой таблицы
+    """
+    select = db.select(orders.columns.order_id, orders.columns.delivery_hours) \
+        .where(~db.exists().where(order_hours.columns.order_id == orders.columns.order_id))
+    with engine.begin() as con:
+        rows = [{'order_id': order_id, 'start_minute': start, 'end_minute': end}
+                for order_id, delivery_hours in con.execute(select)
+                for start, end in parse_hours(delivery_hours.split(',')) if delivery_hours]
+        if rows:
+            con.execute(db.insert(order_hours), rows)
 
 
 class Order:
-    def __init__(self, engine: Engine, table: db.Table):
+    """
+    Настройки по умолчанию - из config.py, приложение передает свои (app.config) при создании хранилища
+    """
+    def __init__(self, engine: Engine, table: db.Table, chunk_size: int = SQL_CHUNK_SIZE,
+                 events_keep: int = FEED_EVENTS_KEEP, archive_threshold: int = ARCHIVE_THRESHOLD,
+                 archive_check_every: int = ARCHIVE_CHECK_EVERY):
         self.engine = engine
         self.table = table
+        self.hours_table = table.metadata.tables['order_hours']
+        self.stats_table = table.metadata.tables['courier_stats']
+        self.archive_table = table.metadata.tables['orders_archive']
+        self.events_table = table.metadata.tables['order_events']
+        # Шарды не пишут ленту сами: ее ведет ShardedOrder в основной базе
+        self.publishes_events = True
+        self.chunk_size = chunk_size
+        self.events_keep = events_keep
+        self.archive_threshold = archive_threshold
+        self.archive_check_every = archive_check_every
+        # Сколько заказов выполнено в этом процессе с последней проверки порога архивации
+        self.completed_since_check = 0
         self.id_col = 'order_id'
+        self.validate = validate_order
         self.valid_cols = ['order_id', 'weight', 'region', 'delivery_hours']
 
-    def insert_row(self, data: dict):
+    @staticmethod
+    def to_row(data: dict):
         """
-        Добавляет строку в таблицу (с данными из аргумента)
+        Приводит входной элемент к виду строки таблицы
         """
-        with self.engine.connect() as con:
-            id = data[self.id_col]
-            query = db.insert(self.table).values(order_id=data['order_id'],
-                                                 weight=data['weight'],
-                                                 region=data['region'],
-                                                 delivery_hours=",".join(data['delivery_hours']))
-            # courier_id=db.sql.null())
-            con.execute(query)
-        return id
+        return {'order_id': data['order_id'],
+                'weight': data['weight'],
+                'region': data['region'],
+                'delivery_hours': ",".join(data['delivery_hours'])}
 
     @staticmethod
-    def validate_data(data: dict):
+    def to_hours_rows(data: dict):
         """
-        Валидация входных данных
+        Строки order_hours для заказа: интервалы доставки в минутах
         """
-        if not isinstance(data['order_id'], int):
-            raise ValueError
-        if not is_valid_weight(data['weight']):
-            raise ValueError
-        if not isinstance(data['region'], int):
-            raise ValueError
-        for w_hour in data['delivery_hours']:
-            if not re.match('(0[0-9]|1[0-9]|2[0-3]):[0-5][0-9]-(0[0-9]|1[0-9]|2[0-3]):[0-5][0-9]', w_hour):
-                raise ValueError
+        return [{'order_id': data['order_id'], 'start_minute': start, 'end_minute': end}
+                for start, end in parse_hours(data['delivery_hours'])]
+
+    def insert_rows(self, data: tp.List[dict]):
+        """
+        Добавляет строки в таблицу одной транзакцией. Если хоть одна строка не записалась, откатывается все
+        """
+        rows = [self.to_row(elem) for elem in data]
+        hours_rows = [row for elem in data for row in self.to_hours_rows(elem)]
+        with self.engine.begin() as con:
+            archived_ids = []
+            for chunk in chunks([row['order_id'] for row in rows], self.chunk_size):
+                select = db.select(self.archive_table.columns.order_id) \
+                    .where(self.archive_table.columns.order_id.in_(chunk))
+                archived_ids.extend(row[0] for row in con.execute(select))
+            if archived_ids:
+                # Для вызывающего это такой же конфликт первичного ключа, как и в самой таблице orders
+                raise db.exc.IntegrityError(f'INSERT INTO {self.table.name}', archived_ids,
+                                            ValueError('order ids are already archived'))
+            con.execute(db.insert(self.table), rows)
+            if hours_rows:
+                con.execute(db.insert(self.hours_table), hours_rows)
+            self.publish(con, min_weights(rows))
+        return [elem[self.id_col] for elem in data]
 
     def add(self, data: dict):
         """
         Валидирует список курьеров и добавляет их в базу. Возвращает список добавленных айди и флаг успеха
         В случае невалидных данных возвращает список невалидных айди, база не обновляется
         """
-        exceptions = []
-        for elem in data:
-            try:
-                validate_keys(self.valid_cols, elem)
-                self.validate_data(elem)
-            except (KeyError, ValueError):
-                exceptions.append(elem['order_id'])
-        if exceptions:
-            return exceptions, False
-        ids = []
-        for elem in data:
-            ids.append(self.insert_row(elem))
+        invalid = find_invalid(data, self.validate, self.id_col)
+        if invalid:
+            return [data[i][self.id_col] for i in invalid], False
+        try:
+            ids = self.insert_rows(data)
+        except db.exc.IntegrityError:
+            # Транзакция уже откатилась, в базе ничего не поменялось
+            return self.get_existing_ids([elem[self.id_col] for elem in data]), False
         return ids, True
 
+    def add_valid(self, data: tp.List[dict]):
+        """
+        Добавляет в базу валидные элементы списка одной транзакцией. Невалидные, повторяющиеся
+        и уже существующие в базе пропускаются. Возвращает список добавленных и список отклоненных айди
+        """
+        invalid = set(find_invalid(data, self.validate, self.id_col))
+        rejected = [data[i][self.id_col] for i in sorted(invalid)]
+        valid = {elem[self.id_col]: elem for i, elem in enumerate(data) if i not in invalid}
+        for _ in range(2):
+            existing_ids = self.get_existing_ids(list(valid))
+            rejected.extend(existing_ids)
+            for order_id in existing_ids:
+                del valid[order_id]
+            if not valid:
+                return [], rejected
+            try:
+                return self.insert_rows(list(valid.values())), rejected
+            except db.exc.IntegrityError:
+                # Другой процесс успел записать часть айди, проверяем заново
+                continue
+        return [], rejected + list(valid)
+
     def get_courier_orders(self, courier_id: int, completed: bool = False):
         """
-        Возвращает список заказов, назначенных на курьера
+        Возвращает список заказов, назначенных на курьера, вместе с архивными
         Если completed = True, то возвращаются только уже доставленные заказы
         """
+        data = []
         with self.engine.connect() as conn:
-            if completed:
-                select = db.select(self.table) \
-                    .where(self.table.columns.courier_id == courier_id,
-                           self.table.columns.complete == True)
-            else:
-                select = db.select(self.table) \
-                    .where(self.table.columns.courier_id == courier_id)
-            data = conn.execute(select).fetchall()
-        return data
+            for table in (self.table, self.archive_table):
+                select = db.select(table).where(table.columns.courier_id == courier_id)
+                if completed:
+                    select = select.where(table.columns.complete == True)
+                data.extend(conn.execute(select).fetchall())
+        return sorted(data, key=lambda x: x['order_id'])
 
-    def cancel_orders(self, orders: tp.List[dict]):
+    @staticmethod
+    def history_key(order: tp.Any):
         """
-        Отменяет назначение курьеров на выбранные заказы
+        Порядок истории заказов курьера: выполненные по времени выполнения, затем невыполненные, внутри - по айди
         """
+        return order['complete_time'] is None, order['complete_time'] or datetime.min, order['order_id']
+
+    def history_page(self, courier_id: int, status: str, limit: int,
+                     after: tp.Optional[tp.Tuple[tp.Optional[datetime], int]] = None):
+        """
+        Страница заказов курьера (вместе с архивными) в порядке history_key.
+        status: all, active (не выполнены) или completed. after - (complete_time, order_id) последнего заказа
+        предыдущей страницы. Из базы читается не больше limit + 1 строки.
+        Возвращает строки страницы и ключ для следующей страницы (None, если страница последняя)
+        """
+        selects = []
+        for table in (self.table, self.archive_table):
+            columns = table.columns
+            select = db.select(columns.order_id, columns.weight, columns.region, columns.delivery_hours,
+                               columns.assign_time, columns.complete_time) \
+                .where(columns.courier_id == courier_id)
+            if status == 'active':
+                select = select.where(columns.complete == False)
+            elif status == 'completed':
+                select = select.where(columns.complete == True)
+            if after is not None:
+                after_time, after_id = after
+                if after_time is None:
+                    select = select.where(columns.complete_time == None, columns.order_id > after_id)
+                else:
+                    select = select.where(db.or_(columns.complete_time > after_time,
+                                                 db.and_(columns.complete_time == after_time,
+                                                         columns.order_id > after_id),
+                                                 columns.complete_time == None))
+            selects.append(select)
+        orders = db.union_all(*selects).subquery()
+        query = db.select(orders) \
+            .order_by(orders.columns.complete_time == None, orders.columns.complete_time, orders.columns.order_id) \
+            .limit(limit + 1)
         with self.engine.connect() as con:
-            query = self.table.update() \
-                .where(self.table.columns.order_id.in_(orders)) \
-                .values(courier_id=None, assign_time=None,
-                        assigned_type_coef=0)
-            con.execute(query)
+            rows = [dict(row, delivery_hours=row['delivery_hours'].split(',') if row['delivery_hours'] else [])
+                    for row in con.execute(query)]
+        return self.split_page(rows, limit)
+
+    @staticmethod
+    def split_page(rows: tp.List[dict], limit: int):
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, (rows[-1]['complete_time'], rows[-1]['order_id'])
 
-    def assign_courier(self, courier_id: int, courier_type: str, orders: tp.List[int]):
+    def release_orders(self, con: db.engine.Connection, courier: dict):
         """
-        Назначает курьера на заказы
+        Снимает с курьера невыполненные заказы, которые он не может доставить с профилем courier:
+        не проходят по весу, региону или ни один интервал доставки не пересекается с рабочими часами.
+        Выполненные заказы не трогаются. Освободившиеся заказы попадают в ленту. Возвращает число снятых заказов
         """
-        assign_time = datetime.now(timezone.utc).astimezone()
+        released = self.release(con, courier)
+        self.publish(con, {region: min_weight for region, min_weight, count in released})
+        return sum(count for region, min_weight, count in released)
 
+    def release(self, con: db.engine.Connection, courier: dict):
+        """
+        Снимает заказы, как release_orders, в транзакции con.
+        Возвращает по каждому региону снятых заказов (регион, минимальный вес, число заказов)
+        """
+        hours = self.hours_table.columns
+        # То же пересечение интервалов, что и в overlaps
+        fits_hours = db.select(hours.order_id) \
+            .where(hours.order_id == self.table.columns.order_id,
+                   db.or_(db.false(), *(db.or_(db.and_(hours.start_minute <= start, start < hours.end_minute),
+                                               db.and_(start <= hours.start_minute, hours.start_minute < end))
+                                        for start, end in courier['hours'])))
+        conditions = [self.table.columns.courier_id == courier['courier_id'],
+                      self.table.columns.complete == False,
+                      db.or_(self.table.columns.weight > courier['capacity'],
+                             self.table.columns.region.not_in(courier['regions']),
+                             ~fits_hours.exists())]
+        select = db.select(self.table.columns.region, db.func.min(self.table.columns.weight), db.func.count()) \
+            .where(*conditions) \
+            .group_by(self.table.columns.region)
+        released = con.execute(select).fetchall()
+        if released:
+            con.execute(self.table.update().where(*conditions)
+                        .values(courier_id=None, assign_time=None, assigned_type_coef=0))
+        return released
+
+    def publish(self, con: db.engine.Connection, regions: tp.Dict[int, float]):
+        """
+        Записывает в ленту события о свободных заказах: регион -> минимальный вес, в транзакции con
+        """
+        if regions and self.publishes_events:
+            con.execute(db.insert(self.events_table),
+                        [{'region': region, 'min_weight': weight} for region, weight in regions.items()])
+
+    def order_events(self, after_seq: int, limit: tp.Optional[int] = None):
+        """
+        События ленты после after_seq: список (seq, регион, минимальный вес) по возрастанию seq,
+        не больше limit (по умолчанию events_keep)
+        """
+        columns = self.events_table.columns
+        with self.engine.connect() as con:
+            return con.execute(db.select(columns.seq, columns.region, columns.min_weight)
+                               .where(columns.seq > after_seq)
+                               .order_by(columns.seq)
+                               .limit(limit or self.events_keep)).fetchall()
+
+    def last_event_seq(self):
         with self.engine.connect() as con:
+            return con.execute(db.select(db.func.max(self.events_table.columns.seq))).scalar() or 0
+
+    def prune_events(self, keep: tp.Optional[int] = None):
+        """
+        Удаляет из ленты все события, кроме последних keep (по умолчанию events_keep)
+        """
+        keep = keep or self.events_keep
+        with self.engine.begin() as con:
+            last_seq = con.execute(db.select(db.func.max(self.events_table.columns.seq))).scalar() or 0
+            return con.execute(self.events_table.delete()
+                               .where(self.events_table.columns.seq <= last_seq - keep)).rowcount
+
+    def claim_orders(self, con: db.engine.Connection, courier_id: int, courier_type: str,
+                     orders: tp.List[int], assign_time: datetime):
+        """
+        Назначает курьера на заказы из списка, которые все еще свободны.
+        Заказы, которые между выборкой и назначением успел забрать другой курьер, пропускаются.
+        Возвращает список реально назначенных заказов
+        """
+        claimed = []
+        for chunk in chunks(orders, self.chunk_size):
             query = self.table.update() \
-                .where(self.table.columns.order_id.in_(orders)) \
+                .where(self.table.columns.order_id.in_(chunk),
+                       self.table.columns.courier_id == None,
+                       self.table.columns.complete == False) \
                 .values(courier_id=courier_id,
                         assign_time=assign_time,
                         assigned_type_coef=coefficient_dict[courier_type])
-            con.execute(query)
+            if not con.execute(query).rowcount:
+                continue
+            # Внутри транзакции видны только наши изменения: строки с нашим курьером и временем назначения
+            select = db.select(self.table.columns.order_id) \
+                .where(self.table.columns.order_id.in_(chunk),
+                       self.table.columns.courier_id == courier_id,
+                       self.table.columns.assign_time == assign_time) \
+                .order_by(self.table.columns.order_id)
+            claimed.extend(row[0] for row in con.execute(select))
+        return claimed
 
-        return assign_time.isoformat()
+    def assign_courier(self, courier_id: int, courier_type: str, orders: tp.List[int],
+                       assign_time: tp.Optional[datetime] = None):
+        """
+        Назначает курьера на заказы. Возвращает список реально назначенных заказов и время назначения
+        """
+        if assign_time is None:
+            assign_time = datetime.now(timezone.utc).astimezone()
+        with self.engine.begin() as con:
+            claimed = self.claim_orders(con, courier_id, courier_type, orders, assign_time)
+        return claimed, assign_time.isoformat()
 
-    def orders_for_courier(self, courier: dict):
+    def candidate_conditions(self, regions: tp.List[int], max_weight: float):
         """
-        Находит заказы, подходящие для курьера по весу, региону и времени доставки
+        Условия на свободные заказы в регионах курьера, подходящие по весу.
+        Условия на courier_id и complete совпадают с условием индекса ix_orders_unassigned
         """
-        regions = list(map(int, courier['regions'].split(',')))
-        max_weight = weight_dict[courier['courier_type']]
-        hours = courier['working_hours'].split(',')
+        return [self.table.columns.region.in_(regions),
+                self.table.columns.weight <= max_weight,
+                self.table.columns.complete == False,
+                self.table.columns.courier_id == None]
+
+    def select_candidates(self, regions: tp.List[int], max_weight: float, *columns: db.Column):
+        """
+        Запрос интервалов свободных заказов, подходящих курьеру. Дополнительные колонки заказа идут после order_id
+        """
+        return db.select(self.table.columns.order_id,
+                         *columns,
+                         self.hours_table.columns.start_minute,
+                         self.hours_table.columns.end_minute) \
+            .select_from(self.table.join(self.hours_table,
+                                         self.hours_table.columns.order_id == self.table.columns.order_id)) \
+            .where(*self.candidate_conditions(regions, max_weight)) \
+            .order_by(self.table.columns.order_id)
 
-        select = self.table.select().where(
-            self.table.columns.region.in_(regions),
-            self.table.columns.weight <= max_weight,
-            self.table.columns.complete == False,
-            self.table.columns.courier_id == None
-        )
+    def orders_for_courier(self, courier: dict, assign_time: tp.Optional[datetime] = None):
+        """
+        Находит заказы, подходящие для курьера по весу, региону и времени доставки.
+        courier - профиль курьера (см. Courier.to_profile)
+        """
+        select = self.select_candidates(courier['regions'], courier['capacity'])
         with self.engine.connect() as con:
             rel_orders = con.execute(select).fetchall()
         if not rel_orders:
             return [], None
-        matching_orders = match_orders_by_hours(hours, rel_orders)
-        assign_time = self.assign_courier(courier['courier_id'], courier['courier_type'], matching_orders)
-        return matching_orders, assign_time
+        matching_orders = match_orders_by_hours(courier['hours'], rel_orders)
+        return self.assign_courier(courier['courier_id'], courier['courier_type'], matching_orders, assign_time)
+
+    def orders_for_couriers(self, couriers: tp.List[tp.Any], capacity_limit: bool = True):
+        """
+        Распределяет свободные заказы между несколькими курьерами (профилями) за один проход по выборке
+        с учетом грузоподъемности каждого и назначает их одной транзакцией.
+        capacity_limit=False - каждому курьеру как при отдельном назначении (см. distribute_orders).
+        Возвращает словарь courier_id -> список назначенных заказов и время назначения
+        """
+        if not couriers:
+            return dict(), None
+        regions = {region for courier in couriers for region in courier['regions']}
+        max_weight = max(courier['capacity'] for courier in couriers)
+
+        select = self.select_candidates(list(regions), max_weight,
+                                        self.table.columns.region, self.table.columns.weight)
+        with self.engine.connect() as con:
+            rel_orders = con.execute(select).fetchall()
+        distribution = distribute_orders(couriers, rel_orders, capacity_limit)
+
+        assign_time = datetime.now(timezone.utc).astimezone()
+        assigned = dict()
+        with self.engine.begin() as con:
+            for courier in couriers:
+                assigned[courier['courier_id']] = self.claim_orders(con, courier['courier_id'], courier['courier_type'],
+                                                                    distribution[courier['courier_id']], assign_time)
+        return assigned, assign_time.isoformat()
 
     def validate_assignment(self, order_id: int, courier_id: int):
         """
         Валидирует выполнение заказа: был ли заказ назначен на нужного курьера
         """
         with self.engine.connect() as con:
-            resp = con.execute(self.table.select() \
-                               .where(self.table.columns.order_id == order_id)).fetchone()
-        if resp['courier_id'] != courier_id:
+            resp = self.fetch_orders(con, [order_id]).get(order_id)
+        if resp is None or resp['courier_id'] != courier_id:
             raise AssertionError
 
     def complete_order(self, order_id: int, complete_time: datetime):
@@ -178,75 +521,319 @@ class Order:
         Фиксирует выполнение заказа в базу
         """
         complete_time = iso8601.parse_date(complete_time)
+        with self.engine.begin() as con:
+            order = self.fetch_orders(con, [order_id])[order_id]
+            self.write_completions(con, [(order, complete_time)])
+        self.archive_if_needed(1)
+
+    def complete_orders(self, data: tp.List[dict]):
+        """
+        Отмечает выполненными сразу несколько заказов: назначение проверяется одним запросом,
+        выполнение записывается одним UPDATE. Возвращает список причин отказа в порядке элементов
+        (None, если заказ отмечен выполненным)
+        """
+        errors = [None] * len(data)
+        complete_times = dict()
+        for i, elem in enumerate(data):
+            # Айди - целые числа: иначе (список, объект) они не годятся в ключи словаря заказов
+            if not validate_completion(elem):
+                errors[i] = 'Missing data'
+                continue
+            complete_times[i] = iso8601.parse_date(elem['complete_time'])
+
+        order_ids = [data[i]['order_id'] for i in complete_times]
+        with self.engine.begin() as con:
+            orders = self.fetch_orders(con, order_ids)
+            completions = dict()
+            for i, complete_time in complete_times.items():
+                order = orders.get(data[i]['order_id'])
+                if order is None or order['courier_id'] != data[i]['courier_id']:
+                    errors[i] = 'Courier was not assigned'
+                elif order['order_id'] in completions:
+                    errors[i] = 'Duplicate order'
+                else:
+                    completions[order['order_id']] = (order, complete_time)
+            self.write_completions(con, list(completions.values()))
+        self.archive_if_needed(len(completions))
+        return errors
+
+    def fetch_orders(self, con: db.engine.Connection, order_ids: tp.List[int]):
+        """
+        Строки заказов из списка, которые есть в базе: словарь order_id -> строка.
+        Чего нет в orders, ищется в архиве
+        """
+        orders = dict()
+        for table in (self.table, self.archive_table):
+            missing_ids = [order_id for order_id in order_ids if order_id not in orders]
+            for chunk in chunks(missing_ids, self.chunk_size):
+                select = table.select().where(table.columns.order_id.in_(chunk))
+                orders.update((order['order_id'], order) for order in con.execute(select))
+        return orders
+
+    def write_completions(self, con: db.engine.Connection, completions: tp.List[tp.Tuple[tp.Any, datetime]]):
+        """
+        Записывает выполнение заказов (строка заказа до изменения, время выполнения) и обновляет агрегаты курьеров
+        """
+        self.mark_complete(con, completions)
+        self.update_stats(con, completions)
+
+    def mark_complete(self, con: db.engine.Connection, completions: tp.List[tp.Tuple[tp.Any, datetime]]):
+        """
+        Отмечает заказы выполненными, агрегаты не трогает. Повторное выполнение архивного заказа пишется в архив
+        """
+        for chunk in chunks(completions, self.chunk_size):
+            complete_times = {order['order_id']: complete_time for order, complete_time in chunk}
+            for table in (self.table, self.archive_table):
+                updated = con.execute(table.update()
+                                      .where(table.columns.order_id.in_(list(complete_times)))
+                                      .values(complete=True,
+                                              complete_time=db.case(complete_times, value=table.columns.order_id)))
+                if updated.rowcount == len(complete_times):
+                    break
+
+    def update_stats(self, con: db.engine.Connection, completions: tp.List[tp.Tuple[tp.Any, datetime]]):
+        """
+        Учитывает выполненные заказы в агрегатах курьеров.
+        Повторное выполнение или выполнение не позже последнего учтенного меняет порядок заказов,
+        тогда агрегаты курьера пересчитываются целиком
+        """
+        courier_ids = list({order['courier_id'] for order, complete_time in completions})
+        current = dict()
+        last_complete_times = dict()
+        for chunk in chunks(courier_ids, self.chunk_size):
+            select = self.stats_table.select().where(self.stats_table.columns.courier_id.in_(chunk))
+            for row in con.execute(select):
+                current[(row['courier_id'], row['region'])] = dict(row)
+                last_complete_times[row['courier_id']] = max(row['last_complete_time'],
+                                                             last_complete_times.get(row['courier_id'],
+                                                                                     row['last_complete_time']))
+
+        rebuild = set()
+        changed = set()
+        # В базе время хранится без часового пояса, сравниваем в том же виде
+        for order, complete_time in sorted(((order, complete_time.replace(tzinfo=None))
+                                            for order, complete_time in completions),
+                                           key=lambda x: (x[1], x[0]['order_id'])):
+            courier_id = order['courier_id']
+            last_complete_time = last_complete_times.get(courier_id)
+            if courier_id in rebuild:
+                continue
+            if order['complete'] or (last_complete_time is not None and complete_time <= last_complete_time):
+                rebuild.add(courier_id)
+                continue
+
+            delivery_time = complete_time - order['assign_time']
+            if last_complete_time is not None:
+                delivery_time = min(delivery_time, complete_time - last_complete_time)
+            key = (courier_id, order['region'])
+            row = current.setdefault(key, {'courier_id': courier_id, 'region': order['region'], 'earnings': 0,
+                                           'completed': 0, 'min_delivery_time': delivery_time.total_seconds()})
+            row['earnings'] += order['assigned_type_coef'] * 500
+            row['completed'] += 1
+            row['min_delivery_time'] = min(row['min_delivery_time'], delivery_time.total_seconds())
+            row['last_complete_time'] = complete_time
+            last_complete_times[courier_id] = complete_time
+            changed.add(key)
+
+        changed = [key for key in changed if key[0] not in rebuild]
+        stats = self.stats_table.columns
+        for courier_id, region in changed:
+            con.execute(self.stats_table.delete().where(stats.courier_id == courier_id, stats.region == region))
+        if changed:
+            con.execute(self.stats_table.insert(), [current[key] for key in changed])
+        if rebuild:
+            self.rebuild_stats(list(rebuild), con=con)
+
+    def expected_stats(self, con: db.engine.Connection, courier_ids: tp.Optional[tp.List[int]] = None):
+        """
+        Считает агрегаты заново по таблице orders. Возвращает словарь (courier_id, region) -> строка courier_stats
+        """
+        expected = dict()
+        for courier_id, orders in itertools.groupby(self.completed_orders(con, courier_ids),
+                                                    key=lambda x: x['courier_id']):
+            for region, stats in aggregate_orders(list(orders)).items():
+                expected[(courier_id, region)] = dict(stats, courier_id=courier_id, region=region,
+                                                      min_delivery_time=stats['min_delivery_time'].total_seconds())
+        return expected
+
+    def completed_orders(self, con: db.engine.Connection, courier_ids: tp.Optional[tp.List[int]] = None):
+        """
+        Выполненные заказы выбранных курьеров (или всех), упорядоченные по курьеру и айди заказа.
+        Читаются и горячая таблица, и архив
+        """
+        selects = []
+        for table in (self.table, self.archive_table):
+            select = table.select().where(table.columns.courier_id != None, table.columns.complete == True)
+            if courier_ids is not None:
+                select = select.where(table.columns.courier_id.in_(courier_ids))
+            selects.append(select)
+        orders = db.union_all(*selects).subquery()
+        return con.execute(db.select(orders).order_by(orders.columns.courier_id, orders.columns.order_id))
+
+    def rebuild_stats(self, courier_ids: tp.Optional[tp.List[int]] = None, con: db.engine.Connection = None):
+        """
+        Пересчитывает агрегаты выбранных курьеров (или всех) по таблице orders
+        """
+        if con is None:
+            with self.engine.begin() as con:
+                return self.rebuild_stats(courier_ids, con=con)
+        delete = self.stats_table.delete()
+        if courier_ids is not None:
+            delete = delete.where(self.stats_table.columns.courier_id.in_(courier_ids))
+        con.execute(delete)
+        rows = list(self.expected_stats(con, courier_ids).values())
+        if rows:
+            con.execute(self.stats_table.insert(), rows)
+
+    def verify_stats(self):
+        """
+        Сверяет агрегаты с таблицей orders. Возвращает айди курьеров, у которых они расходятся
+        """
+        with self.engine.connect() as con:
+            expected = self.expected_stats(con)
+            actual = {(row['courier_id'], row['region']): dict(row)
+                      for row in con.execute(self.stats_table.select())}
+        mismatched = set()
+        for key in expected.keys() | actual.keys():
+            exp, act = expected.get(key), actual.get(key)
+            if exp is None or act is None \
+                    or exp['earnings'] != act['earnings'] \
+                    or exp['completed'] != act['completed'] \
+                    or exp['last_complete_time'] != act['last_complete_time'] \
+                    or abs(exp['min_delivery_time'] - act['min_delivery_time']) > 1e-6:
+                mismatched.add(key[0])
+        return sorted(mismatched)
+
+    def get_courier_stats(self, courier_id: int):
+        """
+        Возвращает агрегаты курьера по регионам
+        """
+        with self.engine.connect() as con:
+            select = self.stats_table.select() \
+                .where(self.stats_table.columns.courier_id == courier_id)
+            data = con.execute(select).fetchall()
+        return data
+
+    def count_completed(self):
+        """
+        Сколько выполненных заказов еще лежит в горячей таблице
+        """
         with self.engine.connect() as con:
-            con.execute(self.table.update()
-                        .where(self.table.columns.order_id == order_id) \
-                        .values(complete=True, complete_time=complete_time))
+            select = db.select(db.func.count()).select_from(self.table) \
+                .where(self.table.columns.courier_id != None, self.table.columns.complete == True)
+            return con.execute(select).scalar()
+
+    def archive_completed(self):
+        """
+        Переносит выполненные заказы из orders в архив (их интервалы доставки больше не нужны и удаляются).
+        Порциями по chunk_size, одной транзакцией. Возвращает число перенесенных заказов
+        """
+        with self.engine.begin() as con:
+            select = db.select(self.table.columns.order_id) \
+                .where(self.table.columns.courier_id != None, self.table.columns.complete == True)
+            order_ids = [row[0] for row in con.execute(select)]
+            for chunk in chunks(order_ids, self.chunk_size):
+                con.execute(db.insert(self.archive_table)
+                            .from_select(list(self.table.columns.keys()),
+                                         db.select(self.table).where(self.table.columns.order_id.in_(chunk))))
+                con.execute(self.hours_table.delete().where(self.hours_table.columns.order_id.in_(chunk)))
+                con.execute(self.table.delete().where(self.table.columns.order_id.in_(chunk)))
+        return len(order_ids)
+
+    def archive_if_needed(self, completed: int):
+        """
+        Вызывается после выполнения заказов. Раз в archive_check_every выполнений в процессе проверяет,
+        не накопилось ли в orders archive_threshold выполненных заказов, и если да, переносит их в архив
+        """
+        if not self.archive_threshold:
+            return
+        self.completed_since_check += completed
+        if self.completed_since_check < self.archive_check_every:
+            return
+        self.completed_since_check = 0
+        if self.count_completed() >= self.archive_threshold:
+            self.archive_completed()
 
     def get_existing_ids(self, order_ids: tp.List[int]):
         """
-        Возвращает заказы из заданного списка, которые уже есть в базе
+        Возвращает заказы из заданного списка, которые уже есть в базе (в том числе в архиве)
         """
+        existing_ids = []
         with self.engine.connect() as con:
-            select = db.select(self.table.columns.courier_id) \
-                .where(self.table.columns.order_id.in_(order_ids))
-            existing_ids = con.execute(select).fetchall()
+            for chunk in chunks(order_ids, self.chunk_size):
+                select = db.union_all(*(db.select(table.columns.order_id).where(table.columns.order_id.in_(chunk))
+                                        for table in (self.table, self.archive_table)))
+                existing_ids.extend(con.execute(select).fetchall())
         return [el[0] for el in existing_ids]
 
 
 class Courier:
-    def __init__(self, engine: Engine, table: db.Table):
+    def __init__(self, engine: Engine, table: db.Table, cache_size: int = COURIER_CACHE_SIZE,
+                 chunk_size: int = SQL_CHUNK_SIZE):
         self.engine = engine
         self.table = table
+        self.chunk_size = chunk_size
         self.id_col = 'courier_id'
+        self.validate = validate_courier
+        self.validate_update = validate_courier_update
         self.valid_cols = ['courier_id', 'courier_type', 'regions', 'working_hours']
+        # Профили курьеров: courier_id -> профиль, актуальность проверяется по колонке version
+        self.cache = LRUCache(cache_size)
 
-    def insert_row(self, data: dict):
+    @staticmethod
+    def to_row(data: dict):
         """
-        Добавляет строку в таблицу (с данными из аргумента)
+        Приводит входной элемент к виду строки таблицы
         """
-        with self.engine.connect() as con:
-            id = data[self.id_col]
-            query = db.insert(self.table).values(courier_id=data['courier_id'],
-                                                 courier_type=data['courier_type'],
-                                                 regions=",".join(map(str, data['regions'])),
-                                                 working_hours=",".join(data['working_hours']))
-            con.execute(query)
-        return id
+        return {'courier_id': data['courier_id'],
+                'courier_type': data['courier_type'],
+                'regions': ",".join(map(str, data['regions'])),
+                'working_hours': ",".join(data['working_hours'])}
 
     @staticmethod
-    def validate_data(data: dict):
+    def to_profile(row: tp.Any):
+        """
+        Профиль курьера из строки таблицы: списки регионов и интервалов уже разобраны, посчитана грузоподъемность
+        """
+        regions = list(map(int, row['regions'].split(','))) if row['regions'] else []
+        working_hours = row['working_hours'].split(',') if row['working_hours'] else []
+        return {'courier_id': row['courier_id'],
+                'courier_type': row['courier_type'],
+                'regions': regions,
+                'working_hours': working_hours,
+                'hours': parse_hours(working_hours),
+                'capacity': weight_dict[row['courier_type']],
+                'version': row['version']}
+
+    def profile_data(self, profile: dict):
         """
-        Валидация входных данных
+        Данные курьера для ответа API
         """
-        if not isinstance(data['courier_id'], int):
-            raise ValueError
-        if not is_valid_type(data['courier_type']):
-            raise ValueError
-        for region in data['regions']:
-            if not isinstance(region, int):
-                raise ValueError
-        for w_hour in data['working_hours']:
-            if not re.match('(0[0-9]|1[0-9]|2[0-3]):[0-5][0-9]-(0[0-9]|1[0-9]|2[0-3]):[0-5][0-9]', w_hour):
-                raise ValueError
+        return {key: profile[key] for key in self.valid_cols}
+
+    def insert_rows(self, data: tp.List[dict]):
+        """
+        Добавляет строки в таблицу одной транзакцией. Если хоть одна строка не записалась, откатывается все
+        """
+        with self.engine.begin() as con:
+            con.execute(db.insert(self.table), [self.to_row(elem) for elem in data])
+        for elem in data:
+            self.cache.invalidate(elem[self.id_col])
+        return [elem[self.id_col] for elem in data]
 
     def add(self, data: dict):
         """
         Валидирует список курьеров и добавляет их в базу. Возвращает список добавленных айди и флаг успеха
         В случае невалидных данных возвращает список невалидных айди, база не обновляется
         """
-        exceptions = []
-        for elem in data:
-            try:
-                validate_keys(self.valid_cols, elem)
-                self.validate_data(elem)
-            except (KeyError, ValueError):
-                exceptions.append(elem['courier_id'])
-        if exceptions:
-            return exceptions, False
-        ids = []
-        for elem in data:
-            ids.append(self.insert_row(elem))
+        invalid = find_invalid(data, self.validate, self.id_col)
+        if invalid:
+            return [data[i][self.id_col] for i in invalid], False
+        try:
+            ids = self.insert_rows(data)
+        except db.exc.IntegrityError:
+            # Транзакция уже откатилась, в базе ничего не поменялось
+            return self.get_existing_ids([elem[self.id_col] for elem in data]), False
         return ids, True
 
     def get_by_id(self, courier_id: int):
@@ -259,32 +846,85 @@ class Courier:
             data = con.execute(select).fetchone()
         return data
 
+    def get_by_ids(self, courier_ids: tp.List[int]):
+        """
+        Возвращает данные о курьерах из списка, которые есть в базе
+        """
+        data = []
+        with self.engine.connect() as con:
+            for chunk in chunks(courier_ids, self.chunk_size):
+                select = db.select(self.table) \
+                    .where(self.table.columns.courier_id.in_(chunk))
+                data.extend(con.execute(select).fetchall())
+        return data
+
+    def get_profile(self, courier_id: int):
+        """
+        Возвращает профиль курьера (None, если курьера нет). Профиль берется из кэша,
+        если его версия совпадает с версией в базе, иначе перечитывается
+        """
+        profiles = self.get_profiles([courier_id])
+        return profiles[0] if profiles else None
+
+    def get_profiles(self, courier_ids: tp.List[int]):
+        """
+        Возвращает профили курьеров из списка, которые есть в базе, в порядке списка
+        """
+        versions = dict()
+        with self.engine.connect() as con:
+            for chunk in chunks(courier_ids, self.chunk_size):
+                select = db.select(self.table.columns.courier_id, self.table.columns.version) \
+                    .where(self.table.columns.courier_id.in_(chunk))
+                versions.update(con.execute(select).fetchall())
+        profiles = dict()
+        for courier_id, version in versions.items():
+            profile = self.cache.get(courier_id)
+            if profile is not None and profile['version'] == version:
+                profiles[courier_id] = profile
+        stale_ids = [courier_id for courier_id in versions if courier_id not in profiles]
+        for row in self.get_by_ids(stale_ids):
+            profile = profiles[row['courier_id']] = self.to_profile(row)
+            self.cache.put(row['courier_id'], profile)
+        return [profiles[courier_id] for courier_id in courier_ids if courier_id in profiles]
+
     def get_existing_ids(self, courier_ids: tp.List[int]):
         """
         Возвращает айдишники из списка, которые уже есть в базе
         """
+        existing_ids = []
         with self.engine.connect() as con:
-            select = db.select(self.table.columns.courier_id) \
-                .where(self.table.columns.courier_id.in_(courier_ids))
-            existing_ids = con.execute(select).fetchall()
+            for chunk in chunks(courier_ids, self.chunk_size):
+                select = db.select(self.table.columns.courier_id) \
+                    .where(self.table.columns.courier_id.in_(chunk))
+                existing_ids.extend(con.execute(select).fetchall())
         return [el[0] for el in existing_ids]
 
-    def update_data(self, courier_id: int, data: dict):
+    def update_data(self, courier_id: int, data: dict,
+                    on_update: tp.Optional[tp.Callable[[db.engine.Connection, dict], tp.Any]] = None):
         """
-        Обновить информацию о курьере
+        Обновить информацию о курьере. Возвращает обновленный профиль или None, если данные невалидны.
+        Если курьера нет, бросает KeyError.
+        Запись идет только при совпадении версии с прочитанной, обновленный профиль сразу кладется в кэш.
+        on_update(con, profile) вызывается с новым профилем в той же транзакции, что и запись курьера
         """
-        try:
-            validate_keys(self.valid_cols, data, raise_missing=False)
-        except ValueError:
+        if not self.validate_update(data):
             return None
-        with self.engine.connect() as conn:
-            # Update data
-            upd = db.update(self.table) \
-                .where(self.table.columns.courier_id == courier_id) \
-                .values(**data)
-            conn.execute(upd)
-
-        # Return updated data
-        updated_data = self.get_by_id(courier_id)
-        return dict(zip(self.valid_cols,
-                        list(updated_data)))
+        while True:
+            profile = self.get_profile(courier_id)
+            if profile is None:
+                raise KeyError(courier_id)
+            row = dict(self.to_row(dict(self.profile_data(profile), **data)), version=profile['version'] + 1)
+            with self.engine.begin() as conn:
+                upd = db.update(self.table) \
+                    .where(self.table.columns.courier_id == courier_id,
+                           self.table.columns.version == profile['version']) \
+                    .values(**row)
+                if conn.execute(upd).rowcount:
+                    updated_profile = self.to_profile(row)
+                    if on_update is not None:
+                        on_update(conn, updated_profile)
+                    break
+            # Курьера успели изменить в другом воркере, перечитываем
+
+        self.cache.put(courier_id, updated_profile)
+        return updated_profile
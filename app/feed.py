@@ -0,0 +1,124 @@
+"""
+Лента свободных заказов для курьеров (GET /couriers/<id>/feed, long-poll): вместо того чтобы раз за разом
+назначать себе заказы, курьер ждет ответа ленты, и она отвечает, когда в одном из его регионов появились
+свободные заказы, которые он может поднять по весу. После этого курьер делает POST /orders/assign.
+
+События пишутся в базу вместе с заказами (таблица order_events, см. Order.publish), поэтому их видят все
+воркеры. В каждом процессе один поток читает новые события, пока есть ожидающие курьеры, и будит их:
+на все ожидания процесса - один запрос к базе раз в poll_interval, а запись из этого же процесса будит
+поток сразу.
+
+Ожидающий курьер занимает поток воркера, поэтому ожиданий в процессе не больше max_waiters: остальным -
+Overloaded (429 с Retry-After), чтобы потоков хватало на остальные запросы
+"""
+import os
+import threading
+import time
+import typing as tp
+from collections import deque
+
+from flask import Flask
+
+from app.admission import Overloaded
+
+
+class OrderFeed:
+    """
+    Курсор ленты - seq последнего события, которое видел курьер. Ответ - новый курсор и регионы курьера,
+    в которых с тех пор появились подходящие заказы (пустой список, если за timeout ничего не появилось)
+    """
+    def __init__(self, poll_interval: float, buffer_size: int, max_waiters: int, retry_after: int):
+        self.poll_interval = poll_interval
+        self.max_waiters = max_waiters
+        self.retry_after = retry_after
+        self.events = deque(maxlen=buffer_size)
+        self.last_seq = None
+        # Все события после base_seq есть в буфере
+        self.base_seq = None
+        self.condition = threading.Condition()
+        self.wakeup = threading.Event()
+        self.waiters = 0
+        self.pid = None
+        self.polls = 0
+        self.rejected = 0
+
+    def init_app(self, app: Flask):
+        app.extensions['order_feed'] = self
+
+    def start(self, orders: tp.Any):
+        if self.pid != os.getpid():
+            with self.condition:
+                if self.pid != os.getpid():
+                    self.events.clear()
+                    self.last_seq = self.base_seq = orders.last_event_seq()
+                    thread = threading.Thread(target=self.run, args=(orders,), name='order-feed', daemon=True)
+                    thread.start()
+                    self.pid = os.getpid()
+
+    def wake(self):
+        """
+        Новые события записаны этим процессом: прочитать их, не дожидаясь poll_interval
+        """
+        if self.pid == os.getpid():
+            self.wakeup.set()
+
+    def run(self, orders: tp.Any):
+        while True:
+            # Без ожидающих курьеров база не читается: поток спит до записи или нового ожидания
+            self.wakeup.wait(self.poll_interval if self.waiters else None)
+            self.wakeup.clear()
+            self.poll(orders)
+
+    def poll(self, orders: tp.Any):
+        events = orders.order_events(self.last_seq)
+        with self.condition:
+            self.polls += 1
+            if not events:
+                return
+            previous_seq = self.last_seq
+            self.events.extend(events)
+            self.last_seq = events[-1][0]
+            if len(self.events) == self.events.maxlen:
+                self.base_seq = self.events[0][0] - 1
+            self.condition.notify_all()
+        # Старые события никому не нужны: раз в buffer_size новых событий таблица ленты обрезается
+        if previous_seq // self.events.maxlen != self.last_seq // self.events.maxlen:
+            orders.prune_events(self.events.maxlen)
+
+    def matching_regions(self, courier: dict, cursor: int):
+        regions = set(courier['regions'])
+        if cursor < self.base_seq:
+            # Курсор старше событий в буфере: что-то могло потеряться, пусть курьер проверит все регионы
+            return sorted(regions)
+        return sorted({region for seq, region, min_weight in self.events
+                       if seq > cursor and region in regions and min_weight <= courier['capacity']})
+
+    def wait(self, orders: tp.Any, courier: dict, cursor: tp.Optional[int], timeout: float):
+        """
+        Ждет не дольше timeout секунд событий после cursor в регионах курьера. Возвращает (курсор, регионы).
+        Без курсора ждет событий после текущего момента. Если ожидающих уже max_waiters, бросает Overloaded
+        """
+        self.start(orders)
+        deadline = time.monotonic() + timeout
+        if cursor is None:
+            # Последнее прочитанное потоком ленты событие может отставать от базы: другие воркеры пишут свои
+            cursor = orders.last_event_seq()
+        with self.condition:
+            if timeout > 0 and self.waiters >= self.max_waiters:
+                self.rejected += 1
+                raise Overloaded
+            self.waiters += 1
+            self.wakeup.set()
+            try:
+                while True:
+                    regions = self.matching_regions(courier, cursor)
+                    remaining = deadline - time.monotonic()
+                    if regions or remaining <= 0:
+                        return max(cursor, self.last_seq), regions
+                    self.condition.wait(remaining)
+            finally:
+                self.waiters -= 1
+
+    def stats(self):
+        return {'waiters': self.waiters, 'max_waiters': self.max_waiters, 'polls': self.polls,
+                'rejected': self.rejected, 'last_seq': self.last_seq}
@@ -0,0 +1,76 @@
+"""
+Идемпотентные POST-запросы: клиент передает заголовок Idempotency-Key, ответ запоминается, и повтор с тем же
+ключом (например, после таймаута) получает сохраненный ответ, не проходя валидацию и не обращаясь к базе.
+
+Ответы хранятся в памяти процесса (LRUCache с ttl), у каждого воркера gunicorn свои: повтор, попавший в другой
+воркер, обрабатывается заново, как без ключа
+"""
+import functools
+import hashlib
+import typing as tp
+
+from flask import Flask, Response, current_app, request
+
+from app.cache import LRUCache
+from app.json_backend import jsonify
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Отметка запроса, который еще выполняется
+PENDING = object()
+
+
+class Idempotency:
+    """
+    Кэш ответов по (эндпоинт, ключ). Вместе с ответом хранится хэш тела запроса: тот же ключ с другим телом -
+    ошибка клиента, а не повтор
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.cache = LRUCache(maxsize, ttl)
+
+    def init_app(self, app: Flask):
+        app.extensions['idempotency'] = self
+
+    def handle(self, key: str, view: tp.Callable, *args, **kwargs):
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'validation_error': {
+                'reason': f'{HEADER} is longer than {MAX_KEY_LENGTH}'
+            }}), 400
+        cache_key = (request.endpoint, key)
+        fingerprint = hashlib.sha256(request.get_data()).digest()
+        # Проверка и отметка - одна операция: запись не может устареть или вытесниться между ними
+        stored, added = self.cache.get_or_add(cache_key, PENDING)
+        if not added:
+            if stored is PENDING:
+                return jsonify({'reason': f'Request with this {HEADER} is in progress'}), 409
+            stored_fingerprint, status, body, mimetype = stored
+            if stored_fingerprint != fingerprint:
+                return jsonify({'reason': f'{HEADER} was used with a different request'}), 422
+            response = Response(body, status=status, mimetype=mimetype)
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except BaseException:
+            self.cache.invalidate(cache_key)
+            raise
+        # Ошибку сервера повтор может не повторить, такие ответы не сохраняются
+        if response.status_code >= 500 or response.is_streamed:
+            self.cache.invalidate(cache_key)
+        else:
+            self.cache.put(cache_key, (fingerprint, response.status_code, response.get_data(), response.mimetype))
+        return response
+
+
+def idempotent(view: tp.Callable):
+    """
+    Декоратор обработчика: запросы с заголовком Idempotency-Key выполняются один раз на ключ
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        return current_app.extensions['idempotency'].handle(key, view, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,83 @@
+"""
+Разбор запросов и сериализация ответов в JSON через orjson, если он установлен, иначе через стандартный json.
+Вывод совпадает с flask.jsonify с настройками по умолчанию: компактные разделители, ключи отсортированы,
+не-ASCII символы экранированы, в конце перевод строки.
+Все, что orjson не умеет или делает иначе (не-ASCII строки, целые больше 64 бит, NaN на входе),
+переделывается стандартным json, поэтому результат от выбора бэкенда не зависит.
+Единственное отличие - запись float вне [1e-4, 1e16): orjson пишет 0.00001 и 1e16 вместо 1e-05 и 1e+16,
+таких чисел API не отдает
+"""
+import json
+import typing as tp
+
+from flask import Request as FlaskRequest, current_app
+
+from config import JSON_BACKEND
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if JSON_BACKEND == 'orjson' and orjson is None:
+    raise ImportError('JSON_BACKEND=orjson, but orjson is not installed')
+USE_ORJSON = orjson is not None and JSON_BACKEND in ('auto', 'orjson')
+
+
+def dumps_stdlib(data: tp.Any):
+    return (json.dumps(data, separators=(',', ':'), sort_keys=True) + '\n').encode()
+
+
+def loads_stdlib(data: tp.Union[bytes, str]):
+    return json.loads(data)
+
+
+if USE_ORJSON:
+    ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE
+
+    def dumps(data: tp.Any):
+        try:
+            result = orjson.dumps(data, option=ORJSON_OPTIONS)
+        except TypeError:
+            return dumps_stdlib(data)
+        return result if result.isascii() else dumps_stdlib(data)
+
+    def loads(data: tp.Union[bytes, str]):
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            # Стандартный json принимает NaN, Infinity и целые любой длины, остальное он отвергнет сам
+            return loads_stdlib(data)
+else:
+    dumps = dumps_stdlib
+    loads = loads_stdlib
+
+
+def jsonify(data: tp.Any):
+    """
+    Замена flask.jsonify: ответ с телом dumps(data)
+    """
+    return current_app.response_class(dumps(data), mimetype=current_app.config['JSONIFY_MIMETYPE'])
+
+
+class Request(FlaskRequest):
+    """
+    Запрос, у которого request.json и get_json разбирают тело через loads
+    """
+    def get_json(self, force: bool = False, silent: bool = False, cache: bool = True):
+        if cache and self._cached_json[silent] is not Ellipsis:
+            return self._cached_json[silent]
+        if not (force or self.is_json):
+            return None
+        data = self.get_data(cache=cache)
+        try:
+            result = loads(data)
+        except ValueError as e:
+            if silent:
+                if cache:
+                    self._cached_json = (self._cached_json[0], None)
+                return None
+            return self.on_json_loading_failed(e)
+        if cache:
+            self._cached_json = (result, result)
+        return result
@@ -0,0 +1,540 @@
+"""
+Хранилище в памяти процесса (STORAGE_BACKEND = 'memory') - альтернатива Order и Courier из app/data.py
+с тем же интерфейсом. Свободные заказы проиндексированы по региону и весовому классу, назначение не ходит в SQL.
+
+Каждая транзакция (набор изменений, который должен примениться целиком) сначала дописывается одной строкой
+в журнал <data_dir>/wal.ndjson, потом применяется в памяти. Раз в snapshot_every транзакций состояние
+целиком сохраняется в <data_dir>/snapshot.json, а журнал обнуляется. При старте загружается снимок
+и проигрываются транзакции журнала после него; недописанная последняя строка (падение посреди записи) отбрасывается.
+
+Состояние живет в одном процессе: запускать с одним воркером gunicorn (можно с потоками, --threads).
+Второй процесс на том же каталоге не стартует
+"""
+import bisect
+import fcntl
+import heapq
+import itertools
+import os
+import threading
+import time
+import typing as tp
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import iso8601
+
+from app.json_backend import dumps, loads
+from app.utils import *
+from app.validation import validate_order, validate_courier, validate_courier_update, validate_completion, \
+    find_invalid
+from config import *
+
+# Верхние границы весовых классов: совпадают с грузоподъемностями курьеров
+WEIGHT_CLASSES = sorted(set(weight_dict.values()))
+
+
+def weight_class(weight: float):
+    return min(bisect.bisect_left(WEIGHT_CLASSES, weight), len(WEIGHT_CLASSES) - 1)
+
+
+def parse_time(value: tp.Optional[str]):
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+def format_time(value: tp.Optional[datetime]):
+    return value.isoformat() if value is not None else None
+
+
+class Transaction:
+    """
+    Изменения одной транзакции: список операций (имя, аргументы)
+    """
+    def __init__(self):
+        self.ops = []
+
+    def add(self, op: str, **args):
+        self.ops.append(dict(args, op=op))
+
+
+class MemoryStore:
+    """
+    Состояние и журнал. Все чтения и изменения идут под одной блокировкой.
+    Время назначения и выполнения хранится без часового пояса, как и в SQLite
+    """
+    def __init__(self, data_dir: str, fsync: bool = True, snapshot_every: int = 10000,
+                 events_keep: int = FEED_EVENTS_KEEP):
+        self.data_dir = data_dir
+        self.fsync = fsync
+        self.snapshot_every = snapshot_every
+        self.lock = threading.RLock()
+        # order_id -> заказ
+        self.orders = dict()
+        # Свободные заказы: регион -> [по весовому классу: order_id -> заказ]
+        self.unassigned = dict()
+        # courier_id -> {order_id -> заказ}, все назначенные курьеру заказы
+        self.courier_orders = dict()
+        # courier_id -> профиль (как Courier.to_profile)
+        self.couriers = dict()
+        # courier_id -> строки агрегатов, считаются при первом запросе после изменения
+        self.stats = dict()
+        self.seq = 0
+        self.snapshot_seq = 0
+        # Лента свободных заказов: (seq, регион, минимальный вес). В журнал не пишется, после перезапуска
+        # нумерация продолжается от текущего времени, чтобы курсоры клиентов не оказались впереди
+        self.events = deque(maxlen=events_keep)
+        self.event_seq = time.time_ns() // 1000
+
+        os.makedirs(data_dir, exist_ok=True)
+        self.lock_file = open(os.path.join(data_dir, 'lock'), 'w')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            raise RuntimeError(f'{data_dir} is used by another process, '
+                               f'the memory storage backend needs a single worker process')
+        self.snapshot_path = os.path.join(data_dir, 'snapshot.json')
+        self.log_path = os.path.join(data_dir, 'wal.ndjson')
+        self.recover()
+        self.log = open(self.log_path, 'ab')
+
+    # Восстановление и снимки
+
+    def recover(self):
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                snapshot = loads(f.read())
+            self.seq = self.snapshot_seq = snapshot['seq']
+            for data in snapshot['couriers']:
+                self.put_courier(data['courier_id'], data, data['version'])
+            for data in snapshot['orders']:
+                self.put_order(data)
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'rb+') as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = loads(line)
+                except ValueError:
+                    break
+                if record['seq'] > self.seq:
+                    self.apply(record)
+                offset += len(line)
+            f.truncate(offset)
+
+    def write_snapshot(self):
+        couriers = [dict(courier_id=profile['courier_id'], courier_type=profile['courier_type'],
+                         regions=profile['regions'], working_hours=profile['working_hours'],
+                         version=profile['version'])
+                    for profile in self.couriers.values()]
+        orders = [{key: format_time(value) if isinstance(value, datetime) else value
+                   for key, value in order.items() if key != 'hours'}
+                  for order in self.orders.values()]
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(dumps({'seq': self.seq, 'couriers': couriers, 'orders': orders}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        # Журнал до снимка больше не нужен. Если упасть до обнуления, его записи отсеются по seq
+        self.log.close()
+        self.log = open(self.log_path, 'wb')
+        self.snapshot_seq = self.seq
+
+    @contextmanager
+    def transaction(self):
+        """
+        Собирает операции транзакции, по выходу из блока пишет их в журнал одной строкой и применяет.
+        Если в блоке случилось исключение, ничего не пишется
+        """
+        with self.lock:
+            txn = Transaction()
+            yield txn
+            if not txn.ops:
+                return
+            record = {'seq': self.seq + 1, 'ops': txn.ops}
+            self.log.write(dumps(record))
+            self.log.flush()
+            if self.fsync:
+                os.fsync(self.log.fileno())
+            self.apply(record)
+            if self.seq - self.snapshot_seq >= self.snapshot_every:
+                self.write_snapshot()
+
+    def close(self):
+        with self.lock:
+            self.log.close()
+            self.lock_file.close()
+
+    # Применение операций, одинаковое для новых транзакций и проигрывания журнала
+
+    def apply(self, record: dict):
+        for op in record['ops']:
+            getattr(self, 'apply_' + op['op'])(op)
+        self.seq = record['seq']
+
+    def put_order(self, data: dict):
+        order = {'order_id': data['order_id'],
+                 'weight': data['weight'],
+                 'region': data['region'],
+                 'delivery_hours': data['delivery_hours'],
+                 'hours': parse_hours(data['delivery_hours']),
+                 'courier_id': data.get('courier_id'),
+                 'assign_time': parse_time(data.get('assign_time')),
+                 'complete': data.get('complete', False),
+                 'complete_time': parse_time(data.get('complete_time')),
+                 'assigned_type_coef': data.get('assigned_type_coef', 0)}
+        self.orders[order['order_id']] = order
+        if order['courier_id'] is None:
+            self.index_order(order)
+        else:
+            self.courier_orders.setdefault(order['courier_id'], dict())[order['order_id']] = order
+            self.stats.pop(order['courier_id'], None)
+
+    def index_order(self, order: dict):
+        classes = self.unassigned.get(order['region'])
+        if classes is None:
+            classes = self.unassigned[order['region']] = [dict() for _ in WEIGHT_CLASSES]
+        classes[weight_class(order['weight'])][order['order_id']] = order
+
+    def unindex_order(self, order: dict):
+        del self.unassigned[order['region']][weight_class(order['weight'])][order['order_id']]
+
+    def put_courier(self, courier_id: int, data: dict, version: int):
+        profile = {'courier_id': courier_id,
+                   'courier_type': data['courier_type'],
+                   'regions': data['regions'],
+                   'working_hours': data['working_hours'],
+                   'hours': parse_hours(data['working_hours']),
+                   'capacity': weight_dict[data['courier_type']],
+                   'version': version}
+        self.couriers[courier_id] = profile
+        return profile
+
+    def apply_add_orders(self, op: dict):
+        for data in op['data']:
+            self.put_order(data)
+        self.publish(min_weights(data for data in op['data'] if data.get('courier_id') is None))
+
+    def apply_add_couriers(self, op: dict):
+        for data in op['data']:
+            self.put_courier(data['courier_id'], data, 0)
+
+    def apply_update_courier(self, op: dict):
+        profile = self.couriers[op['courier_id']]
+        self.put_courier(op['courier_id'], dict(profile, **op['data']), profile['version'] + 1)
+
+    def apply_assign(self, op: dict):
+        courier_id = op['courier_id']
+        assign_time = parse_time(op['assign_time'])
+        courier_orders = self.courier_orders.setdefault(courier_id, dict())
+        for order_id in op['order_ids']:
+            order = self.orders[order_id]
+            self.unindex_order(order)
+            order['courier_id'] = courier_id
+            order['assign_time'] = assign_time
+            order['assigned_type_coef'] = coefficient_dict[op['courier_type']]
+            courier_orders[order_id] = order
+
+    def apply_release(self, op: dict):
+        courier_orders = self.courier_orders[op['courier_id']]
+        released = []
+        for order_id in op['order_ids']:
+            order = courier_orders.pop(order_id)
+            order['courier_id'] = None
+            order['assign_time'] = None
+            order['assigned_type_coef'] = 0
+            self.index_order(order)
+            released.append(order)
+        self.publish(min_weights(released))
+
+    def publish(self, regions: tp.Dict[int, float]):
+        for region, weight in regions.items():
+            self.event_seq += 1
+            self.events.append((self.event_seq, region, weight))
+
+    def apply_complete(self, op: dict):
+        for order_id, complete_time in op['completions']:
+            order = self.orders[order_id]
+            order['complete'] = True
+            order['complete_time'] = parse_time(complete_time)
+            self.stats.pop(order['courier_id'], None)
+
+    # Чтения
+
+    def candidates(self, regions: tp.Iterable[int], max_weight: float):
+        """
+        Свободные заказы в регионах, подходящие по весу
+        """
+        last_class = weight_class(max_weight)
+        for region in set(regions):
+            classes = self.unassigned.get(region)
+            if classes is None:
+                continue
+            for orders in classes[:last_class + 1]:
+                for order in orders.values():
+                    if order['weight'] <= max_weight:
+                        yield order
+
+    def courier_stats(self, courier_id: int):
+        stats = self.stats.get(courier_id)
+        if stats is None:
+            completed = sorted((order for order in self.courier_orders.get(courier_id, dict()).values()
+                                if order['complete']),
+                               key=lambda x: x['order_id'])
+            stats = self.stats[courier_id] = [
+                dict(row, courier_id=courier_id, region=region,
+                     min_delivery_time=row['min_delivery_time'].total_seconds())
+                for region, row in aggregate_orders(completed).items()]
+        return stats
+
+
+class MemoryOrder:
+    """
+    Заказы в MemoryStore, интерфейс как у app.data.Order
+    """
+    def __init__(self, store: MemoryStore):
+        self.store = store
+        self.id_col = 'order_id'
+        self.validate = validate_order
+        self.valid_cols = ['order_id', 'weight', 'region', 'delivery_hours']
+
+    def get_existing_ids(self, order_ids: tp.List[int]):
+        with self.store.lock:
+            return [order_id for order_id in order_ids if order_id in self.store.orders]
+
+    def insert(self, txn: Transaction, data: tp.List[dict]):
+        txn.add('add_orders', data=[{key: elem[key] for key in self.valid_cols} for elem in data])
+        return [elem[self.id_col] for elem in data]
+
+    def add(self, data: tp.List[dict]):
+        invalid = find_invalid(data, self.validate, self.id_col)
+        if invalid:
+            return [data[i][self.id_col] for i in invalid], False
+        with self.store.transaction() as txn:
+            existing_ids = self.get_existing_ids([elem[self.id_col] for elem in data])
+            if existing_ids:
+                return existing_ids, False
+            return self.insert(txn, data), True
+
+    def add_valid(self, data: tp.List[dict]):
+        invalid = set(find_invalid(data, self.validate, self.id_col))
+        rejected = [data[i][self.id_col] for i in sorted(invalid)]
+        with self.store.transaction() as txn:
+            valid = [elem for i, elem in enumerate(data)
+                     if i not in invalid and elem[self.id_col] not in self.store.orders]
+            rejected.extend(elem[self.id_col] for i, elem in enumerate(data)
+                            if i not in invalid and elem[self.id_col] in self.store.orders)
+            if not valid:
+                return [], rejected
+            return self.insert(txn, valid), rejected
+
+    def get_courier_orders(self, courier_id: int, completed: bool = False):
+        with self.store.lock:
+            orders = sorted(self.store.courier_orders.get(courier_id, dict()).values(), key=lambda x: x['order_id'])
+            return [dict(order) for order in orders if order['complete'] or not completed]
+
+    @staticmethod
+    def history_key(order: dict):
+        return order['complete_time'] is None, order['complete_time'] or datetime.min, order['order_id']
+
+    def history_page(self, courier_id: int, status: str, limit: int,
+                     after: tp.Optional[tp.Tuple[tp.Optional[datetime], int]] = None):
+        """
+        Страница заказов курьера в порядке history_key, как Order.history_page
+        """
+        after_key = self.history_key({'complete_time': after[0], 'order_id': after[1]}) if after is not None else None
+        with self.store.lock:
+            orders = [order for order in self.store.courier_orders.get(courier_id, dict()).values()
+                      if (status == 'all' or order['complete'] == (status == 'completed'))
+                      and (after_key is None or self.history_key(order) > after_key)]
+            page = [{key: order[key] for key in ('order_id', 'weight', 'region', 'delivery_hours',
+                                                 'assign_time', 'complete_time')}
+                    for order in heapq.nsmallest(limit + 1, orders, key=self.history_key)]
+        if len(page) <= limit:
+            return page, None
+        return page[:limit], (page[limit - 1]['complete_time'], page[limit - 1]['order_id'])
+
+    def release_orders(self, txn: Transaction, courier: dict):
+        """
+        Снимает с курьера невыполненные заказы, которые он не может доставить с профилем courier
+        """
+        regions = set(courier['regions'])
+        released = [order_id for order_id, order in self.store.courier_orders.get(courier['courier_id'], dict()).items()
+                    if not order['complete']
+                    and (order['weight'] > courier['capacity'] or order['region'] not in regions
+                         or not check_intervals(courier['hours'], order['hours']))]
+        if released:
+            txn.add('release', courier_id=courier['courier_id'], order_ids=released)
+        return len(released)
+
+    @staticmethod
+    def assign_time():
+        # В SQLite время назначения хранится без часового пояса, в локальном времени
+        assign_time = datetime.now(timezone.utc).astimezone()
+        return assign_time, format_time(assign_time.replace(tzinfo=None))
+
+    def orders_for_courier(self, courier: dict):
+        with self.store.transaction() as txn:
+            matching_orders = sorted(order['order_id']
+                                     for order in self.store.candidates(courier['regions'], courier['capacity'])
+                                     if check_intervals(courier['hours'], order['hours']))
+            if not matching_orders:
+                return [], None
+            assign_time, stored_time = self.assign_time()
+            txn.add('assign', courier_id=courier['courier_id'], courier_type=courier['courier_type'],
+                    order_ids=matching_orders, assign_time=stored_time)
+        return matching_orders, assign_time.isoformat()
+
+    def orders_for_couriers(self, couriers: tp.List[tp.Any], capacity_limit: bool = True):
+        if not couriers:
+            return dict(), None
+        regions = {region for courier in couriers for region in courier['regions']}
+        max_weight = max(courier['capacity'] for courier in couriers)
+        with self.store.transaction() as txn:
+            rel_orders = sorted((order['order_id'], order['region'], order['weight'], start, end)
+                                for order in self.store.candidates(regions, max_weight)
+                                for start, end in order['hours'])
+            distribution = distribute_orders(couriers, rel_orders, capacity_limit)
+            assign_time, stored_time = self.assign_time()
+            for courier in couriers:
+                if distribution[courier['courier_id']]:
+                    txn.add('assign', courier_id=courier['courier_id'], courier_type=courier['courier_type'],
+                            order_ids=distribution[courier['courier_id']], assign_time=stored_time)
+        return distribution, assign_time.isoformat()
+
+    def order_events(self, after_seq: int, limit: tp.Optional[int] = None):
+        with self.store.lock:
+            return list(itertools.islice((event for event in self.store.events if event[0] > after_seq),
+                                         limit or self.store.events.maxlen))
+
+    def last_event_seq(self):
+        with self.store.lock:
+            return self.store.event_seq
+
+    def prune_events(self, keep: tp.Optional[int] = None):
+        return 0
+
+    def validate_assignment(self, order_id: int, courier_id: int):
+        with self.store.lock:
+            order = self.store.orders.get(order_id)
+            if order is None or order['courier_id'] != courier_id:
+                raise AssertionError
+
+    def complete_order(self, order_id: int, complete_time: str):
+        complete_time = iso8601.parse_date(complete_time)
+        with self.store.transaction() as txn:
+            txn.add('complete', completions=[(order_id, format_time(complete_time.replace(tzinfo=None)))])
+
+    def complete_orders(self, data: tp.List[dict]):
+        errors = [None] * len(data)
+        complete_times = dict()
+        for i, elem in enumerate(data):
+            # Айди - целые числа: иначе (список, объект) они не годятся в ключи словаря заказов
+            if not validate_completion(elem):
+                errors[i] = 'Missing data'
+                continue
+            complete_times[i] = iso8601.parse_date(elem['complete_time'])
+
+        with self.store.transaction() as txn:
+            completions = dict()
+            for i, complete_time in complete_times.items():
+                order = self.store.orders.get(data[i]['order_id'])
+                if order is None or order['courier_id'] != data[i]['courier_id']:
+                    errors[i] = 'Courier was not assigned'
+                elif order['order_id'] in completions:
+                    errors[i] = 'Duplicate order'
+                else:
+                    completions[order['order_id']] = format_time(complete_time.replace(tzinfo=None))
+            if completions:
+                txn.add('complete', completions=list(completions.items()))
+        return errors
+
+    def get_courier_stats(self, courier_id: int):
+        with self.store.lock:
+            return self.store.courier_stats(courier_id)
+
+    def rebuild_stats(self, courier_ids: tp.Optional[tp.List[int]] = None, con: tp.Any = None):
+        with self.store.lock:
+            if courier_ids is None:
+                self.store.stats.clear()
+            for courier_id in courier_ids or []:
+                self.store.stats.pop(courier_id, None)
+
+    def archive_completed(self):
+        # Выполненные заказы не лежат в индексе свободных и на назначение не влияют, переносить их некуда
+        return 0
+
+    def verify_stats(self):
+        # Агрегаты всегда считаются по заказам в памяти, расходиться им не с чем
+        return []
+
+
+class MemoryCourier:
+    """
+    Курьеры в MemoryStore, интерфейс как у app.data.Courier. Кэша профилей нет: все профили и так в памяти
+    """
+    cache = None
+
+    def __init__(self, store: MemoryStore):
+        self.store = store
+        self.id_col = 'courier_id'
+        self.validate = validate_courier
+        self.validate_update = validate_courier_update
+        self.valid_cols = ['courier_id', 'courier_type', 'regions', 'working_hours']
+
+    def profile_data(self, profile: dict):
+        return {key: profile[key] for key in self.valid_cols}
+
+    def get_existing_ids(self, courier_ids: tp.List[int]):
+        with self.store.lock:
+            return [courier_id for courier_id in courier_ids if courier_id in self.store.couriers]
+
+    def add(self, data: tp.List[dict]):
+        invalid = find_invalid(data, self.validate, self.id_col)
+        if invalid:
+            return [data[i][self.id_col] for i in invalid], False
+        with self.store.transaction() as txn:
+            existing_ids = self.get_existing_ids([elem[self.id_col] for elem in data])
+            if existing_ids:
+                return existing_ids, False
+            txn.add('add_couriers', data=[{key: elem[key] for key in self.valid_cols} for elem in data])
+        return [elem[self.id_col] for elem in data], True
+
+    def get_profile(self, courier_id: int):
+        with self.store.lock:
+            return self.store.couriers.get(courier_id)
+
+    def get_profiles(self, courier_ids: tp.List[int]):
+        with self.store.lock:
+            return [self.store.couriers[courier_id] for courier_id in courier_ids if courier_id in self.store.couriers]
+
+    def update_data(self, courier_id: int, data: dict,
+                    on_update: tp.Optional[tp.Callable[[Transaction, dict], tp.Any]] = None):
+        """
+        Обновить информацию о курьере. Возвращает обновленный профиль или None, если данные невалидны.
+        Если курьера нет, бросает KeyError. on_update(txn, profile) добавляет свои изменения в ту же транзакцию
+        """
+        if not self.validate_update(data):
+            return None
+        with self.store.transaction() as txn:
+            profile = self.store.couriers.get(courier_id)
+            if profile is None:
+                raise KeyError(courier_id)
+            txn.add('update_courier', courier_id=courier_id, data=data)
+            if on_update is not None:
+                updated = dict(profile, **data)
+                on_update(txn, dict(updated, hours=parse_hours(updated['working_hours']),
+                                    capacity=weight_dict[updated['courier_type']], version=profile['version'] + 1))
+        return self.store.couriers[courier_id]
+
+
+def init_memory(data_dir: str, fsync: bool = True, snapshot_every: int = 10000,
+                events_keep: int = FEED_EVENTS_KEEP):
+    """
+    Открывает (или восстанавливает) хранилище в памяти. Возвращает (Courier, Order)-совместимые объекты
+    """
+    store = MemoryStore(data_dir, fsync=fsync, snapshot_every=snapshot_every, events_keep=events_keep)
+    return MemoryCourier(store), MemoryOrder(store)
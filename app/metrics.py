@@ -0,0 +1,153 @@
+"""
+Метрики запросов: число запросов, гистограмма времени ответа, число SQL-запросов и время в них по каждому эндпоинту.
+Счетчики живут в памяти процесса (у каждого воркера gunicorn свои) и отдаются в текстовом формате Prometheus
+"""
+import contextlib
+import threading
+import time
+import typing as tp
+
+import sqlalchemy as db
+from flask import Flask, g, has_request_context, request
+
+
+class EndpointMetrics:
+    def __init__(self, buckets: tp.Sequence[float]):
+        self.requests = 0
+        self.bucket_counts = [0] * len(buckets)
+        self.duration = 0.0
+        self.statements = 0
+        self.sql_duration = 0.0
+
+
+class SqlCounter:
+    """
+    SQL-запросы, выполненные за запрос к API в другом потоке (например, пачкой в очереди назначений)
+    """
+    def __init__(self):
+        self.statements = 0
+        self.duration = 0.0
+
+
+# Счетчики, которым засчитываются SQL-запросы текущего потока вне запроса к API
+local = threading.local()
+
+
+@contextlib.contextmanager
+def count_sql(counters: tp.List[SqlCounter]):
+    """
+    SQL-запросы текущего потока внутри блока засчитываются каждому из counters
+    """
+    local.counters = counters
+    try:
+        yield
+    finally:
+        local.counters = None
+
+
+def add_sql(counter: SqlCounter):
+    """
+    Добавляет SQL-запросы из другого потока к метрикам текущего запроса к API
+    """
+    if has_request_context() and 'metrics_start' in g:
+        g.metrics_statements += counter.statements
+        g.metrics_sql_duration += counter.duration
+
+
+class Metrics:
+    """
+    Собирает метрики запросов Flask-приложения и SQL-запросов через события Engine.
+    SQL-запросы вне запроса к API (например, из CLI-команд) не учитываются, если их не засчитали
+    запросу через count_sql и add_sql
+    """
+    def __init__(self, buckets: tp.Sequence[float]):
+        self.buckets = sorted(buckets)
+        self.endpoints = dict()
+        self.lock = threading.Lock()
+
+    def init_app(self, app: Flask):
+        app.extensions['metrics'] = self
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def watch_engine(self, engine: db.engine.Engine):
+        db.event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+        db.event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+
+    @staticmethod
+    def start_request():
+        g.metrics_start = time.perf_counter()
+        g.metrics_statements = 0
+        g.metrics_sql_duration = 0.0
+
+    def finish_request(self, response):
+        if 'metrics_start' not in g:
+            return response
+        duration = time.perf_counter() - g.metrics_start
+        labels = (request.method, request.url_rule.rule if request.url_rule is not None else '')
+        with self.lock:
+            metrics = self.endpoints.get(labels)
+            if metrics is None:
+                metrics = self.endpoints[labels] = EndpointMetrics(self.buckets)
+            metrics.requests += 1
+            metrics.duration += duration
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    metrics.bucket_counts[i] += 1
+            metrics.statements += g.metrics_statements
+            metrics.sql_duration += g.metrics_sql_duration
+        return response
+
+    @staticmethod
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if getattr(local, 'counters', None) or has_request_context() and 'metrics_start' in g:
+            context.metrics_start = time.perf_counter()
+
+    @staticmethod
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, 'metrics_start', None)
+        if start is None:
+            return
+        duration = time.perf_counter() - start
+        # executemany считается одним запросом: это один проход до базы
+        counters = getattr(local, 'counters', None)
+        if counters:
+            for counter in counters:
+                counter.statements += 1
+                counter.duration += duration
+        else:
+            g.metrics_statements += 1
+            g.metrics_sql_duration += duration
+
+    def render(self):
+        """
+        Метрики в текстовом формате Prometheus
+        """
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            lines = ['# HELP http_requests_total Number of handled requests.',
+                     '# TYPE http_requests_total counter']
+            for (method, endpoint), metrics in endpoints:
+                lines.append(f'http_requests_total{{method="{method}",endpoint="{endpoint}"}} {metrics.requests}')
+
+            lines += ['# HELP http_request_duration_seconds Request latency.',
+                      '# TYPE http_request_duration_seconds histogram']
+            for (method, endpoint), metrics in endpoints:
+                labels = f'method="{method}",endpoint="{endpoint}"'
+                for bound, count in zip(self.buckets, metrics.bucket_counts):
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {metrics.requests}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {metrics.duration}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {metrics.requests}')
+
+            lines += ['# HELP sql_statements_total Number of SQL statements issued while handling requests.',
+                      '# TYPE sql_statements_total counter']
+            for (method, endpoint), metrics in endpoints:
+                lines.append(f'sql_statements_total{{method="{method}",endpoint="{endpoint}"}} {metrics.statements}')
+
+            lines += ['# HELP sql_duration_seconds_total Time spent in SQL statements while handling requests.',
+                      '# TYPE sql_duration_seconds_total counter']
+            for (method, endpoint), metrics in endpoints:
+                lines.append(f'sql_duration_seconds_total{{method="{method}",endpoint="{endpoint}"}} '
+                             f'{metrics.sql_duration}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,149 @@
+"""
+Профилирование запросов в проде. Два независимых режима:
+- доля sample_rate случайных запросов целиком профилируется cProfile, профиль пишется в <dir>/*.prof
+  (смотреть через pstats или snakeviz);
+- если задан slow_seconds, фоновый поток раз в interval снимает стеки потоков, которые обслуживают запросы,
+  и для запросов дольше порога пишет собранные стеки в <dir>/*.stacks в формате collapsed stacks
+  (по строке "f1;f2;f3 число_срабатываний", подходит для flamegraph.pl и speedscope). Если запрос ждет работу
+  другого потока (пачку в очереди назначений), стеки этого потока тоже попадают в его профиль, см. working_for.
+Если оба режима выключены, хуки в приложение не ставятся вовсе
+"""
+import contextlib
+import cProfile
+import os
+import random
+import re
+import sys
+import threading
+import time
+import typing as tp
+import uuid
+from collections import Counter
+
+from flask import Flask, g, request
+
+UNSAFE_CHARS = re.compile('[^A-Za-z0-9_.-]')
+
+# Потоки, которые сейчас работают за потоки запросов: айди потока -> айди потоков запросов
+delegated = dict()
+delegated_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def working_for(thread_ids: tp.List[int]):
+    """
+    Стеки текущего потока внутри блока засчитываются запросам, которые обслуживают потоки thread_ids
+    """
+    thread_id = threading.get_ident()
+    with delegated_lock:
+        delegated[thread_id] = thread_ids
+    try:
+        yield
+    finally:
+        with delegated_lock:
+            del delegated[thread_id]
+
+
+class StackSampler:
+    """
+    Фоновый поток, который снимает стеки зарегистрированных потоков
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = dict()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+                self.thread.start()
+
+    def watch(self, thread_id: int):
+        with self.lock:
+            self.samples[thread_id] = Counter()
+
+    def release(self, thread_id: int):
+        with self.lock:
+            return self.samples.pop(thread_id, Counter())
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with delegated_lock:
+                delegations = list(delegated.items())
+            with self.lock:
+                for thread_id, counter in self.samples.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        counter[self.collapse(frame)] += 1
+                for worker_id, thread_ids in delegations:
+                    frame = frames.get(worker_id)
+                    counters = [self.samples[i] for i in thread_ids if i in self.samples]
+                    if frame is not None and counters:
+                        stack = self.collapse(frame)
+                        for counter in counters:
+                            counter[stack] += 1
+
+    @staticmethod
+    def collapse(frame: tp.Any):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+
+class Profiler:
+    def __init__(self, sample_rate: float = 0, slow_seconds: float = 0, dump_dir: str = 'profiles',
+                 interval: float = 0.005):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.dump_dir = dump_dir
+        self.sampler = StackSampler(interval) if slow_seconds > 0 else None
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0 or self.sampler is not None
+
+    def init_app(self, app: Flask):
+        if not self.enabled:
+            return
+        os.makedirs(self.dump_dir, exist_ok=True)
+        app.before_request(self.start_request)
+        app.teardown_request(self.finish_request)
+
+    def start_request(self):
+        g.profile_start = time.perf_counter()
+        g.profile = None
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            g.profile = cProfile.Profile()
+            g.profile.enable()
+        elif self.sampler is not None:
+            self.sampler.start()
+            self.sampler.watch(threading.get_ident())
+
+    def finish_request(self, exc: tp.Optional[BaseException] = None):
+        if 'profile_start' not in g:
+            return
+        duration = time.perf_counter() - g.profile_start
+        if g.profile is not None:
+            g.profile.disable()
+            g.profile.dump_stats(self.dump_path('prof'))
+        elif self.sampler is not None:
+            samples = self.sampler.release(threading.get_ident())
+            if duration >= self.slow_seconds:
+                with open(self.dump_path('stacks'), 'w') as f:
+                    for stack, count in samples.most_common():
+                        f.write(f'{stack} {count}\n')
+
+    def dump_path(self, extension: str):
+        """
+        Имя файла профиля: время, эндпоинт и айди запроса (из заголовка X-Request-Id или случайный)
+        """
+        request_id = request.headers.get('X-Request-Id') or uuid.uuid4().hex
+        name = f'{int(time.time() * 1000)}-{request.endpoint or "unmatched"}-{request_id}'
+        return os.path.join(self.dump_dir, f'{UNSAFE_CHARS.sub("_", name)[:200]}.{extension}')
@@ -1,15 +1,17 @@
-from flask import request, jsonify
+from flask import Blueprint, current_app, request, Response
 
-from app import app
-from app.data import init_db, Courier, Order
+from app.admission import Overloaded
+from app.idempotency import idempotent
+from app.json_backend import jsonify
+from app.storage import Couriers, Orders
 from app.utils import *
+from app.validation import validate_completion
 
-engine, orders, couriers = init_db()
-Couriers = Courier(engine, couriers)
-Orders = Order(engine, orders)
+api = Blueprint('api', __name__)
 
 
-@app.route('/couriers', methods=['POST'])
+@api.route('/couriers', methods=['POST'])
+@idempotent
 def post_couriers():
     """
     Принимает json с данными о курьерах и заносит в базу
@@ -40,7 +42,7 @@ def post_couriers():
         }}), 400
 
 
-@app.route('/couriers/<int:courier_id>', methods=['PATCH'])
+@api.route('/couriers/<int:courier_id>', methods=['PATCH'])
 def patch_couriers(courier_id: int):
     """
     Меняет информацию о курьере и освобождает заказы, которые он не сможет доставить при новых условиях
@@ -49,18 +51,20 @@ def patch_couriers(courier_id: int):
         return jsonify({'validation_error': {
             'reason': 'No data given'
         }}), 400
-    data = Couriers.update_data(courier_id, request.json)
-    if data is None:
+    try:
+        profile = Couriers.update_data(courier_id, request.json, on_update=Orders.release_orders)
+    except KeyError:
+        return jsonify({'reason': 'Courier not found'}), 404
+    if profile is None:
         return jsonify({'validation_error': {
             'reason': 'wrong columns given'
         }}), 400
-    active_orders = Orders.get_courier_orders(courier_id)
-    removed_orders = recalculate_orders(request.json, active_orders)
-    Orders.cancel_orders(removed_orders)
-    return jsonify(data), 200
+    current_app.extensions['order_feed'].wake()
+    return jsonify(Couriers.profile_data(profile)), 200
 
 
-@app.route('/orders', methods=['POST'])
+@api.route('/orders', methods=['POST'])
+@idempotent
 def post_orders():
     """
     Принимает json с данными о заказах и заносит в базу
@@ -86,6 +90,7 @@ def post_orders():
         ids, success = Orders.add(request.json['data'])
 
     if success:
+        current_app.extensions['order_feed'].wake()
         return jsonify({"orders": [{"id": i} for i in ids]}), 201
     else:
         return jsonify({"validation_error": {
@@ -93,7 +98,39 @@ def post_orders():
         }}), 400
 
 
-@app.route('/orders/assign', methods=['POST'])
+@api.route('/orders/stream', methods=['POST'])
+def post_orders_stream():
+    """
+    Потоковая загрузка заказов в формате NDJSON (по заказу в строке). Заказы валидируются и записываются
+    порциями по INGEST_CHUNK_SIZE, поэтому память не зависит от размера загрузки.
+    Валидные заказы сохраняются, даже если среди остальных есть невалидные
+    """
+    accepted = 0
+    rejected = 0
+    errors = []
+    for chunk in chunks(iter_ndjson(request.stream), current_app.config['INGEST_CHUNK_SIZE']):
+        data = []
+        for line_number, elem in chunk:
+            if isinstance(elem, dict) and 'order_id' in elem:
+                data.append(elem)
+            else:
+                rejected += 1
+                errors.append({'line': line_number})
+        ids, rejected_ids = Orders.add_valid(data)
+        accepted += len(ids)
+        rejected += len(rejected_ids)
+        errors.extend({'id': i} for i in rejected_ids)
+        del errors[current_app.config['INGEST_MAX_REPORTED_ERRORS']:]
+    if accepted:
+        current_app.extensions['order_feed'].wake()
+    return jsonify({'accepted': accepted,
+                    'rejected': rejected,
+                    'validation_error': {
+                        'orders': errors
+                    }}), 200
+
+
+@api.route('/orders/assign', methods=['POST'])
 def assign_orders():
     """
     Назначает курьеру все подходящие для него заказы
@@ -103,8 +140,21 @@ def assign_orders():
             'reason': 'No data given'
         }}), 400
 
-    courier_data = Couriers.get_by_id(request.json['courier_id'])
-    matching_orders, assign_time = Orders.orders_for_courier(courier_data)
+    courier = Couriers.get_profile(request.json['courier_id'])
+    if courier is None:
+        return jsonify({'validation_error': {
+            'reason': 'Courier not found'
+        }}), 400
+    assign_queue = current_app.extensions['assign_queue']
+    if assign_queue.enabled:
+        try:
+            matching_orders, assign_time = assign_queue.assign(Orders._get_current_object(), courier)
+        except Overloaded:
+            response = jsonify({'reason': 'Too many assignment requests, retry later'})
+            response.headers['Retry-After'] = str(assign_queue.retry_after)
+            return response, 429
+    else:
+        matching_orders, assign_time = Orders.orders_for_courier(courier)
 
     if not matching_orders:
         return jsonify({'orders': []}), 200
@@ -112,7 +162,43 @@ def assign_orders():
                     'assign_time': assign_time}), 200
 
 
-@app.route('/orders/complete', methods=['POST'])
+@api.route('/orders/assign/batch', methods=['POST'])
+def assign_orders_batch():
+    """
+    Назначает заказы сразу нескольким курьерам с учетом грузоподъемности каждого.
+    Курьеры обслуживаются в порядке следования в запросе
+    """
+    if not request.json or 'courier_ids' not in request.json:
+        return jsonify({'validation_error': {
+            'reason': 'No data given'
+        }}), 400
+    courier_ids = request.json['courier_ids']
+    if type(courier_ids) is not list or any(type(i) is not int for i in courier_ids):
+        return jsonify({'validation_error': {
+            'reason': 'courier_ids must be a list of integers'
+        }}), 400
+
+    courier_ids = list(dict.fromkeys(courier_ids))
+    couriers_data = {courier['courier_id']: courier for courier in Couriers.get_profiles(courier_ids)}
+    missing_ids = [i for i in courier_ids if i not in couriers_data]
+    if missing_ids:
+        return jsonify({"validation_error": {
+            "couriers": [{"id": i} for i in missing_ids]
+        }}), 400
+
+    assigned, assign_time = Orders.orders_for_couriers([couriers_data[i] for i in courier_ids])
+    response = []
+    for courier_id in courier_ids:
+        if assigned[courier_id]:
+            response.append({'courier_id': courier_id,
+                             'orders': [{'id': i} for i in assigned[courier_id]],
+                             'assign_time': assign_time})
+        else:
+            response.append({'courier_id': courier_id, 'orders': []})
+    return jsonify({'couriers': response}), 200
+
+
+@api.route('/orders/complete', methods=['POST'])
 def complete_order():
     """
     Отмечает заказ выполненным. Принимает айди курьера, заказа и время выполнения
@@ -121,10 +207,7 @@ def complete_order():
         return jsonify({'validation_error': {
             'reason': 'No data given'
         }}), 400
-    try:
-        validate_keys({'order_id', 'courier_id', 'complete_time'}, request.json,
-                      raise_missing=True, num=3)
-    except (KeyError, ValueError):
+    if not validate_completion(request.json):
         return jsonify({'validation_error': {
             'reason': 'Missing data'
         }}), 400
@@ -139,16 +222,125 @@ def complete_order():
     return jsonify({'order_id': request.json['order_id']}), 200
 
 
-@app.route('/couriers/<int:courier_id>', methods=['GET'])
+@api.route('/orders/complete/batch', methods=['POST'])
+def complete_orders_batch():
+    """
+    Отмечает выполненными сразу несколько заказов. Возвращает результат по каждому элементу
+    """
+    if not request.json or 'data' not in request.json or not isinstance(request.json['data'], list):
+        return jsonify({'validation_error': {
+            'reason': 'No data given'
+        }}), 400
+    data = [elem if isinstance(elem, dict) else {} for elem in request.json['data']]
+    errors = Orders.complete_orders(data)
+    result = []
+    for elem, error in zip(data, errors):
+        if error is None:
+            result.append({'id': elem['order_id'], 'status': 'completed'})
+        else:
+            result.append({'id': elem.get('order_id'), 'validation_error': {
+                'reason': error
+            }})
+    return jsonify({'orders': result}), 200
+
+
+@api.route('/couriers/<int:courier_id>', methods=['GET'])
 def get_courier_info(courier_id: int):
     """
     Возвращает информацию о курьере, считает его заработок и рейтинг
     """
-    data = dict(Couriers.get_by_id(courier_id))
-    completed_orders = Orders.get_courier_orders(courier_id=courier_id, completed=True)
-    if completed_orders:
-        data['earnings'] = calculate_earnings(completed_orders)
-        data['rating'] = calculate_rating(completed_orders)
+    profile = Couriers.get_profile(courier_id)
+    if profile is None:
+        return jsonify({'reason': 'Courier not found'}), 404
+    data = Couriers.profile_data(profile)
+    stats = Orders.get_courier_stats(courier_id)
+    if stats:
+        data['earnings'] = calculate_earnings_from_stats(stats)
+        data['rating'] = calculate_rating_from_stats(stats)
     else:
         data['earnings'] = 0
     return jsonify(data), 200
+
+
+@api.route('/couriers/<int:courier_id>/orders', methods=['GET'])
+def get_courier_orders(courier_id: int):
+    """
+    История заказов курьера постранично: сначала выполненные по времени выполнения, затем текущие.
+    Параметры: status (all, active, completed), limit (не больше ORDER_PAGE_SIZE_MAX), cursor из прошлой страницы
+    """
+    status = request.args.get('status', 'all')
+    try:
+        limit = min(int(request.args.get('limit', current_app.config['ORDER_PAGE_SIZE_DEFAULT'])),
+                    current_app.config['ORDER_PAGE_SIZE_MAX'])
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+        if status not in ('all', 'active', 'completed') or limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'validation_error': {
+            'reason': 'Wrong status, limit or cursor'
+        }}), 400
+    if Couriers.get_profile(courier_id) is None:
+        return jsonify({'reason': 'Courier not found'}), 404
+
+    rows, next_key = Orders.history_page(courier_id, status, limit, after)
+    orders = [{'order_id': row['order_id'],
+               'weight': row['weight'],
+               'region': row['region'],
+               'delivery_hours': row['delivery_hours'],
+               'assign_time': row['assign_time'].isoformat(),
+               'complete_time': row['complete_time'].isoformat() if row['complete_time'] is not None else None}
+              for row in rows]
+    return jsonify({'orders': orders,
+                    'next_cursor': encode_cursor(next_key) if next_key is not None else None}), 200
+
+
+@api.route('/couriers/<int:courier_id>/feed', methods=['GET'])
+def get_courier_feed(courier_id: int):
+    """
+    Лента свободных заказов (long-poll): отвечает, когда в регионах курьера после cursor появились заказы,
+    которые он может взять по весу, или по истечении timeout секунд (не больше FEED_TIMEOUT_MAX).
+    Без cursor ждет новых заказов после момента запроса
+    """
+    try:
+        cursor = request.args.get('cursor')
+        cursor = int(cursor) if cursor is not None else None
+        timeout = min(float(request.args.get('timeout', current_app.config['FEED_TIMEOUT_DEFAULT'])),
+                      current_app.config['FEED_TIMEOUT_MAX'])
+        if timeout < 0 or timeout != timeout:
+            raise ValueError
+    except ValueError:
+        return jsonify({'validation_error': {
+            'reason': 'Wrong cursor or timeout'
+        }}), 400
+    courier = Couriers.get_profile(courier_id)
+    if courier is None:
+        return jsonify({'reason': 'Courier not found'}), 404
+
+    order_feed = current_app.extensions['order_feed']
+    try:
+        cursor, regions = order_feed.wait(Orders._get_current_object(), courier, cursor, timeout)
+    except Overloaded:
+        response = jsonify({'reason': 'Too many couriers are waiting, retry later'})
+        response.headers['Retry-After'] = str(order_feed.retry_after)
+        return response, 429
+    return jsonify({'cursor': cursor, 'regions': regions}), 200
+
+
+@api.route('/stats/cache', methods=['GET'])
+def get_cache_stats():
+    """
+    Счетчики кэша профилей курьеров, кэша идемпотентных ответов, очереди назначений и ленты в этом процессе
+    """
+    return jsonify({'couriers': Couriers.cache.stats() if Couriers.cache is not None else None,
+                    'idempotency': current_app.extensions['idempotency'].cache.stats(),
+                    'assign_queue': current_app.extensions['assign_queue'].stats(),
+                    'order_feed': current_app.extensions['order_feed'].stats()}), 200
+
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Метрики запросов этого процесса в текстовом формате Prometheus
+    """
+    return Response(current_app.extensions['metrics'].render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,239 @@
+"""
+Шардирование заказов по региону (ORDER_SHARDS > 1): заказы и их интервалы лежат в отдельных файлах базы,
+регион region живет в шарде region % ORDER_SHARDS. Курьеры и агрегаты курьеров остаются в основной базе.
+
+Назначение идет только в шарды, которых касаются регионы курьера, запросы к нескольким шардам выполняются
+параллельно. У каждого файла своя блокировка записи, поэтому назначения в разных шардах из разных воркеров
+не ждут друг друга.
+
+Транзакции не переходят границу файла: запись в шарды и обновление агрегатов в основной базе - отдельные
+транзакции. Если между ними процесс упадет, агрегаты чинятся командой rebuild-stats.
+
+Загрузка заказов остается «все или ничего»: айди проверяются во всех шардах до записи, а если запись в один шард
+не прошла, уже записанное в другие удаляется. Этого не видно только одновременной загрузке тех же айди
+из другого процесса в другой шард: уникальность айди между шардами база не проверяет
+"""
+import heapq
+import itertools
+import typing as tp
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import sqlalchemy as db
+from sqlalchemy.engine import Engine
+
+from app.data import init_db, Order
+from app.utils import *
+
+
+class ShardedOrder(Order):
+    """
+    Интерфейс как у Order. Собственные таблицы объекта - основная база (в ней агрегаты курьеров),
+    заказы - в shards
+    """
+    def __init__(self, engine: Engine, table: db.Table, shards: tp.List[Order], **settings):
+        super().__init__(engine, table, **settings)
+        self.shards = shards
+        self.executor = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix='order-shard')
+
+    def shard_index(self, region: int):
+        return region % len(self.shards)
+
+    def group_by_shard(self, items: tp.Iterable[tp.Any], region: tp.Callable[[tp.Any], int]):
+        """
+        Раскладывает элементы по шардам. Возвращает словарь номер шарда -> список элементов
+        """
+        groups = dict()
+        for item in items:
+            groups.setdefault(self.shard_index(region(item)), []).append(item)
+        return groups
+
+    def map_shards(self, func: tp.Callable, groups: tp.Dict[int, tp.Any]):
+        """
+        Выполняет func(шард, аргумент) для каждого шарда из groups, несколько шардов - параллельно.
+        Возвращает словарь номер шарда -> результат
+        """
+        if len(groups) == 1:
+            [(index, arg)] = groups.items()
+            return {index: func(self.shards[index], arg)}
+        futures = {index: self.executor.submit(func, self.shards[index], arg) for index, arg in groups.items()}
+        return {index: future.result() for index, future in futures.items()}
+
+    def all_shards(self):
+        return dict.fromkeys(range(len(self.shards)))
+
+    def insert_rows(self, data: tp.List[dict]):
+        """
+        Пишет заказы в их шарды, каждый шард - своей транзакцией. Если айди уже есть в каком-то шарде
+        или запись в один из шардов не прошла, в шардах ничего не остается и бросается IntegrityError
+        """
+        order_ids = [elem[self.id_col] for elem in data]
+        # Заказ с тем же айди может лежать в шарде другого региона, сам шард этого не заметит
+        existing_ids = self.get_existing_ids(order_ids)
+        if existing_ids:
+            raise db.exc.IntegrityError(f'INSERT INTO {self.table.name}', existing_ids,
+                                        ValueError('order ids already exist'))
+        groups = self.group_by_shard(data, lambda elem: elem['region'])
+        futures = {index: self.executor.submit(self.shards[index].insert_rows, elems)
+                   for index, elems in groups.items()}
+        errors = [future.exception() for future in futures.values()]
+        if any(error is not None for error in errors):
+            for index, future in futures.items():
+                if future.exception() is None:
+                    self.delete_rows(self.shards[index], future.result())
+            raise next(error for error in errors if error is not None)
+        with self.engine.begin() as con:
+            self.publish(con, min_weights(data))
+        return [elem[self.id_col] for elem in data]
+
+    @staticmethod
+    def delete_rows(shard: Order, order_ids: tp.List[int]):
+        """
+        Удаляет из шарда только что записанные заказы, когда загрузка не прошла в другом шарде
+        """
+        with shard.engine.begin() as con:
+            for chunk in chunks(order_ids, shard.chunk_size):
+                con.execute(shard.hours_table.delete().where(shard.hours_table.columns.order_id.in_(chunk)))
+                con.execute(shard.table.delete().where(shard.table.columns.order_id.in_(chunk)))
+
+    def get_existing_ids(self, order_ids: tp.List[int]):
+        existing = set()
+        for ids in self.map_shards(lambda shard, arg: shard.get_existing_ids(order_ids), self.all_shards()).values():
+            existing.update(ids)
+        return [order_id for order_id in order_ids if order_id in existing]
+
+    def get_courier_orders(self, courier_id: int, completed: bool = False):
+        results = self.map_shards(lambda shard, arg: shard.get_courier_orders(courier_id, completed),
+                                  self.all_shards())
+        return sorted((row for rows in results.values() for row in rows), key=lambda x: x['order_id'])
+
+    def history_page(self, courier_id: int, status: str, limit: int,
+                     after: tp.Optional[tp.Tuple[tp.Optional[datetime], int]] = None):
+        """
+        Страницы шардов сливаются в одну в том же порядке
+        """
+        results = self.map_shards(lambda shard, arg: shard.history_page(courier_id, status, limit, after),
+                                  self.all_shards())
+        merged = list(itertools.islice(heapq.merge(*(rows for rows, next_key in results.values()),
+                                                   key=self.history_key),
+                                       limit + 1))
+        rows, next_key = self.split_page(merged, limit)
+        # Шард отдает не больше limit строк: если страница набрана целиком из одного шарда, продолжение знает только он
+        if next_key is None and any(shard_key is not None for _, shard_key in results.values()):
+            next_key = (rows[-1]['complete_time'], rows[-1]['order_id'])
+        return rows, next_key
+
+    def release_orders(self, con: db.engine.Connection, courier: dict):
+        """
+        Снимает заказы во всех шардах, каждый шард - своей транзакцией. Лента пишется в транзакции con
+        """
+        def release(shard, arg):
+            with shard.engine.begin() as shard_con:
+                return shard.release(shard_con, courier)
+        released = [row for rows in self.map_shards(release, self.all_shards()).values() for row in rows]
+        self.publish(con, {region: min_weight for region, min_weight, count in released})
+        return sum(count for region, min_weight, count in released)
+
+    def orders_for_courier(self, courier: dict, assign_time: tp.Optional[datetime] = None):
+        """
+        Назначение в каждом шарде, которого касаются регионы курьера. Время назначения во всех шардах одно
+        """
+        if assign_time is None:
+            assign_time = datetime.now(timezone.utc).astimezone()
+        groups = self.group_by_shard(set(courier['regions']), lambda region: region)
+        results = self.map_shards(lambda shard, regions: shard.orders_for_courier(dict(courier, regions=regions),
+                                                                                  assign_time),
+                                  groups)
+        matching_orders = sorted(order_id for orders, shard_time in results.values() for order_id in orders)
+        if not any(shard_time is not None for orders, shard_time in results.values()):
+            return [], None
+        return matching_orders, assign_time.isoformat()
+
+    def orders_for_couriers(self, couriers: tp.List[tp.Any], capacity_limit: bool = True):
+        """
+        Кандидаты собираются из шардов параллельно, распределяются между курьерами вместе
+        (грузоподъемность общая на все шарды) и назначаются в каждом шарде своей транзакцией
+        """
+        if not couriers:
+            return dict(), None
+        regions = {region for courier in couriers for region in courier['regions']}
+        max_weight = max(courier['capacity'] for courier in couriers)
+
+        def select(shard, shard_regions):
+            query = shard.select_candidates(shard_regions, max_weight, shard.table.columns.region,
+                                            shard.table.columns.weight)
+            with shard.engine.connect() as con:
+                return con.execute(query).fetchall()
+        results = self.map_shards(select, self.group_by_shard(regions, lambda region: region))
+        rel_orders = [row for rows in results.values() for row in rows]
+        order_regions = {row[0]: row[1] for row in rel_orders}
+        distribution = distribute_orders(couriers, rel_orders, capacity_limit)
+
+        assign_time = datetime.now(timezone.utc).astimezone()
+        claims = dict()
+        for courier in couriers:
+            for index, orders in self.group_by_shard(distribution[courier['courier_id']],
+                                                     lambda order_id: order_regions[order_id]).items():
+                claims.setdefault(index, []).append((courier, orders))
+
+        def claim(shard, shard_claims):
+            with shard.engine.begin() as con:
+                return [(courier['courier_id'], shard.claim_orders(con, courier['courier_id'], courier['courier_type'],
+                                                                   orders, assign_time))
+                        for courier, orders in shard_claims]
+        assigned = {courier['courier_id']: [] for courier in couriers}
+        for shard_result in self.map_shards(claim, claims).values():
+            for courier_id, orders in shard_result:
+                assigned[courier_id].extend(orders)
+        return {courier_id: sorted(orders) for courier_id, orders in assigned.items()}, assign_time.isoformat()
+
+    def fetch_orders(self, con: db.engine.Connection, order_ids: tp.List[int]):
+        """
+        Заказы ищутся во всех шардах: по айди регион заказа не известен
+        """
+        def fetch(shard, arg):
+            with shard.engine.connect() as shard_con:
+                return shard.fetch_orders(shard_con, order_ids)
+        orders = dict()
+        for shard_orders in self.map_shards(fetch, self.all_shards()).values():
+            orders.update(shard_orders)
+        return orders
+
+    def mark_complete(self, con: db.engine.Connection, completions: tp.List[tp.Tuple[tp.Any, datetime]]):
+        def mark(shard, shard_completions):
+            with shard.engine.begin() as shard_con:
+                shard.mark_complete(shard_con, shard_completions)
+        self.map_shards(mark, self.group_by_shard(completions, lambda x: x[0]['region']))
+
+    def completed_orders(self, con: db.engine.Connection, courier_ids: tp.Optional[tp.List[int]] = None):
+        def select(shard, arg):
+            with shard.engine.connect() as shard_con:
+                return shard.completed_orders(shard_con, courier_ids).fetchall()
+        rows = [row for rows in self.map_shards(select, self.all_shards()).values() for row in rows]
+        return sorted(rows, key=lambda x: (x['courier_id'], x['order_id']))
+
+    def count_completed(self):
+        return sum(self.map_shards(lambda shard, arg: shard.count_completed(), self.all_shards()).values())
+
+    def archive_completed(self):
+        """
+        Каждый шард архивирует свои заказы в свой архив
+        """
+        return sum(self.map_shards(lambda shard, arg: shard.archive_completed(), self.all_shards()).values())
+
+
+def init_sharded(database_uri: str, shard_uri: str, num_shards: int, profile: str, migrate: bool = True,
+                 **settings):
+    """
+    Основная база и num_shards баз заказов (shard_uri - шаблон с {} под номер шарда).
+    settings - настройки Order (chunk_size, archive_threshold, ...), общие для всех шардов.
+    Возвращает engine основной базы, ShardedOrder и таблицу курьеров
+    """
+    engine, orders, couriers = init_db(database_uri, profile, migrate)
+    shards = []
+    for i in range(num_shards):
+        shard_engine, shard_orders, _ = init_db(shard_uri.format(i), profile, migrate)
+        shard = Order(shard_engine, shard_orders, **settings)
+        shard.publishes_events = False
+        shards.append(shard)
+    return engine, ShardedOrder(engine, orders, shards, **settings), couriers
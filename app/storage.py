@@ -0,0 +1,106 @@
+"""
+Хранилище курьеров и заказов процесса. Открывается лениво, при первом обращении из запроса или команды:
+импорт приложения и create_app не создают подключений и не трогают схему.
+
+С gunicorn --preload мастер импортирует приложение до fork, но хранилище не открывает, каждый воркер открывает
+свое. Если хранилище все же открыли до fork, в дочернем процессе оно открывается заново: подключения из пула
+родителя не переживают fork
+"""
+import os
+import threading
+import typing as tp
+
+import sqlalchemy as db
+from flask import Flask, current_app
+from werkzeug.local import LocalProxy
+
+from app.data import init_db, define_tables, Courier, Order
+from app.memory import init_memory
+from app.metrics import Metrics
+from app.sharding import init_sharded
+
+
+class Storage:
+    """
+    Выбирает бэкенд по настройкам приложения (STORAGE_BACKEND, ORDER_SHARDS, DATABASE_URI, ...)
+    и создает объекты Courier и Order один раз на процесс. Остальные настройки хранилища (SQL_CHUNK_SIZE,
+    COURIER_CACHE_SIZE, ARCHIVE_*, FEED_EVENTS_KEEP) тоже берутся из настроек приложения
+    """
+    def __init__(self, metrics: tp.Optional[Metrics] = None):
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.pid = None
+        self.couriers = None
+        self.orders = None
+
+    def init_app(self, app: Flask):
+        self.config = app.config
+        app.extensions['storage'] = self
+        if app.config['STORAGE_BACKEND'] != 'memory':
+            self.preload()
+
+    def preload(self):
+        """
+        Все, что можно сделать без подключения к базе: импорт диалекта SQLAlchemy и драйвера базы,
+        описание схемы (индексы с postgresql_where импортируют диалект PostgreSQL). Иначе это происходит
+        в первом запросе каждого воркера, а с --preload делается один раз в мастере
+        """
+        db.engine.url.make_url(self.config['DATABASE_URI']).get_dialect().dbapi()
+        define_tables()
+
+    def open(self):
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.couriers, self.orders = self.connect(self.config, self.config['AUTO_MIGRATE'])
+                    self.pid = os.getpid()
+        return self
+
+    def connect(self, config: tp.Mapping[str, tp.Any], migrate: bool):
+        """
+        Возвращает (Courier, Order) выбранного бэкенда
+        """
+        if config['STORAGE_BACKEND'] == 'memory':
+            return init_memory(config['MEMORY_DATA_DIR'], fsync=config['MEMORY_WAL_FSYNC'],
+                               snapshot_every=config['MEMORY_SNAPSHOT_EVERY'], events_keep=config['FEED_EVENTS_KEEP'])
+
+        settings = dict(chunk_size=config['SQL_CHUNK_SIZE'], events_keep=config['FEED_EVENTS_KEEP'],
+                        archive_threshold=config['ARCHIVE_THRESHOLD'],
+                        archive_check_every=config['ARCHIVE_CHECK_EVERY'])
+        if config['ORDER_SHARDS'] > 1:
+            engine, orders, couriers = init_sharded(config['DATABASE_URI'], config['SHARD_DATABASE_URI'],
+                                                    config['ORDER_SHARDS'], config['STORAGE_PROFILE'], migrate,
+                                                    **settings)
+            order_storage = orders
+            engines = [engine] + [shard.engine for shard in orders.shards]
+        else:
+            engine, orders, couriers = init_db(config['DATABASE_URI'], config['STORAGE_PROFILE'], migrate)
+            order_storage = Order(engine, orders, **settings)
+            engines = [engine]
+        if self.metrics is not None:
+            for watched in engines:
+                self.metrics.watch_engine(watched)
+        return Courier(engine, couriers, cache_size=config['COURIER_CACHE_SIZE'],
+                       chunk_size=config['SQL_CHUNK_SIZE']), order_storage
+
+    def migrate(self):
+        """
+        Шаг миграции схемы: создает таблицы, колонки и индексы во всех базах бэкенда и закрывает подключения.
+        Хранилищу в памяти схема не нужна
+        """
+        if self.config['STORAGE_BACKEND'] == 'memory':
+            return False
+        couriers, orders = Storage().connect(self.config, migrate=True)
+        couriers.engine.dispose()
+        for shard in getattr(orders, 'shards', []):
+            shard.engine.dispose()
+        return True
+
+
+def get_storage() -> Storage:
+    return current_app.extensions['storage'].open()
+
+
+# Для обработчиков запросов и команд: обращение к атрибуту открывает хранилище текущего приложения
+Couriers = LocalProxy(lambda: get_storage().couriers)
+Orders = LocalProxy(lambda: get_storage().orders)
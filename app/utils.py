@@ -1,5 +1,16 @@
+import base64
+import binascii
+import itertools
 import re
 import typing as tp
+from datetime import datetime, timedelta
+
+from app.json_backend import dumps, loads
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 weight_dict = {
     'foot': 10,
@@ -7,6 +18,9 @@ weight_dict = {
     'car': 50
 }
 
+# С какого размера выборки заказов сопоставление интервалов выгоднее делать через numpy
+NUMPY_MIN_ROWS = 1000
+
 coefficient_dict = {
     'foot': 2,
     'bike': 5,
@@ -28,33 +42,48 @@ def is_valid_weight(weight: float):
     return True
 
 
-def recalculate_orders(data: dict, orders: tp.List[dict]):
-    removed_orders = []
-    try:
-        max_weight = weight_dict[data['courier_type']]
-        for order in orders:
-            if order['weight'] > max_weight:
-                removed_orders.append(order['order_id'])
-    except KeyError:
-        pass
+def chunks(seq: tp.Iterable[tp.Any], size: int):
+    iterator = iter(seq)
+    chunk = list(itertools.islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, size))
 
-    try:
-        regions = data['regions']
-        for order in orders:
-            if order['region'] not in regions:
-                removed_orders.append(order['order_id'])
-    except KeyError:
-        pass
 
-    try:
-        working_hours = data['working_hours']
-        for order in orders:
-            if not check_hours(working_hours, order['delivery_hours']):
-                removed_orders.append(order['order_id'])
-    except KeyError:
-        pass
+def iter_ndjson(stream: tp.Iterable[bytes]):
+    """
+    Читает поток в формате NDJSON построчно. Возвращает пары (номер строки, объект),
+    для строк, которые не удалось разобрать, объект - None. Пустые строки пропускаются
+    """
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, loads(line)
+        except ValueError:
+            yield line_number, None
+
+
+def encode_cursor(key: tp.Tuple[tp.Optional[datetime], int]):
+    """
+    Непрозрачный курсор страницы из ключа (complete_time, order_id) последнего элемента
+    """
+    complete_time, order_id = key
+    data = dumps([complete_time.isoformat() if complete_time is not None else None, order_id])
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
 
-    return removed_orders
+
+def decode_cursor(cursor: str):
+    """
+    Обратно к (complete_time, order_id). На испорченный курсор бросает ValueError
+    """
+    try:
+        complete_time, order_id = loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if type(order_id) is not int:
+            raise ValueError
+        return datetime.fromisoformat(complete_time) if complete_time is not None else None, order_id
+    except (TypeError, binascii.Error):
+        raise ValueError(cursor)
 
 
 def validate_keys(valid_cols: tp.List[str], data: dict, raise_missing: bool = True, num: int = 4):
@@ -66,36 +95,155 @@ def validate_keys(valid_cols: tp.List[str], data: dict, raise_missing: bool = Tr
             raise ValueError
 
 
-def check_hours(hours_1: tp.List[str], hours_2: tp.List[str]):
-    for hour_1 in hours_1:
-        split = re.split(':|-', hour_1)
-        min_1 = int(split[0]) * 60 + int(split[1])
-        max_1 = int(split[2]) * 60 + int(split[3])
-        for hour_2 in hours_2:
-            split = re.split(':|-', hour_2)
-            min_2 = int(split[0]) * 60 + int(split[1])
-            max_2 = int(split[2]) * 60 + int(split[3])
-            if min_2 <= min_1 < max_2 or min_1 <= min_2 < max_1:
-                return True
+def parse_hours(hours: tp.List[str]):
+    """
+    Переводит интервалы вида 'HH:MM-HH:MM' в пары (начало, конец) в минутах от начала суток
+    """
+    intervals = []
+    for hour in hours:
+        split = re.split(':|-', hour)
+        intervals.append((int(split[0]) * 60 + int(split[1]),
+                          int(split[2]) * 60 + int(split[3])))
+    return intervals
+
+
+def overlaps(intervals: tp.List[tp.Tuple[int, int]], min_2: int, max_2: int):
+    for min_1, max_1 in intervals:
+        if min_2 <= min_1 < max_2 or min_1 <= min_2 < max_1:
+            return True
+    return False
+
+
+def check_intervals(intervals_1: tp.List[tp.Tuple[int, int]], intervals_2: tp.List[tp.Tuple[int, int]]):
+    for min_2, max_2 in intervals_2:
+        if overlaps(intervals_1, min_2, max_2):
+            return True
     return False
 
 
-def match_orders_by_hours(hours: tp.List[str], rel_orders: tp.List[dict]):
-    matching_orders = []
-    for elem in rel_orders:
-        if check_hours(hours, elem['delivery_hours'].split(',')):
-            matching_orders.append(elem['order_id'])
-    return matching_orders
+def check_hours(hours_1: tp.List[str], hours_2: tp.List[str]):
+    return check_intervals(parse_hours(hours_1), parse_hours(hours_2))
+
+
+def match_orders_by_hours_python(intervals: tp.List[tp.Tuple[int, int]], rel_orders: tp.List[tp.Any]):
+    matching_orders = dict()
+    for order_id, min_2, max_2 in rel_orders:
+        if order_id in matching_orders:
+            continue
+        if overlaps(intervals, min_2, max_2):
+            matching_orders[order_id] = None
+    return list(matching_orders)
+
+
+def match_orders_by_hours_numpy(intervals: tp.List[tp.Tuple[int, int]], rel_orders: tp.List[tp.Any]):
+    data = np.fromiter(itertools.chain.from_iterable(rel_orders), dtype=np.int64,
+                       count=3 * len(rel_orders)).reshape(-1, 3)
+    order_ids, min_2, max_2 = data[:, 0], data[:, 1], data[:, 2]
+    mask = np.zeros(len(data), dtype=bool)
+    for min_1, max_1 in intervals:
+        mask |= ((min_2 <= min_1) & (min_1 < max_2)) | ((min_1 <= min_2) & (min_2 < max_1))
+    matched = order_ids[mask]
+    # Порядок как у python-версии: по первому появлению заказа в выборке
+    _, first_index = np.unique(matched, return_index=True)
+    return matched[np.sort(first_index)].tolist()
+
+
+def match_orders_by_hours(intervals: tp.List[tp.Tuple[int, int]], rel_orders: tp.List[tp.Any]):
+    """
+    rel_orders - строки (order_id, start_minute, end_minute), по одной на каждый интервал заказа.
+    Большие выборки обрабатываются через numpy (если он установлен), маленькие - в цикле
+    """
+    if np is not None and len(rel_orders) >= NUMPY_MIN_ROWS:
+        return match_orders_by_hours_numpy(intervals, rel_orders)
+    return match_orders_by_hours_python(intervals, rel_orders)
+
+
+def distribute_orders(couriers: tp.List[tp.Any], rel_orders: tp.List[tp.Any], capacity_limit: bool = True):
+    """
+    Жадно распределяет заказы между курьерами (профилями) в порядке их следования: каждому достаются подходящие
+    по региону и времени заказы (по возрастанию айди), пока не кончится его грузоподъемность.
+    capacity_limit=False - как при назначении одному курьеру, распределяет distribute_orders_by_hours.
+    rel_orders - строки (order_id, region, weight, start_minute, end_minute), по одной на каждый интервал заказа.
+    Возвращает словарь courier_id -> список заказов
+    """
+    if not capacity_limit:
+        return distribute_orders_by_hours(couriers, rel_orders)
+    orders_by_region = dict()
+    for order_id, region, weight, min_2, max_2 in rel_orders:
+        region_orders = orders_by_region.setdefault(region, dict())
+        try:
+            region_orders[order_id][1].append((min_2, max_2))
+        except KeyError:
+            region_orders[order_id] = (weight, [(min_2, max_2)])
+
+    distribution = dict()
+    for courier in couriers:
+        capacity = courier['capacity']
+        hours = courier['hours']
+        regions = set(courier['regions'])
+        # Сначала отбираем подходящие по весу и времени заказы, сортируем только их
+        eligible = [(order_id, weight, region)
+                    for region in regions
+                    for order_id, (weight, intervals) in orders_by_region.get(region, dict()).items()
+                    if weight <= capacity and check_intervals(hours, intervals)]
+        courier_orders = []
+        for order_id, weight, region in sorted(eligible):
+            if weight <= capacity:
+                courier_orders.append(order_id)
+                del orders_by_region[region][order_id]
+                capacity -= weight
+        distribution[courier['courier_id']] = courier_orders
+    return distribution
+
+
+def distribute_orders_by_hours(couriers: tp.List[tp.Any], rel_orders: tp.List[tp.Any]):
+    """
+    distribute_orders с capacity_limit=False: вес сравнивается с грузоподъемностью для каждого заказа отдельно,
+    курьеру достаются все подходящие заказы, не забранные курьерами до него. Заказы подбираются по времени
+    одним вызовом match_orders_by_hours (через numpy на больших выборках), как в Order.orders_for_courier
+    """
+    rows_by_region = dict()
+    for order_id, region, weight, min_2, max_2 in rel_orders:
+        rows_by_region.setdefault(region, []).append((order_id, weight, min_2, max_2))
+
+    taken = set()
+    distribution = dict()
+    for courier in couriers:
+        capacity = courier['capacity']
+        rows = [(order_id, min_2, max_2)
+                for region in set(courier['regions'])
+                for order_id, weight, min_2, max_2 in rows_by_region.get(region, [])
+                if weight <= capacity and order_id not in taken]
+        courier_orders = sorted(match_orders_by_hours(courier['hours'], rows)) if rows else []
+        taken.update(courier_orders)
+        distribution[courier['courier_id']] = courier_orders
+    return distribution
+
+
+def min_weights(orders: tp.Iterable[tp.Any]):
+    """
+    Минимальный вес заказов по регионам: регион -> вес
+    """
+    weights = dict()
+    for order in orders:
+        region = order['region']
+        if region not in weights or order['weight'] < weights[region]:
+            weights[region] = order['weight']
+    return weights
 
 
 def calculate_earnings(orders: tp.List[tp.Any]):
     return sum([order['assigned_type_coef'] * 500 for order in orders])
 
 
-def calculate_rating(orders: tp.List[tp.Any]):
+def aggregate_orders(orders: tp.List[tp.Any]):
+    """
+    Агрегаты по выполненным заказам курьера в разрезе регионов:
+    заработок, число заказов, минимальное время доставки и время последнего выполнения
+    """
     orders = sorted(orders, key=lambda x: x['complete_time'])
     prev_complete_time = None
-    region_wise_times = dict()
+    region_wise_stats = dict()
     for order in orders:
         time_since_assigned = order['complete_time'] - order['assign_time']
         if prev_complete_time is None:
@@ -105,17 +253,40 @@ def calculate_rating(orders: tp.List[tp.Any]):
             delivery_time = min([time_since_previous, time_since_assigned])
 
         try:
-            region_wise_times[order['region']].append(delivery_time)
+            stats = region_wise_stats[order['region']]
+            stats['min_delivery_time'] = min(stats['min_delivery_time'], delivery_time)
         except KeyError:
-            region_wise_times[order['region']] = [delivery_time]
+            stats = region_wise_stats[order['region']] = {'earnings': 0, 'completed': 0,
+                                                          'min_delivery_time': delivery_time}
+        stats['earnings'] += order['assigned_type_coef'] * 500
+        stats['completed'] += 1
+        stats['last_complete_time'] = order['complete_time']
 
         prev_complete_time = order['complete_time']
+    return region_wise_stats
 
+
+def calculate_rating_by_region(region_min_times: tp.Iterable[timedelta]):
     one_hour: int = 60 * 60
     min_average_time = one_hour
-    for key, value in region_wise_times.items():
-        region_min = min(value).seconds
+    for region_min_time in region_min_times:
+        region_min = region_min_time.seconds
         if region_min < min_average_time:
             min_average_time = region_min
 
     return 5 * (one_hour - min_average_time) / one_hour
+
+
+def calculate_rating(orders: tp.List[tp.Any]):
+    return calculate_rating_by_region(stats['min_delivery_time'] for stats in aggregate_orders(orders).values())
+
+
+def calculate_earnings_from_stats(stats: tp.List[tp.Any]):
+    return sum(row['earnings'] for row in stats)
+
+
+def calculate_rating_from_stats(stats: tp.List[tp.Any]):
+    """
+    stats - строки courier_stats, минимальное время доставки в них хранится в секундах
+    """
+    return calculate_rating_by_region(timedelta(seconds=row['min_delivery_time']) for row in stats)
@@ -0,0 +1,128 @@
+"""
+Проверка элементов по схемам OrderItem, CourierItem и CourierUpdateRequest из openapi.yaml.
+Проверки написаны плоско, без вложенных вызовов на каждое поле: только перечисленные поля
+(additionalProperties: false), точные типы (type(x) is int, bool - не integer) и заранее скомпилированное
+регулярное выражение для интервалов
+"""
+import re
+import typing as tp
+
+import iso8601
+
+HOURS_PATTERN = re.compile('(0[0-9]|1[0-9]|2[0-3]):[0-5][0-9]-(0[0-9]|1[0-9]|2[0-3]):[0-5][0-9]')
+match_hours = HOURS_PATTERN.fullmatch
+
+COURIER_TYPES = frozenset({'foot', 'bike', 'car'})
+ORDER_KEYS = frozenset({'order_id', 'weight', 'region', 'delivery_hours'})
+COURIER_KEYS = frozenset({'courier_id', 'courier_type', 'regions', 'working_hours'})
+COURIER_UPDATE_KEYS = COURIER_KEYS - {'courier_id'}
+COMPLETION_KEYS = frozenset({'order_id', 'courier_id', 'complete_time'})
+
+
+def valid_hours(hours: tp.Any):
+    if type(hours) is not list:
+        return False
+    for hour in hours:
+        if type(hour) is not str or match_hours(hour) is None:
+            return False
+    return True
+
+
+def valid_regions(regions: tp.Any):
+    if type(regions) is not list:
+        return False
+    for region in regions:
+        if type(region) is not int:
+            return False
+    return True
+
+
+def valid_courier_type(courier_type: tp.Any):
+    return type(courier_type) is str and courier_type in COURIER_TYPES
+
+
+# validate_order и validate_courier вызываются на каждый элемент загрузки, поэтому циклы по спискам в них
+# написаны на месте, а не через valid_hours и valid_regions
+
+def validate_order(elem: tp.Any):
+    if type(elem) is not dict or elem.keys() != ORDER_KEYS:
+        return False
+    weight = elem['weight']
+    hours = elem['delivery_hours']
+    # NaN не проходит ни одно сравнение
+    if type(elem['order_id']) is not int \
+            or not (type(weight) is float or type(weight) is int) or not 0.01 <= weight <= 50 \
+            or type(elem['region']) is not int \
+            or type(hours) is not list:
+        return False
+    for hour in hours:
+        if type(hour) is not str or match_hours(hour) is None:
+            return False
+    return True
+
+
+def validate_courier(elem: tp.Any):
+    if type(elem) is not dict or elem.keys() != COURIER_KEYS:
+        return False
+    courier_type = elem['courier_type']
+    regions = elem['regions']
+    hours = elem['working_hours']
+    if type(elem['courier_id']) is not int \
+            or type(courier_type) is not str or courier_type not in COURIER_TYPES \
+            or type(regions) is not list \
+            or type(hours) is not list:
+        return False
+    for region in regions:
+        if type(region) is not int:
+            return False
+    for hour in hours:
+        if type(hour) is not str or match_hours(hour) is None:
+            return False
+    return True
+
+
+def validate_courier_update(elem: tp.Any):
+    """
+    CourierUpdateRequest: те же поля, кроме айди, и ни одно не обязательно
+    """
+    if type(elem) is not dict or not elem.keys() <= COURIER_UPDATE_KEYS:
+        return False
+    return ('courier_type' not in elem or valid_courier_type(elem['courier_type'])) \
+        and ('regions' not in elem or valid_regions(elem['regions'])) \
+        and ('working_hours' not in elem or valid_hours(elem['working_hours']))
+
+
+def valid_time(time: tp.Any):
+    if type(time) is not str:
+        return False
+    try:
+        iso8601.parse_date(time)
+    except iso8601.ParseError:
+        return False
+    return True
+
+
+def validate_completion(elem: tp.Any):
+    """
+    Элемент POST /orders/complete и /orders/complete/batch: время выполнения - дата в формате ISO 8601
+    """
+    if type(elem) is not dict or elem.keys() != COMPLETION_KEYS:
+        return False
+    return type(elem['order_id']) is int \
+        and type(elem['courier_id']) is int \
+        and valid_time(elem['complete_time'])
+
+
+def find_invalid(data: tp.List[tp.Any], validate: tp.Callable[[tp.Any], bool], id_col: str):
+    """
+    Проверяет список за один проход. Возвращает индексы невалидных элементов,
+    повторы айди внутри списка тоже считаются невалидными
+    """
+    invalid = []
+    seen_ids = set()
+    for i, elem in enumerate(data):
+        if not validate(elem) or elem[id_col] in seen_ids:
+            invalid.append(i)
+        else:
+            seen_ids.add(elem[id_col])
+    return invalid
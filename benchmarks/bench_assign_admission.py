@@ -0,0 +1,132 @@
+"""
+Нагрузочный тест POST /orders/assign при перегрузке, как в начале смены. Поднимается gunicorn (несколько
+воркеров с потоками, одна база SQLite), запросы на назначение приходят с постоянной частотой (открытая модель:
+следующий запрос уходит по расписанию, не дожидаясь ответов), параллельно подвозятся новые заказы.
+Сравнивается назначение без очереди (ASSIGN_QUEUE_SIZE=0) и через очередь с пачками.
+
+Без очереди каждый запрос сам ждет блокировку записи базы, ожидающие копятся, и задержка растет все время теста.
+С очередью в каждом воркере пишет один поток пачками, задержка ограничена размером очереди,
+а лишние запросы сразу получают 429
+
+Запуск из корня проекта: python -m benchmarks.bench_assign_admission [запросов в секунду] [секунд] [размер очереди]
+"""
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from tests.utils_for_test import *
+
+PORT = 8095
+NUM_COURIERS = 300
+WORKERS = 4
+THREADS = 16
+
+
+def post(path: str, data: dict):
+    connection = http.client.HTTPConnection('127.0.0.1', PORT, timeout=120)
+    try:
+        connection.request('POST', path, json.dumps(data), {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def start_server(tmp: str, queue_size: int):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root, DATABASE_URI='sqlite:///' + os.path.join(tmp, f'assign_{queue_size}.db'),
+               STORAGE_BACKEND='sql', ORDER_SHARDS='1', ASSIGN_QUEUE_SIZE=str(queue_size), AUTO_MIGRATE='0')
+    subprocess.run([sys.executable, '-m', 'flask', 'migrate'], env=dict(env, FLASK_APP='app'), cwd=tmp, check=True,
+                   capture_output=True)
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--preload', '--workers', str(WORKERS),
+                               '--threads', str(THREADS), '--bind', f'127.0.0.1:{PORT}', '--log-level', 'error',
+                               'app:app'], env=env, cwd=tmp)
+    for _ in range(100):
+        try:
+            post('/couriers', {'data': []})
+            break
+        except OSError:
+            time.sleep(0.1)
+    return server
+
+
+def run(tmp: str, queue_size: int, rate: float, duration: float):
+    server = start_server(tmp, queue_size)
+    try:
+        random.seed(0)
+        post('/couriers', {'data': [create_courier_dict(i, generate_courier_type(), generate_set_of_regions(),
+                                                        [generate_delivery_hours()]) for i in range(NUM_COURIERS)]})
+        results = []
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def feed_orders():
+            next_order_id = 0
+            while not stop.is_set():
+                post('/orders', {'data': [create_order_dict(i, generate_weight(), generate_region(),
+                                                            [generate_delivery_hours()])
+                                          for i in range(next_order_id, next_order_id + 50)]})
+                next_order_id += 50
+                time.sleep(0.05)
+
+        def send(courier_id: int):
+            sent_at = time.perf_counter()
+            try:
+                status = post('/orders/assign', {'courier_id': courier_id})
+            except OSError:
+                status = 'error'
+            with lock:
+                results.append((sent_at, status, time.perf_counter() - sent_at))
+
+        feeder = threading.Thread(target=feed_orders)
+        feeder.start()
+        threads = []
+        start = time.perf_counter()
+        for i in range(int(rate * duration)):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            thread = threading.Thread(target=send, args=(random.randrange(NUM_COURIERS),))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        stop.set()
+        feeder.join()
+    finally:
+        server.terminate()
+        server.wait()
+    return start, results
+
+
+def percentile(values, q: float):
+    return sorted(values)[int(len(values) * q)] * 1000 if values else 0
+
+
+def main(rate: float, duration: float, queue_size: int):
+    print(f'offered load: {rate:.0f} assign req/s for {duration:.0f} s, {WORKERS} workers x {THREADS} threads')
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (0, queue_size):
+            start, results = run(tmp, size, rate, duration)
+            ok = [(sent_at - start, latency) for sent_at, status, latency in results if status == 200]
+            thirds = [[latency for sent_at, latency in ok if duration * k / 3 <= sent_at < duration * (k + 1) / 3]
+                      for k in range(3)]
+            statuses = dict()
+            for sent_at, status, latency in results:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            latencies = [latency for sent_at, latency in ok]
+            print(f'queue={size:<4} p50 {percentile(latencies, 0.5):7.0f} ms   p99 {percentile(latencies, 0.99):7.0f} ms'
+                  f'   p99 by thirds of the test {" / ".join(f"{percentile(third, 0.99):.0f}" for third in thirds)} ms'
+                  f'   statuses {dict(sorted(statuses.items()))}')
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 200,
+         float(sys.argv[2]) if len(sys.argv) > 2 else 15,
+         int(sys.argv[3]) if len(sys.argv) > 3 else 6)
@@ -0,0 +1,50 @@
+"""
+Бенчмарк назначения заказов на смену: N последовательных назначений против одного пакетного
+
+Запуск из корня проекта: python -m benchmarks.bench_assign_batch [число курьеров] [число заказов]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from app.data import init_db, Order, Courier
+from tests.utils_for_test import *
+
+
+def prepare(tmp: str, name: str, num_couriers: int, num_orders: int):
+    engine, orders, couriers = init_db('sqlite:///' + os.path.join(tmp, name))
+    order_storage, courier_storage = Order(engine, orders), Courier(engine, couriers)
+    random.seed(0)
+    courier_storage.add([create_courier_dict(i, generate_courier_type(), generate_set_of_regions(),
+                                             [generate_delivery_hours()])
+                         for i in range(num_couriers)])
+    order_storage.add([create_order_dict(i, generate_weight(), generate_region(), [generate_delivery_hours()])
+                       for i in range(num_orders)])
+    return engine, order_storage, courier_storage
+
+
+def main(num_couriers: int, num_orders: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, order_storage, courier_storage = prepare(tmp, 'sequential.db', num_couriers, num_orders)
+        start = time.perf_counter()
+        assigned = 0
+        for courier_id in range(num_couriers):
+            matching_orders, assign_time = order_storage.orders_for_courier(courier_storage.get_profile(courier_id))
+            assigned += len(matching_orders)
+        elapsed = time.perf_counter() - start
+        print(f'sequential: {elapsed * 1000:9.1f} ms, {assigned} orders assigned')
+        engine.dispose()
+
+        engine, order_storage, courier_storage = prepare(tmp, 'batch.db', num_couriers, num_orders)
+        start = time.perf_counter()
+        couriers = courier_storage.get_profiles(list(range(num_couriers)))
+        assigned, assign_time = order_storage.orders_for_couriers(couriers)
+        elapsed = time.perf_counter() - start
+        print(f'     batch: {elapsed * 1000:9.1f} ms, {sum(map(len, assigned.values()))} orders assigned '
+              f'(capacity respected)')
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3])) if len(sys.argv) > 2 else main(300, 3000)
@@ -0,0 +1,57 @@
+"""
+Бенчмарк загрузки заказов и курьеров: построчная вставка против пакетной (одна транзакция)
+
+Запуск из корня проекта: python -m benchmarks.bench_ingest [размер ...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import sqlalchemy as db
+
+from app.data import init_db, Order, Courier
+from tests.utils_for_test import *
+
+
+def per_row_insert(storage, data):
+    """
+    Старый путь: отдельное соединение и автокоммит на каждую строку
+    """
+    for elem in data:
+        with storage.engine.connect() as con:
+            con.execute(db.insert(storage.table).values(**storage.to_row(elem)))
+
+
+def bulk_insert(storage, data):
+    storage.add(data)
+
+
+def run(size: int, insert):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, orders, couriers = init_db('sqlite:///' + os.path.join(tmp, 'bench.db'))
+        order_data = [create_order_dict(i, generate_weight(), generate_region(), [generate_delivery_hours()])
+                      for i in range(size)]
+        courier_data = [create_courier_dict(i, generate_courier_type(), generate_set_of_regions(),
+                                            [generate_delivery_hours()])
+                        for i in range(size)]
+        result = {}
+        for name, storage, data in [('orders', Order(engine, orders), order_data),
+                                    ('couriers', Courier(engine, couriers), courier_data)]:
+            start = time.perf_counter()
+            insert(storage, data)
+            result[name] = size / (time.perf_counter() - start)
+        engine.dispose()
+    return result
+
+
+def main(sizes):
+    for size in sizes:
+        for name, insert in [('per_row', per_row_insert), ('bulk', bulk_insert)]:
+            result = run(size, insert)
+            print(f'{name:>8} n={size:<7} orders: {result["orders"]:>10.0f} rows/s   '
+                  f'couriers: {result["couriers"]:>10.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000])
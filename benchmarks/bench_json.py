@@ -0,0 +1,69 @@
+"""
+Бенчмарк JSON: flask.jsonify и разбор request.json стандартным json против app.json_backend (orjson)
+на ответах и запросах того же вида, что в routes.py
+
+Запуск из корня проекта: python -m benchmarks.bench_json [размер]
+"""
+import json
+import sys
+import timeit
+
+import flask
+
+from app.json_backend import USE_ORJSON, dumps, loads
+from tests.utils_for_test import *
+
+
+def response_shapes(size: int):
+    assign_time = '2021-03-28T10:15:42.183000+00:00'
+    return {
+        'POST /orders': {'orders': [{'id': i} for i in range(size)]},
+        'POST /orders (400)': {'validation_error': {'orders': [{'id': i} for i in range(size)]}},
+        'POST /orders/assign': {'orders': [{'id': i} for i in range(size)], 'assign_time': assign_time},
+        'POST /orders/assign/batch': {'couriers': [{'courier_id': c,
+                                                    'orders': [{'id': c * 100 + i} for i in range(100)],
+                                                    'assign_time': assign_time}
+                                                   for c in range(size // 100)]},
+        'POST /orders/complete/batch': {'orders': [{'id': i, 'status': 'completed'} for i in range(size)]},
+        'GET /couriers/<id>': {'courier_id': 1, 'courier_type': 'car', 'regions': list(range(10)),
+                               'working_hours': ['09:00-12:00', '14:00-18:00'], 'earnings': 12500, 'rating': 4.67},
+    }
+
+
+def request_shapes(size: int):
+    random.seed(0)
+    return {
+        'POST /orders': {'data': [create_order_dict(i, generate_weight(), generate_region(),
+                                                    [generate_delivery_hours()]) for i in range(size)]},
+        'POST /couriers': {'data': [create_courier_dict(i, generate_courier_type(), generate_set_of_regions(),
+                                                        [generate_delivery_hours()]) for i in range(size)]},
+        'POST /orders/complete/batch': {'data': [{'courier_id': 1, 'order_id': i,
+                                                  'complete_time': '2021-01-10T10:33:01.42Z'}
+                                                 for i in range(size)]},
+    }
+
+
+def best_of(func, number: int = 5):
+    return min(timeit.repeat(func, number=1, repeat=number)) * 1000
+
+
+def main(size: int):
+    print(f'backend: {"orjson" if USE_ORJSON else "stdlib"}, size={size}')
+    app = flask.Flask(__name__)
+    with app.app_context():
+        for name, data in response_shapes(size).items():
+            assert loads(dumps(data)) == data
+            flask_ms = best_of(lambda: flask.jsonify(data).get_data())
+            backend_ms = best_of(lambda: dumps(data))
+            print(f'encode {name:<28} flask.jsonify: {flask_ms:8.2f} ms   backend: {backend_ms:8.2f} ms   '
+                  f'x{flask_ms / backend_ms:.1f}')
+    for name, data in request_shapes(size).items():
+        body = json.dumps(data).encode()
+        stdlib_ms = best_of(lambda: json.loads(body))
+        backend_ms = best_of(lambda: loads(body))
+        print(f'decode {name:<28} json.loads:    {stdlib_ms:8.2f} ms   backend: {backend_ms:8.2f} ms   '
+              f'x{stdlib_ms / backend_ms:.1f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,356 @@
+"""
+Воспроизводимый нагрузочный набор: все эндпоинты app/routes.py на наборах данных от тысяч до миллиона курьеров
+и заказов, в процессе (тестовый клиент Flask) и по HTTP (gunicorn, как в start.sh), с разным числом
+параллельных клиентов. Данные и запросы строятся из seed (generate_couriers, generate_orders из
+tests/utils_for_test.py), поэтому прогоны на разных версиях сравнимы. Результат - JSON: по каждой фазе
+пропускная способность и задержки p50/p95/p99.
+
+Каждый прогон (режим, размер, параллельность) идет на новом хранилище во временной папке, бэкенд выбирается
+как обычно переменными окружения (STORAGE_BACKEND, ORDER_SHARDS). Фазы по порядку: загрузка курьеров и
+заказов (половина через /orders, половина через /orders/stream), чтение профилей, назначение, история,
+лента, выполнение назначенных заказов, изменение курьеров, статистика и метрики.
+
+--record сохраняет запросы первого прогона в JSONL (по запросу в строке: phase, endpoint, method, path,
+content_type, body, items), --replay проигрывает такой файл вместо генерации: фазы в том же порядке,
+запросы фазы - с заданной параллельностью
+
+Запуск из корня проекта:
+python -m benchmarks.bench_load [--sizes 1000 10000] [--concurrency 1 4 16] [--modes inprocess http]
+                                [--requests 500] [--seed 0] [--output результат.json]
+                                [--record запросы.jsonl | --replay запросы.jsonl]
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import typing as tp
+
+from tests.utils_for_test import *
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PORT = 8096
+# Курьеров и заказов в одном запросе загрузки, заказов в одном запросе /orders/stream, элементов в пакетных запросах
+LOAD_CHUNK = 1000
+STREAM_CHUNK = 10000
+BATCH_SIZE = 10
+JSON = 'application/json'
+NDJSON = 'application/x-ndjson'
+
+
+class Request(tp.NamedTuple):
+    method: str
+    path: str
+    body: tp.Optional[bytes] = None
+    content_type: tp.Optional[str] = None
+    # Сколько курьеров или заказов в запросе: для пропускной способности загрузки
+    items: int = 1
+
+
+def json_request(method: str, path: str, data: tp.Any, items: int = 1):
+    return Request(method, path, json.dumps(data).encode(), JSON, items)
+
+
+def chunked(items: tp.Iterable[tp.Any], size: int):
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def generated_scenario(size: int, num_requests: int, seed: int):
+    """
+    Фазы нагрузки: генератор отдает (фаза, эндпоинт, запросы) и получает ответы фазы
+    [(запрос, статус, тело)] - по ним строятся запросы на выполнение назначенных заказов
+    """
+    rng = random.Random(seed + 2)
+    courier_ids = lambda: [rng.randrange(size) for _ in range(num_requests)]
+
+    yield 'post_couriers', 'POST /couriers', [
+        json_request('POST', '/couriers', {'data': chunk}, len(chunk))
+        for chunk in chunked(generate_couriers(range(size), seed), LOAD_CHUNK)]
+    orders = generate_orders(range(size), seed + 1)
+    yield 'post_orders', 'POST /orders', [
+        json_request('POST', '/orders', {'data': chunk}, len(chunk))
+        for chunk in chunked(itertools.islice(orders, size // 2), LOAD_CHUNK)]
+    yield 'post_orders_stream', 'POST /orders/stream', [
+        Request('POST', '/orders/stream', b''.join(json.dumps(order).encode() + b'\n' for order in chunk), NDJSON,
+                len(chunk))
+        for chunk in chunked(orders, STREAM_CHUNK)]
+
+    yield 'get_courier', 'GET /couriers/<id>', [Request('GET', f'/couriers/{i}') for i in courier_ids()]
+    assigned = []
+    responses = yield 'assign', 'POST /orders/assign', [
+        json_request('POST', '/orders/assign', {'courier_id': i}) for i in courier_ids()]
+    for request, status, body in responses:
+        body = json.loads(body) if status == 200 else None
+        if body and body['orders']:
+            courier_id = json.loads(request.body)['courier_id']
+            assigned.extend((courier_id, order['id'], body['assign_time']) for order in body['orders'])
+    responses = yield 'assign_batch', 'POST /orders/assign/batch', [
+        json_request('POST', '/orders/assign/batch', {'courier_ids': [rng.randrange(size) for _ in range(BATCH_SIZE)]},
+                     BATCH_SIZE)
+        for _ in range(num_requests)]
+    for request, status, body in responses:
+        if status == 200:
+            assigned.extend((courier['courier_id'], order['id'], courier['assign_time'])
+                            for courier in json.loads(body)['couriers'] for order in courier['orders'])
+
+    yield 'courier_orders', 'GET /couriers/<id>/orders', [
+        Request('GET', f'/couriers/{i}/orders?limit=100') for i in courier_ids()]
+    yield 'feed', 'GET /couriers/<id>/feed', [Request('GET', f'/couriers/{i}/feed?timeout=0') for i in courier_ids()]
+
+    # Время выполнения - время назначения из ответа
+    completions = [{'courier_id': courier_id, 'order_id': order_id, 'complete_time': assign_time}
+                   for courier_id, order_id, assign_time in assigned]
+    yield 'complete', 'POST /orders/complete', [
+        json_request('POST', '/orders/complete', elem) for elem in completions[:num_requests]]
+    yield 'complete_batch', 'POST /orders/complete/batch', [
+        json_request('POST', '/orders/complete/batch', {'data': chunk}, len(chunk))
+        for chunk in itertools.islice(chunked(completions[num_requests:], BATCH_SIZE), num_requests)]
+
+    yield 'patch_couriers', 'PATCH /couriers/<id>', [
+        json_request('PATCH', f'/couriers/{i}', {'courier_type': generate_courier_type(rng),
+                                                 'regions': generate_set_of_regions(rng)})
+        for i in courier_ids()]
+    yield 'stats_cache', 'GET /stats/cache', [Request('GET', '/stats/cache')] * num_requests
+    yield 'metrics', 'GET /metrics', [Request('GET', '/metrics')] * num_requests
+
+
+def read_recording(path: str):
+    """
+    Фазы из файла --record: [(фаза, эндпоинт, запросы)] в порядке файла
+    """
+    phases = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            elem = json.loads(line)
+            request = Request(elem['method'], elem['path'],
+                              elem['body'].encode() if elem.get('body') is not None else None,
+                              elem.get('content_type'), elem.get('items', 1))
+            if not phases or phases[-1][0] != elem['phase']:
+                phases.append((elem['phase'], elem.get('endpoint', elem['phase']), []))
+            phases[-1][2].append(request)
+    return phases
+
+
+def replayed_scenario(phases: tp.List[tp.Tuple[str, str, tp.List[Request]]]):
+    for phase in phases:
+        yield phase
+
+
+class InProcessClient:
+    """
+    Приложение в этом процессе, у каждого потока свой тестовый клиент
+    """
+    def __init__(self, tmp: str):
+        from app import create_app
+        self.app = create_app(**storage_settings(tmp))
+        self.local = threading.local()
+
+    def send(self, request: Request):
+        if not hasattr(self.local, 'client'):
+            self.local.client = self.app.test_client()
+        response = self.local.client.open(request.path, method=request.method, data=request.body,
+                                          content_type=request.content_type)
+        return response.status_code, response.get_data()
+
+    def close(self):
+        pass
+
+
+class HttpClient:
+    """
+    gunicorn с новым хранилищем, соединение на запрос
+    """
+    def __init__(self, tmp: str, workers: int, threads: int):
+        env = dict(os.environ, PYTHONPATH=ROOT, AUTO_MIGRATE='0', **storage_settings(tmp))
+        subprocess.run([sys.executable, '-m', 'flask', 'migrate'], env=dict(env, FLASK_APP='app'), cwd=tmp,
+                       check=True, capture_output=True)
+        self.server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--preload', '--workers', str(workers),
+                                        '--threads', str(threads), '--bind', f'127.0.0.1:{PORT}',
+                                        '--log-level', 'error', 'app:app'], env=env, cwd=tmp)
+        for _ in range(100):
+            try:
+                self.send(Request('GET', '/stats/cache'))
+                return
+            except OSError:
+                time.sleep(0.1)
+        self.close()
+        raise RuntimeError('gunicorn did not start')
+
+    def send(self, request: Request):
+        connection = http.client.HTTPConnection('127.0.0.1', PORT, timeout=600)
+        try:
+            headers = {'Content-Type': request.content_type} if request.content_type else {}
+            connection.request(request.method, request.path, request.body, headers)
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def close(self):
+        self.server.terminate()
+        self.server.wait()
+
+
+def storage_settings(tmp: str):
+    return {'DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'load.db'),
+            'SHARD_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'load_shard{}.db'),
+            'MEMORY_DATA_DIR': os.path.join(tmp, 'memory')}
+
+
+def run_phase(client: tp.Any, requests: tp.List[Request], concurrency: int):
+    """
+    Отправляет запросы фазы из concurrency потоков. Возвращает ответы в порядке запросов
+    [(статус, тело, секунды)] и время фазы
+    """
+    results = [None] * len(requests)
+    index = itertools.count()
+
+    def worker():
+        while True:
+            i = next(index)
+            if i >= len(requests):
+                return
+            started = time.perf_counter()
+            try:
+                status, body = client.send(requests[i])
+            except OSError as e:
+                status, body = type(e).__name__, b''
+            results[i] = (status, body, time.perf_counter() - started)
+
+    threads = [threading.Thread(target=worker) for _ in range(min(concurrency, len(requests)))]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+def percentile(values: tp.List[float], q: float):
+    return round(sorted(values)[min(int(len(values) * q), len(values) - 1)] * 1000, 3) if values else None
+
+
+def summarize(phase: str, endpoint: str, requests: tp.List[Request], results: tp.List[tp.Any], seconds: float):
+    latencies = [latency for status, body, latency in results]
+    statuses = dict()
+    for status, body, latency in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    items = sum(request.items for request in requests)
+    return {'phase': phase,
+            'endpoint': endpoint,
+            'requests': len(requests),
+            'items': items,
+            'seconds': round(seconds, 3),
+            'requests_per_second': round(len(requests) / seconds, 1) if seconds else None,
+            'items_per_second': round(items / seconds, 1) if seconds else None,
+            'latency_ms': {'p50': percentile(latencies, 0.5), 'p95': percentile(latencies, 0.95),
+                           'p99': percentile(latencies, 0.99), 'max': percentile(latencies, 1)},
+            'statuses': dict(sorted(statuses.items()))}
+
+
+def run(client: tp.Any, scenario: tp.Generator, concurrency: int, record: tp.Optional[tp.TextIO]):
+    summaries = []
+    responses = None
+    while True:
+        try:
+            phase, endpoint, requests = scenario.send(responses)
+        except StopIteration:
+            return summaries
+        if record is not None:
+            for request in requests:
+                record.write(json.dumps({'phase': phase, 'endpoint': endpoint, 'method': request.method,
+                                         'path': request.path, 'content_type': request.content_type,
+                                         'body': request.body.decode() if request.body is not None else None,
+                                         'items': request.items}) + '\n')
+        results, seconds = run_phase(client, requests, concurrency)
+        summary = summarize(phase, endpoint, requests, results, seconds)
+        summaries.append(summary)
+        print(f'{phase:<20} c={concurrency:<3} {summary["requests_per_second"] or 0:9.1f} req/s   '
+              f'p50 {summary["latency_ms"]["p50"] or 0:8.1f} ms   p99 {summary["latency_ms"]["p99"] or 0:8.1f} ms   '
+              f'{summary["statuses"]}', file=sys.stderr)
+        responses = [(request, status, body) for request, (status, body, latency) in zip(requests, results)]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(args: argparse.Namespace):
+    from config import ORDER_SHARDS, STORAGE_BACKEND
+
+    replay = read_recording(args.replay) if args.replay else None
+    record = open(args.record, 'w') if args.record else None
+    report = {'meta': {'revision': git_revision(),
+                       'python': platform.python_version(),
+                       'cpus': os.cpu_count(),
+                       'storage_backend': STORAGE_BACKEND,
+                       'order_shards': ORDER_SHARDS,
+                       'seed': args.seed,
+                       'requests_per_phase': None if replay else args.requests,
+                       'http_workers': args.workers,
+                       'http_threads': args.threads,
+                       'replay': args.replay},
+              'runs': []}
+    try:
+        for mode in args.modes:
+            for size in ([None] if replay else args.sizes):
+                for concurrency in args.concurrency:
+                    print(f'--- {mode}, size {size or "replay"}, concurrency {concurrency}', file=sys.stderr)
+                    scenario = replayed_scenario(replay) if replay else \
+                        generated_scenario(size, args.requests, args.seed)
+                    with tempfile.TemporaryDirectory() as tmp:
+                        client = InProcessClient(tmp) if mode == 'inprocess' else \
+                            HttpClient(tmp, args.workers, args.threads)
+                        try:
+                            phases = run(client, scenario, concurrency, record)
+                        finally:
+                            client.close()
+                    report['runs'].append({'mode': mode, 'size': size, 'concurrency': concurrency,
+                                           'phases': phases})
+                    if record is not None:
+                        record.close()
+                        record = None
+    finally:
+        if record is not None:
+            record.close()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reproducible load test of all API endpoints')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+                        help='couriers and orders in the dataset, e.g. 1000 10000 100000 1000000')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help='parallel clients')
+    parser.add_argument('--modes', nargs='+', choices=['inprocess', 'http'], default=['inprocess', 'http'])
+    parser.add_argument('--requests', type=int, default=500, help='requests per phase after loading the data')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers in http mode')
+    parser.add_argument('--threads', type=int, default=16, help='gunicorn threads per worker in http mode')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record', help='save the requests of the first run as JSONL')
+    group.add_argument('--replay', help='replay requests saved with --record instead of generating them')
+    main(parser.parse_args())
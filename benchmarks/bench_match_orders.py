@@ -0,0 +1,26 @@
+"""
+Микробенчмарк сопоставления интервалов заказов с рабочими часами курьера: python против numpy
+
+Запуск из корня проекта: python -m benchmarks.bench_match_orders [размер ...]
+"""
+import sys
+import timeit
+
+from app.utils import *
+from tests.utils_for_test import *
+
+
+def main(sizes):
+    intervals = parse_hours([generate_delivery_hours() for _ in range(3)])
+    for size in sizes:
+        rows = [(order_id, *parse_hours([generate_delivery_hours()])[0]) for order_id in range(size)]
+        result = {}
+        for name, matcher in [('python', match_orders_by_hours_python), ('numpy', match_orders_by_hours_numpy)]:
+            number = max(1, 100000 // size)
+            result[name] = min(timeit.repeat(lambda: matcher(intervals, rows), number=number, repeat=5)) / number
+        print(f'n={size:<8} python: {result["python"] * 1000:9.3f} ms   numpy: {result["numpy"] * 1000:9.3f} ms   '
+              f'x{result["python"] / result["numpy"]:.1f}')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000, 50000])
@@ -0,0 +1,70 @@
+"""
+Бенчмарк назначения заказов (POST /orders/assign): SQL-хранилище против хранилища в памяти с журналом.
+Сначала база заполняется заказами и все они разбираются курьерами, потом в установившемся режиме
+перед каждым назначением приходит несколько новых заказов. Замеряется только назначение
+
+Запуск из корня проекта: python -m benchmarks.bench_memory_assign [число курьеров] [число заказов]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from app.data import init_db, Order, Courier
+from app.memory import init_memory
+from tests.utils_for_test import *
+
+
+def generate(num_couriers: int, num_orders: int):
+    random.seed(0)
+    couriers = [create_courier_dict(i, generate_courier_type(), generate_set_of_regions(), [generate_delivery_hours()])
+                for i in range(num_couriers)]
+    orders = [create_order_dict(i, generate_weight(), generate_region(), [generate_delivery_hours()])
+              for i in range(num_orders)]
+    return couriers, orders
+
+
+def measure(courier_storage, order_storage, num_couriers: int, steps: int = 2000, new_orders: int = 5):
+    for courier_id in range(num_couriers):
+        order_storage.orders_for_courier(courier_storage.get_profile(courier_id))
+    random.seed(1)
+    next_order_id = 10 ** 7
+    latencies = []
+    assigned = 0
+    for _ in range(steps):
+        order_storage.add([create_order_dict(order_id, generate_weight(), generate_region(),
+                                             [generate_delivery_hours()])
+                           for order_id in range(next_order_id, next_order_id + new_orders)])
+        next_order_id += new_orders
+        courier = courier_storage.get_profile(random.randrange(num_couriers))
+        start = time.perf_counter()
+        matching_orders, assign_time = order_storage.orders_for_courier(courier)
+        latencies.append(time.perf_counter() - start)
+        assigned += len(matching_orders)
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000, assigned
+
+
+def main(num_couriers: int, num_orders: int):
+    courier_data, order_data = generate(num_couriers, num_orders)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, orders, couriers = init_db('sqlite:///' + os.path.join(tmp, 'bench.db'))
+        courier_storage, order_storage = Courier(engine, couriers), Order(engine, orders)
+        courier_storage.add(courier_data)
+        order_storage.add(order_data)
+        results = [('sql', measure(courier_storage, order_storage, num_couriers))]
+        engine.dispose()
+
+        for fsync in (False, True):
+            courier_storage, order_storage = init_memory(os.path.join(tmp, f'memory_{fsync}'), fsync=fsync)
+            courier_storage.add(courier_data)
+            order_storage.add(order_data)
+            results.append((f'memory fsync={fsync}', measure(courier_storage, order_storage, num_couriers)))
+            order_storage.store.close()
+
+    for name, (p50, p99, assigned) in results:
+        print(f'{name:>19}: p50 {p50:7.3f} ms   p99 {p99:7.3f} ms   {assigned} orders assigned')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3])) if len(sys.argv) > 2 else main(300, 20000)
@@ -0,0 +1,66 @@
+"""
+Пиковая память (RSS) при загрузке заказов: POST /orders одним json против потоковой загрузки POST /orders/stream
+
+Каждый режим запускается в отдельном процессе со своей базой.
+Запуск из корня проекта: python -m benchmarks.bench_ndjson_ingest [число заказов]
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from tests.utils_for_test import *
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_ndjson(path: str, size: int):
+    random.seed(0)
+    with open(path, 'w') as f:
+        for i in range(size):
+            f.write(json.dumps(create_order_dict(i, generate_weight(), generate_region(),
+                                                 [generate_delivery_hours()])) + '\n')
+
+
+def child(mode: str, path: str):
+    """
+    Выполняется в отдельном процессе: загружает файл в приложение через тестовый клиент
+    """
+    from app import app
+    client = app.test_client()
+    start = time.perf_counter()
+    if mode == 'ndjson':
+        with open(path, 'rb') as f:
+            response = client.post('/orders/stream', input_stream=f, content_length=os.path.getsize(path),
+                                   content_type='application/x-ndjson')
+        accepted = response.get_json()['accepted']
+    else:
+        with open(path) as f:
+            data = [json.loads(line) for line in f]
+        response = client.post('/orders', json={'data': data})
+        accepted = len(response.get_json()['orders'])
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'mode': mode, 'accepted': accepted, 'seconds': round(elapsed, 2),
+                      'peak_rss_mb': round(peak_rss, 1)}))
+
+
+def main(size: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'orders.ndjson')
+        write_ndjson(path, size)
+        for mode in ['json', 'ndjson']:
+            workdir = os.path.join(tmp, mode)
+            os.mkdir(workdir)
+            subprocess.run([sys.executable, '-m', 'benchmarks.bench_ndjson_ingest', '--child', mode, path],
+                           cwd=workdir, env=dict(os.environ, PYTHONPATH=ROOT), check=True)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(*sys.argv[2:4])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
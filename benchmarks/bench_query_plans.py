@@ -0,0 +1,62 @@
+"""
+Планы и время запросов заказов до и после создания индексов
+
+Запуск из корня проекта: python -m benchmarks.bench_query_plans [число заказов]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+import sqlalchemy as db
+
+from app.data import init_db, Order
+from tests.utils_for_test import *
+
+
+def explain(engine, select):
+    sql = str(select.compile(engine, compile_kwargs={'literal_binds': True}))
+    return '; '.join(row[-1] for row in engine.execute('EXPLAIN QUERY PLAN ' + sql))
+
+
+def timed(engine, select, repeat: int = 20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        with engine.connect() as con:
+            con.execute(select).fetchall()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(size: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, orders, couriers = init_db('sqlite:///' + os.path.join(tmp, 'bench.db'))
+        storage = Order(engine, orders)
+        storage.add([create_order_dict(i, generate_weight(), generate_region(), [generate_delivery_hours()])
+                     for i in range(size)])
+        # Большая часть заказов уже назначена и выполнена, как в живой базе
+        with engine.begin() as con:
+            con.execute(orders.update()
+                        .where(orders.columns.order_id < size * 0.9)
+                        .values(courier_id=orders.columns.order_id % 1000, complete=True))
+        queries = {
+            'orders_for_courier': storage.select_candidates(random.sample(REGION_RANGE, 3), 15),
+            'courier_orders': db.select(orders).where(orders.columns.courier_id == 7),
+            'courier_orders_completed': db.select(orders).where(orders.columns.courier_id == 7,
+                                                                orders.columns.complete == True),
+        }
+        indexes = [index for index in orders.indexes if index.name.startswith('ix_orders')]
+        for index in indexes:
+            index.drop(engine)
+        for stage in ['before', 'after']:
+            if stage == 'after':
+                for index in indexes:
+                    index.create(engine)
+            engine.execute('ANALYZE')
+            for name, select in queries.items():
+                print(f'{stage:>6} {name:<26} {timed(engine, select):8.2f} ms  {explain(engine, select)}')
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
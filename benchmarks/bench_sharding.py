@@ -0,0 +1,78 @@
+"""
+Бенчмарк шардирования заказов по региону: несколько процессов (как воркеры gunicorn) одновременно
+загружают заказы и назначают их курьерам, число шардов - от 1 до N
+
+Запуск из корня проекта: python -m benchmarks.bench_sharding [процессов] [секунд] [шардов ...]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from app.data import Courier
+from app.sharding import init_sharded
+from tests.utils_for_test import *
+
+NUM_COURIERS = 200
+ORDERS_PER_STEP = 10
+
+
+def open_storage(tmp: str, num_shards: int):
+    engine, orders, couriers = init_sharded('sqlite:///' + os.path.join(tmp, 'main.db'),
+                                            'sqlite:///' + os.path.join(tmp, 'shard{}.db'), num_shards, 'wal')
+    return engine, orders, Courier(engine, couriers)
+
+
+def prepare(tmp: str, num_shards: int):
+    engine, orders, couriers = open_storage(tmp, num_shards)
+    random.seed(0)
+    # Курьер работает в одном регионе, как обычно и бывает в доставке
+    couriers.add([create_courier_dict(i, generate_courier_type(), [generate_region()], [generate_delivery_hours()])
+                  for i in range(NUM_COURIERS)])
+    engine.dispose()
+
+
+def worker(tmp: str, num_shards: int, worker_id: int, duration: float, queue):
+    engine, orders, couriers = open_storage(tmp, num_shards)
+    random.seed(worker_id)
+    next_order_id = (worker_id + 1) * 10 ** 7
+    steps = 0
+    assigned = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        orders.add([create_order_dict(order_id, generate_weight(), generate_region(), [generate_delivery_hours()])
+                    for order_id in range(next_order_id, next_order_id + ORDERS_PER_STEP)])
+        next_order_id += ORDERS_PER_STEP
+        assigned += len(orders.orders_for_courier(couriers.get_profile(random.randrange(NUM_COURIERS)))[0])
+        steps += 1
+    queue.put((steps, assigned))
+
+
+def run(num_shards: int, processes: int, duration: float):
+    with tempfile.TemporaryDirectory() as tmp:
+        prepare(tmp, num_shards)
+        queue = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=worker, args=(tmp, num_shards, i, duration, queue))
+                   for i in range(processes)]
+        for process in workers:
+            process.start()
+        results = [queue.get() for _ in workers]
+        for process in workers:
+            process.join()
+    return sum(steps for steps, assigned in results), sum(assigned for steps, assigned in results)
+
+
+def main(processes: int, duration: float, shard_counts):
+    base = None
+    for num_shards in shard_counts:
+        steps, assigned = run(num_shards, processes, duration)
+        base = base or steps
+        print(f'shards={num_shards:<3} {steps / duration:>8.0f} steps/s (load + assign)   '
+              f'{assigned / duration:>8.0f} orders assigned/s   x{steps / base:.2f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count(),
+         float(sys.argv[2]) if len(sys.argv) > 2 else 5,
+         [int(arg) for arg in sys.argv[3:]] or [1, 2, 4, 8])
@@ -0,0 +1,56 @@
+"""
+Бенчмарк старта воркера: время от импорта приложения до ответа на первый запрос, в отдельном процессе на каждый
+замер. Сравниваются новая база (схема создается при первом запросе), уже созданная база с проверкой схемы
+(AUTO_MIGRATE=1) и база после отдельного шага flask migrate (AUTO_MIGRATE=0)
+
+Запуск из корня проекта: python -m benchmarks.bench_startup [повторов]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+CHILD = '''
+import json, time
+start = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+client = app.test_client()
+assert client.get('/couriers/1').status_code == 404
+first = time.perf_counter()
+client.get('/couriers/1')
+second = time.perf_counter()
+print(json.dumps([imported - start, first - imported, second - first]))
+'''
+
+
+def measure(env: dict, cwd: str):
+    output = subprocess.run([sys.executable, '-c', CHILD], env=env, cwd=cwd, check=True, capture_output=True).stdout
+    return json.loads(output)
+
+
+def main(repeats: int):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'startup.db')
+        env = dict(os.environ, PYTHONPATH=root, DATABASE_URI='sqlite:///' + database, STORAGE_BACKEND='sql',
+                   ORDER_SHARDS='1')
+        results = {'new database': [], 'AUTO_MIGRATE=1': [], 'AUTO_MIGRATE=0': []}
+        for _ in range(repeats):
+            for path in (database, database + '-wal', database + '-shm'):
+                if os.path.exists(path):
+                    os.remove(path)
+            results['new database'].append(measure(dict(env, AUTO_MIGRATE='1'), tmp))
+            results['AUTO_MIGRATE=1'].append(measure(dict(env, AUTO_MIGRATE='1'), tmp))
+            results['AUTO_MIGRATE=0'].append(measure(dict(env, AUTO_MIGRATE='0'), tmp))
+
+    for name, samples in results.items():
+        imported, first, second = (statistics.median(values) * 1000 for values in zip(*samples))
+        print(f'{name:>15}: import {imported:6.1f} ms   first request {first:6.1f} ms   '
+              f'next request {second:5.1f} ms   import to first response {imported + first:6.1f} ms')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,93 @@
+"""
+Бенчмарк профилей хранилища (STORAGE_PROFILES): смешанная нагрузка чтения и записи
+из нескольких процессов, как у нескольких воркеров gunicorn на одной базе
+
+Запуск из корня проекта: python -m benchmarks.bench_storage_profiles [процессов] [секунд] [профиль ...]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import sqlalchemy as db
+
+from app.data import init_db, Order, Courier
+from config import STORAGE_PROFILES
+from tests.utils_for_test import *
+
+NUM_COURIERS = 200
+ORDERS_PER_WRITE = 20
+
+
+def prepare(database_uri: str, profile: str):
+    engine, orders, couriers = init_db(database_uri, profile)
+    random.seed(0)
+    Courier(engine, couriers).add([create_courier_dict(i, generate_courier_type(), generate_set_of_regions(),
+                                                       [generate_delivery_hours()])
+                                   for i in range(NUM_COURIERS)])
+    engine.dispose()
+
+
+def worker(database_uri: str, profile: str, worker_id: int, duration: float, queue):
+    """
+    Каждая третья операция - запись (загрузка пачки заказов и назначение их курьеру), остальные - чтение
+    (профиль курьера и его статистика). Считает выполненные операции и ошибки блокировки базы
+    """
+    engine, orders, couriers = init_db(database_uri, profile)
+    order_storage, courier_storage = Order(engine, orders), Courier(engine, couriers)
+    random.seed(worker_id)
+    next_order_id = (worker_id + 1) * 10 ** 7
+    result = {'reads': 0, 'writes': 0, 'locked': 0}
+    deadline = time.perf_counter() + duration
+    step = 0
+    while time.perf_counter() < deadline:
+        step += 1
+        courier_id = random.randrange(NUM_COURIERS)
+        try:
+            if step % 3 == 0:
+                order_storage.add([create_order_dict(order_id, generate_weight(), generate_region(),
+                                                     [generate_delivery_hours()])
+                                   for order_id in range(next_order_id, next_order_id + ORDERS_PER_WRITE)])
+                next_order_id += ORDERS_PER_WRITE
+                order_storage.orders_for_courier(courier_storage.get_profile(courier_id))
+                result['writes'] += 1
+            else:
+                courier_storage.get_profile(courier_id)
+                order_storage.get_courier_stats(courier_id)
+                result['reads'] += 1
+        except db.exc.OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            result['locked'] += 1
+    engine.dispose()
+    queue.put(result)
+
+
+def run(profile: str, processes: int, duration: float):
+    with tempfile.TemporaryDirectory() as tmp:
+        database_uri = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        prepare(database_uri, profile)
+        queue = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=worker, args=(database_uri, profile, i, duration, queue))
+                   for i in range(processes)]
+        for process in workers:
+            process.start()
+        results = [queue.get() for _ in workers]
+        for process in workers:
+            process.join()
+    return {key: sum(result[key] for result in results) for key in results[0]}
+
+
+def main(processes: int, duration: float, profiles):
+    for profile in profiles:
+        result = run(profile, processes, duration)
+        print(f'{profile:>12}: {(result["reads"] + result["writes"]) / duration:>8.0f} ops/s   '
+              f'reads: {result["reads"] / duration:>8.0f}/s   writes: {result["writes"] / duration:>6.0f}/s   '
+              f'database is locked: {result["locked"]}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 4,
+         float(sys.argv[2]) if len(sys.argv) > 2 else 5,
+         sys.argv[3:] or list(STORAGE_PROFILES))
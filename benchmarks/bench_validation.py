@@ -0,0 +1,71 @@
+"""
+Микробенчмарк валидации входных данных: прежняя проверка (validate_keys + re.match на каждый интервал)
+против плоских проверок из app.validation
+
+Запуск из корня проекта: python -m benchmarks.bench_validation [размер]
+"""
+import re
+import sys
+import timeit
+
+from app.utils import validate_keys, is_valid_weight, is_valid_type
+from app.validation import validate_order, validate_courier, find_invalid
+from tests.utils_for_test import *
+
+
+def legacy_order(data: dict):
+    if not isinstance(data['order_id'], int):
+        raise ValueError
+    if not is_valid_weight(data['weight']):
+        raise ValueError
+    if not isinstance(data['region'], int):
+        raise ValueError
+    for w_hour in data['delivery_hours']:
+        if not re.match('(0[0-9]|1[0-9]|2[0-3]):[0-5][0-9]-(0[0-9]|1[0-9]|2[0-3]):[0-5][0-9]', w_hour):
+            raise ValueError
+
+
+def legacy_courier(data: dict):
+    if not isinstance(data['courier_id'], int):
+        raise ValueError
+    if not is_valid_type(data['courier_type']):
+        raise ValueError
+    for region in data['regions']:
+        if not isinstance(region, int):
+            raise ValueError
+    for w_hour in data['working_hours']:
+        if not re.match('(0[0-9]|1[0-9]|2[0-3]):[0-5][0-9]-(0[0-9]|1[0-9]|2[0-3]):[0-5][0-9]', w_hour):
+            raise ValueError
+
+
+def legacy_find_invalid(data, validate_data, valid_cols, id_col):
+    exceptions = []
+    for elem in data:
+        try:
+            validate_keys(valid_cols, elem)
+            validate_data(elem)
+        except (KeyError, ValueError):
+            exceptions.append(elem[id_col])
+    return exceptions
+
+
+def main(size: int):
+    orders = [create_order_dict(i, generate_weight(), generate_region(),
+                                [generate_delivery_hours() for _ in range(3)]) for i in range(size)]
+    couriers = [create_courier_dict(i, generate_courier_type(), generate_set_of_regions(),
+                                    [generate_delivery_hours() for _ in range(3)]) for i in range(size)]
+    cases = [
+        ('orders', lambda: legacy_find_invalid(orders, legacy_order, list(orders[0]), 'order_id'),
+         lambda: find_invalid(orders, validate_order, 'order_id')),
+        ('couriers', lambda: legacy_find_invalid(couriers, legacy_courier, list(couriers[0]), 'courier_id'),
+         lambda: find_invalid(couriers, validate_courier, 'courier_id')),
+    ]
+    for name, legacy, current in cases:
+        legacy_time = min(timeit.repeat(legacy, number=1, repeat=5))
+        current_time = min(timeit.repeat(current, number=1, repeat=5))
+        print(f'{name:<9} n={size}  legacy: {size / legacy_time:>10.0f} items/s   '
+              f'current: {size / current_time:>10.0f} items/s   x{legacy_time / current_time:.1f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
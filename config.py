@@ -1 +1,117 @@
-DATABASE_URI = 'sqlite:///slasti.db'
+import os
+
+DATABASE_URI = os.environ.get('DATABASE_URI', 'sqlite:///slasti.db')
+# Создавать и обновлять схему базы при первом обращении к хранилищу в процессе. При выключенном схему создает
+# отдельный шаг перед запуском: FLASK_APP=app flask migrate
+AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', '1') == '1'
+
+# Профили настройки хранилища. pragmas выполняются на каждом новом подключении к SQLite,
+# pool - параметры пула подключений SQLAlchemy (без него для файла SQLite каждый раз открывается новое подключение)
+STORAGE_PROFILES = {
+    # Настройки SQLite по умолчанию: rollback journal, одно подключение на запрос
+    'default': {},
+    # WAL: читатели не блокируют писателя, писатели из разных воркеров ждут друг друга, а не падают
+    'wal': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 10000,
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64 * 1024,
+            'temp_store': 'MEMORY',
+        },
+        'pool': {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30, 'pool_pre_ping': False},
+    },
+    # То же, но каждый коммит сразу сбрасывается на диск
+    'wal_durable': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'FULL',
+            'busy_timeout': 10000,
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64 * 1024,
+            'temp_store': 'MEMORY',
+        },
+        'pool': {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30, 'pool_pre_ping': False},
+    },
+}
+STORAGE_PROFILE = os.environ.get('STORAGE_PROFILE', 'wal')
+
+# Шардирование заказов по региону (app/sharding.py): число файлов базы для заказов, 1 - без шардирования.
+# SHARD_DATABASE_URI - шаблон адреса базы шарда, {} заменяется на номер
+ORDER_SHARDS = int(os.environ.get('ORDER_SHARDS', 1))
+SHARD_DATABASE_URI = os.environ.get('SHARD_DATABASE_URI', 'sqlite:///slasti_shard{}.db')
+
+# Где хранить заказы и курьеров: sql - база DATABASE_URI (app/data.py),
+# memory - в памяти процесса с журналом на диске (app/memory.py), только один воркер
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sql')
+# Каталог журнала и снимков хранилища в памяти
+MEMORY_DATA_DIR = os.environ.get('MEMORY_DATA_DIR', 'memory_store')
+# fsync журнала после каждой транзакции. Без него запись переживает падение процесса, но не питания
+MEMORY_WAL_FSYNC = os.environ.get('MEMORY_WAL_FSYNC', '1') == '1'
+# Через сколько транзакций сохранять снимок состояния и обнулять журнал
+MEMORY_SNAPSHOT_EVERY = 10000
+
+# Сколько строк потоковой загрузки заказов (POST /orders/stream) валидируется и записывается за раз
+INGEST_CHUNK_SIZE = 1000
+# Сколько отклоненных элементов перечислять в ответе потоковой загрузки
+INGEST_MAX_REPORTED_ERRORS = 1000
+
+# Сколько профилей курьеров держать в кэше каждого процесса
+COURIER_CACHE_SIZE = 10000
+
+# Сколько айди передавать в один IN (...): у SQLite есть ограничение на число параметров запроса
+SQL_CHUNK_SIZE = 500
+
+# Ответы на POST /couriers и POST /orders с заголовком Idempotency-Key (app/idempotency.py): сколько хранить
+# в каждом процессе и сколько секунд повтор с тем же ключом получает сохраненный ответ
+IDEMPOTENCY_CACHE_SIZE = 10000
+IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60
+
+# Бюджет потоков воркера (gunicorn --threads 16 в start.sh). Назначение через очередь и ожидание ленты держат
+# поток воркера, поэтому ASSIGN_QUEUE_SIZE + FEED_MAX_WAITERS должно быть меньше --threads: тогда сверх лимитов
+# запросы сразу получают 429, а остальным эндпоинтам остаются свободные потоки (по умолчанию 6 + 6 из 16).
+# Если менять --threads, эти два лимита меняются вместе с ним
+
+# Очередь назначений POST /orders/assign в каждом процессе (app/admission.py): запросы, пришедшие, пока
+# выполняется предыдущая пачка, назначаются следующей пачкой одним проходом по свободным заказам.
+# Больше ASSIGN_QUEUE_SIZE запросов в очереди и в выполняемой пачке вместе - ответ 429 с Retry-After.
+# 0 - без очереди, каждый запрос назначается сам
+ASSIGN_QUEUE_SIZE = int(os.environ.get('ASSIGN_QUEUE_SIZE', 6))
+ASSIGN_BATCH_SIZE = 64
+ASSIGN_RETRY_AFTER_SECONDS = 1
+
+# Лента свободных заказов GET /couriers/<id>/feed (app/feed.py): как часто воркер с ожидающими курьерами
+# читает новые события из базы, сколько держит ожидание ответа по умолчанию и максимум, сколько событий хранить.
+# Больше FEED_MAX_WAITERS ожиданий в процессе - 429 (см. бюджет потоков выше)
+FEED_POLL_SECONDS = 0.2
+FEED_TIMEOUT_DEFAULT = 25
+FEED_TIMEOUT_MAX = 60
+FEED_EVENTS_KEEP = 10000
+FEED_MAX_WAITERS = int(os.environ.get('FEED_MAX_WAITERS', 6))
+FEED_RETRY_AFTER_SECONDS = 1
+
+# Границы корзин гистограммы времени ответа в /metrics, секунды
+METRICS_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# Профилирование запросов (app/profiling.py), по умолчанию выключено.
+# Доля запросов, которые целиком профилируются cProfile
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+# Запросы дольше стольких секунд сохраняются со стеками от семплирующего профилировщика, 0 - выключено
+PROFILE_SLOW_SECONDS = float(os.environ.get('PROFILE_SLOW_SECONDS', 0))
+# Куда писать профили
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+
+# JSON для запросов и ответов API (app/json_backend.py): auto - orjson, если установлен, иначе стандартный json;
+# orjson - только orjson; stdlib - только стандартный json
+JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto')
+
+# Архивация выполненных заказов из orders в orders_archive: когда в orders накопится столько выполненных заказов,
+# они переносятся в архив (0 - только командой flask archive-orders). Порог проверяется раз в ARCHIVE_CHECK_EVERY
+# выполненных заказов в каждом воркере
+ARCHIVE_THRESHOLD = int(os.environ.get('ARCHIVE_THRESHOLD', 10000))
+ARCHIVE_CHECK_EVERY = 1000
+
+# Размер страницы истории заказов курьера (GET /couriers/<id>/orders): по умолчанию и максимальный
+ORDER_PAGE_SIZE_DEFAULT = 100
+ORDER_PAGE_SIZE_MAX = 1000
@@ -1 +1,2 @@
-sudo venv/bin/gunicorn --bind 0.0.0.0:8080 app:app
\ No newline at end of file
+sudo env FLASK_APP=app venv/bin/flask migrate
+sudo env AUTO_MIGRATE=0 venv/bin/gunicorn --preload --threads 16 --bind 0.0.0.0:8080 app:app
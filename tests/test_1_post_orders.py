@@ -35,3 +35,21 @@ def test_basic():
     assert response.json() == {"orders": [{"id": i} for i in range(10)]}
 
 
+def test_duplicate_in_batch():
+    response = requests.post("http://0.0.0.0:8080/orders",
+                             json = {"data": [
+                                 create_order_dict(i, generate_weight(), generate_region(), [generate_delivery_hours()])
+                                 for i in [100, 101, 101]
+                             ]})
+    assert response.status_code == 400
+    assert response.json() == {"validation_error": {
+            "orders": [{"id": 101}]
+        }}
+    # Nothing from the failed batch is written
+    response = requests.post("http://0.0.0.0:8080/orders",
+                             json = {"data": [
+                                 create_order_dict(i, generate_weight(), generate_region(), [generate_delivery_hours()])
+                                 for i in [100, 101]
+                             ]})
+    assert response.status_code == 201
+    assert response.json() == {"orders": [{"id": i} for i in [100, 101]]}
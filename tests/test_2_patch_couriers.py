@@ -20,3 +20,19 @@ def test_basic():
     assert response.status_code == 200 
     assert response.json()['courier_type'] == 'car'
 
+def test_arrays():
+    response = requests.patch('http://0.0.0.0:8080/couriers/0',
+                              json = {'regions': [1, 2], 'working_hours': ['09:00-18:00']})
+    assert response.status_code == 200
+    assert response.json() == {'courier_id': 0, 'courier_type': 'car',
+                               'regions': [1, 2], 'working_hours': ['09:00-18:00']}
+    response = requests.get('http://0.0.0.0:8080/couriers/0')
+    assert response.json()['regions'] == [1, 2]
+    assert response.json()['working_hours'] == ['09:00-18:00']
+
+
+def test_not_found():
+    response = requests.patch('http://0.0.0.0:8080/couriers/100500',
+                              json = {'courier_type': 'car'})
+    assert response.status_code == 404
+    assert requests.get('http://0.0.0.0:8080/couriers/100500').status_code == 404
@@ -0,0 +1,61 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from tests.utils_for_test import *
+
+
+def test_hours_matching():
+    response = requests.post("http://0.0.0.0:8080/couriers",
+                             json={"data": [
+                                 create_courier_dict(200, 'car', [50], ['09:00-12:00'])
+                             ]})
+    assert response.status_code == 201
+    response = requests.post("http://0.0.0.0:8080/orders",
+                             json={"data": [
+                                 create_order_dict(200, 1, 50, ['11:00-13:00']),
+                                 create_order_dict(201, 1, 50, ['12:00-14:00']),
+                                 create_order_dict(202, 1, 50, ['08:00-09:30', '20:00-21:00']),
+                                 create_order_dict(203, 1, 51, ['09:00-12:00']),
+                             ]})
+    assert response.status_code == 201
+
+    response = requests.post("http://0.0.0.0:8080/orders/assign",
+                             json={"courier_id": 200})
+    assert response.status_code == 200
+    assert response.json()['orders'] == [{"id": 200}, {"id": 202}]
+    assert 'assign_time' in response.json()
+
+    # Already assigned orders are not handed out again
+    response = requests.post("http://0.0.0.0:8080/orders/assign",
+                             json={"courier_id": 200})
+    assert response.status_code == 200
+    assert response.json() == {'orders': []}
+
+
+def test_concurrent_assign():
+    courier_ids = list(range(400, 420))
+    order_ids = list(range(400, 700))
+    response = requests.post("http://0.0.0.0:8080/couriers",
+                             json={"data": [
+                                 create_courier_dict(i, 'car', [70], ['00:00-23:59']) for i in courier_ids
+                             ]})
+    assert response.status_code == 201
+    response = requests.post("http://0.0.0.0:8080/orders",
+                             json={"data": [
+                                 create_order_dict(i, 1, 70, ['10:00-12:00']) for i in order_ids
+                             ]})
+    assert response.status_code == 201
+
+    def assign(courier_id):
+        response = requests.post("http://0.0.0.0:8080/orders/assign", json={"courier_id": courier_id})
+        # Over the admission limit the request is shed with 429, a client retries it
+        while response.status_code == 429:
+            time.sleep(0.05)
+            response = requests.post("http://0.0.0.0:8080/orders/assign", json={"courier_id": courier_id})
+        assert response.status_code == 200
+        return [order['id'] for order in response.json()['orders']]
+
+    with ThreadPoolExecutor(max_workers=len(courier_ids)) as executor:
+        assigned = [order_id for orders in executor.map(assign, courier_ids * 3) for order_id in orders]
+    assert sorted(assigned) == order_ids
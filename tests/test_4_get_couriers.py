@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+import iso8601
+import requests
+from tests.utils_for_test import *
+
+
+def test_earnings_and_rating():
+    response = requests.post("http://0.0.0.0:8080/couriers",
+                             json={"data": [
+                                 create_courier_dict(300, 'foot', [60, 61], ['00:00-23:59'])
+                             ]})
+    assert response.status_code == 201
+    response = requests.post("http://0.0.0.0:8080/orders",
+                             json={"data": [
+                                 create_order_dict(300, 1, 60, ['10:00-12:00']),
+                                 create_order_dict(301, 1, 61, ['10:00-12:00']),
+                             ]})
+    assert response.status_code == 201
+
+    response = requests.get("http://0.0.0.0:8080/couriers/300")
+    assert response.json()['earnings'] == 0
+    assert 'rating' not in response.json()
+
+    response = requests.post("http://0.0.0.0:8080/orders/assign", json={"courier_id": 300})
+    assign_time = iso8601.parse_date(response.json()['assign_time'])
+    for order_id, minutes in [(300, 20), (301, 50)]:
+        response = requests.post("http://0.0.0.0:8080/orders/complete",
+                                 json={"courier_id": 300, "order_id": order_id,
+                                       "complete_time": (assign_time + timedelta(minutes=minutes)).isoformat()})
+        assert response.status_code == 200
+
+    response = requests.get("http://0.0.0.0:8080/couriers/300")
+    assert response.status_code == 200
+    assert response.json()['earnings'] == 2 * 2 * 500
+    # Fastest delivery is the first one: 20 minutes
+    assert round(response.json()['rating'], 2) == round(5 * (60 - 20) / 60, 2)
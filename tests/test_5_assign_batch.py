@@ -0,0 +1,47 @@
+import requests
+from tests.utils_for_test import *
+
+
+def test_unknown_courier():
+    response = requests.post("http://0.0.0.0:8080/orders/assign/batch",
+                             json={"courier_ids": [0, 100500]})
+    assert response.status_code == 400
+    assert response.json() == {"validation_error": {
+        "couriers": [{"id": 100500}]
+    }}
+
+
+def test_wrong_courier_ids():
+    for courier_ids in [5, [[1]], [{"id": 1}], ["1"], [True], None]:
+        response = requests.post("http://0.0.0.0:8080/orders/assign/batch", json={"courier_ids": courier_ids})
+        assert response.status_code == 400
+        assert 'validation_error' in response.json()
+
+
+def test_capacity():
+    response = requests.post("http://0.0.0.0:8080/couriers",
+                             json={"data": [
+                                 create_courier_dict(500, 'foot', [80], ['09:00-18:00']),
+                                 create_courier_dict(501, 'bike', [80, 81], ['09:00-18:00']),
+                                 create_courier_dict(502, 'car', [82], ['09:00-18:00']),
+                             ]})
+    assert response.status_code == 201
+    response = requests.post("http://0.0.0.0:8080/orders",
+                             json={"data": [
+                                 create_order_dict(800, 6, 80, ['10:00-12:00']),
+                                 create_order_dict(801, 6, 80, ['10:00-12:00']),
+                                 create_order_dict(802, 6, 80, ['10:00-12:00']),
+                                 create_order_dict(803, 9, 81, ['10:00-12:00']),
+                                 create_order_dict(804, 1, 80, ['20:00-21:00']),
+                             ]})
+    assert response.status_code == 201
+
+    response = requests.post("http://0.0.0.0:8080/orders/assign/batch",
+                             json={"courier_ids": [500, 501, 502]})
+    assert response.status_code == 200
+    couriers = response.json()['couriers']
+    assert [courier['courier_id'] for courier in couriers] == [500, 501, 502]
+    assert couriers[0]['orders'] == [{'id': 800}]
+    assert couriers[1]['orders'] == [{'id': 801}, {'id': 802}]
+    assert couriers[2] == {'courier_id': 502, 'orders': []}
+    assert couriers[0]['assign_time'] == couriers[1]['assign_time']
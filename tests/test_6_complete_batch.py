@@ -0,0 +1,75 @@
+import requests
+from tests.utils_for_test import *
+
+
+def test_basic():
+    response = requests.post("http://0.0.0.0:8080/couriers",
+                             json={"data": [
+                                 create_courier_dict(600, 'bike', [90], ['00:00-23:59']),
+                             ]})
+    assert response.status_code == 201
+    response = requests.post("http://0.0.0.0:8080/orders",
+                             json={"data": [
+                                 create_order_dict(i, 1, 90, ['10:00-12:00']) for i in range(900, 903)
+                             ]})
+    assert response.status_code == 201
+    response = requests.post("http://0.0.0.0:8080/orders/assign", json={"courier_id": 600})
+    assert [order['id'] for order in response.json()['orders']] == [900, 901, 902]
+
+    complete_time = '2099-01-10T10:33:01.42Z'
+    response = requests.post("http://0.0.0.0:8080/orders/complete/batch",
+                             json={"data": [
+                                 {"order_id": 900, "courier_id": 600, "complete_time": complete_time},
+                                 {"order_id": 901, "courier_id": 601, "complete_time": complete_time},
+                                 {"order_id": 902, "courier_id": 600},
+                                 {"order_id": 900, "courier_id": 600, "complete_time": complete_time},
+                                 {"order_id": 100500, "courier_id": 600, "complete_time": complete_time},
+                             ]})
+    assert response.status_code == 200
+    assert response.json() == {"orders": [
+        {"id": 900, "status": "completed"},
+        {"id": 901, "validation_error": {"reason": "Courier was not assigned"}},
+        {"id": 902, "validation_error": {"reason": "Missing data"}},
+        {"id": 900, "validation_error": {"reason": "Duplicate order"}},
+        {"id": 100500, "validation_error": {"reason": "Courier was not assigned"}},
+    ]}
+
+    response = requests.get("http://0.0.0.0:8080/couriers/600")
+    assert response.json()['earnings'] == 5 * 500
+    assert 'rating' in response.json()
+
+
+def test_no_data():
+    response = requests.post("http://0.0.0.0:8080/orders/complete/batch", json={"orders": []})
+    assert response.status_code == 400
+
+
+def test_wrong_id_types():
+    complete_time = '2099-01-10T10:33:01.42Z'
+    response = requests.post("http://0.0.0.0:8080/orders/complete/batch",
+                             json={"data": [
+                                 {"order_id": [1], "courier_id": 600, "complete_time": complete_time},
+                                 {"order_id": 1, "courier_id": {"id": 600}, "complete_time": complete_time},
+                                 {"order_id": "1", "courier_id": 600, "complete_time": complete_time},
+                                 {"order_id": 1, "courier_id": True, "complete_time": complete_time},
+                                 {"order_id": 1, "courier_id": 600, "complete_time": 5},
+                             ]})
+    assert response.status_code == 200
+    assert [order['validation_error']['reason'] for order in response.json()['orders']] == ['Missing data'] * 5
+
+    response = requests.post("http://0.0.0.0:8080/orders/complete",
+                             json={"order_id": [1], "courier_id": 600, "complete_time": complete_time})
+    assert response.status_code == 400
+
+
+def test_wrong_complete_time():
+    # Both endpoints reject a malformed time with the same reason
+    response = requests.post("http://0.0.0.0:8080/orders/complete/batch",
+                             json={"data": [{"order_id": 1, "courier_id": 600, "complete_time": "yesterday"}]})
+    assert response.status_code == 200
+    assert response.json()['orders'][0]['validation_error']['reason'] == 'Missing data'
+
+    response = requests.post("http://0.0.0.0:8080/orders/complete",
+                             json={"order_id": 1, "courier_id": 600, "complete_time": "2021-13-45T10:33:01"})
+    assert response.status_code == 400
+    assert response.json()['validation_error']['reason'] == 'Missing data'
@@ -0,0 +1,31 @@
+import json
+
+import requests
+from tests.utils_for_test import *
+
+
+def test_basic():
+    lines = [json.dumps(create_order_dict(i, generate_weight(), generate_region(), [generate_delivery_hours()]))
+             for i in range(1000, 3500)]
+    response = requests.post("http://0.0.0.0:8080/orders/stream", data="\n".join(lines) + "\n",
+                             headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.json() == {"accepted": 2500, "rejected": 0, "validation_error": {"orders": []}}
+
+
+def test_partial():
+    lines = [json.dumps(create_order_dict(3500, 1, 1, ['10:00-12:00'])),
+             json.dumps(create_order_dict(3501, 100, 1, ['10:00-12:00'])),
+             "not a json",
+             "",
+             json.dumps(create_order_dict(1000, 1, 1, ['10:00-12:00'])),
+             json.dumps(create_order_dict(3500, 1, 1, ['10:00-12:00'])),
+             json.dumps({"weight": 1})]
+    response = requests.post("http://0.0.0.0:8080/orders/stream", data="\n".join(lines),
+                             headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.json()['accepted'] == 1
+    assert response.json()['rejected'] == 5
+    errors = response.json()['validation_error']['orders']
+    assert sorted(errors, key=json.dumps) == \
+        sorted([{"id": 1000}, {"id": 3500}, {"id": 3501}, {"line": 3}, {"line": 7}], key=json.dumps)
@@ -0,0 +1,58 @@
+import requests
+from tests.utils_for_test import *
+
+
+def test_basic():
+    response = requests.post("http://0.0.0.0:8080/couriers",
+                             json={"data": [
+                                 create_courier_dict(700, 'car', [91], ['00:00-23:59']),
+                             ]})
+    assert response.status_code == 201
+    response = requests.post("http://0.0.0.0:8080/orders",
+                             json={"data": [
+                                 create_order_dict(i, 1, 91, ['10:00-12:00']) for i in range(4000, 4005)
+                             ]})
+    assert response.status_code == 201
+    response = requests.post("http://0.0.0.0:8080/orders/assign", json={"courier_id": 700})
+    assert [order['id'] for order in response.json()['orders']] == list(range(4000, 4005))
+    for order_id, minute in [(4003, 1), (4001, 2), (4004, 2)]:
+        response = requests.post("http://0.0.0.0:8080/orders/complete",
+                                 json={"courier_id": 700, "order_id": order_id,
+                                       "complete_time": f'2099-01-10T10:0{minute}:00.00Z'})
+        assert response.status_code == 200
+
+    pages = []
+    cursor = None
+    while True:
+        params = {'limit': 2}
+        if cursor is not None:
+            params['cursor'] = cursor
+        response = requests.get("http://0.0.0.0:8080/couriers/700/orders", params=params)
+        assert response.status_code == 200
+        pages.append([order['order_id'] for order in response.json()['orders']])
+        cursor = response.json()['next_cursor']
+        if cursor is None:
+            break
+    assert pages == [[4003, 4001], [4004, 4000], [4002]]
+
+    response = requests.get("http://0.0.0.0:8080/couriers/700/orders", params={'status': 'completed'})
+    orders = response.json()['orders']
+    assert [order['order_id'] for order in orders] == [4003, 4001, 4004]
+    assert orders[0]['complete_time'] == '2099-01-10T10:01:00'
+    assert orders[0]['delivery_hours'] == ['10:00-12:00']
+    assert response.json()['next_cursor'] is None
+
+    response = requests.get("http://0.0.0.0:8080/couriers/700/orders", params={'status': 'active'})
+    orders = response.json()['orders']
+    assert [order['order_id'] for order in orders] == [4000, 4002]
+    assert all(order['complete_time'] is None and order['assign_time'] for order in orders)
+
+
+def test_bad_params():
+    for params in [{'status': 'lost'}, {'limit': 0}, {'limit': 'ten'}, {'cursor': 'garbage'}]:
+        response = requests.get("http://0.0.0.0:8080/couriers/700/orders", params=params)
+        assert response.status_code == 400
+        assert 'validation_error' in response.json()
+
+    response = requests.get("http://0.0.0.0:8080/couriers/100500/orders")
+    assert response.status_code == 404
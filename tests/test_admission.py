@@ -0,0 +1,147 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+from flask import Flask, jsonify
+
+import app.data
+from app import create_app
+from app.admission import AssignQueue, Overloaded
+from app.data import init_db, Order, Courier
+from app.metrics import SqlCounter
+from app.profiling import Profiler
+from app.utils import match_orders_by_hours
+from tests.utils_for_test import *
+
+
+def make_storage(database_uri: str):
+    engine, orders, couriers = init_db(database_uri)
+    order_storage, courier_storage = Order(engine, orders), Courier(engine, couriers)
+    random.seed(0)
+    courier_storage.add([create_courier_dict(i, generate_courier_type(), generate_set_of_regions(),
+                                             [generate_delivery_hours()]) for i in range(30)])
+    order_storage.add([create_order_dict(i, generate_weight(), generate_region(), [generate_delivery_hours()])
+                       for i in range(500)])
+    return order_storage, courier_storage
+
+
+def test_batch_matches_single_assignment(tmp_path):
+    courier_ids = [5, 3, 3, 17, 0, 29, 11]
+    orders, couriers = make_storage(f'sqlite:///{tmp_path}/single.db')
+    expected = [orders.orders_for_courier(couriers.get_profile(i))[0] for i in courier_ids]
+
+    orders, couriers = make_storage(f'sqlite:///{tmp_path}/batch.db')
+    batch = [(couriers.get_profile(i), Future(), 0, SqlCounter()) for i in courier_ids]
+    AssignQueue(10, 10, 1).process(orders, batch)
+    results = [future.result() for courier, future, thread_id, sql in batch]
+    assert [matching_orders for matching_orders, assign_time in results] == expected
+    assert len({assign_time for matching_orders, assign_time in results if matching_orders}) == 1
+
+
+class BlockingOrders:
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def orders_for_courier(self, courier):
+        self.started.set()
+        self.release.wait(5)
+        return [1], '2021-01-10T10:33:01'
+
+    def orders_for_couriers(self, couriers, capacity_limit=True):
+        self.started.set()
+        self.release.wait(5)
+        return {courier['courier_id']: [1] for courier in couriers}, '2021-01-10T10:33:01'
+
+
+def test_full_queue_sheds_load():
+    assign_queue = AssignQueue(2, 10, 1)
+    orders = BlockingOrders()
+    results = []
+    first = threading.Thread(target=lambda: results.append(assign_queue.assign(orders, {'courier_id': 1})))
+    first.start()
+    assert orders.started.wait(5)
+    # The running batch counts towards the limit: one more request fits in the queue, the next one is rejected
+    second = threading.Thread(target=lambda: results.append(assign_queue.assign(orders, {'courier_id': 2})))
+    second.start()
+    while assign_queue.queue.qsize() < 1:
+        time.sleep(0.001)
+    with pytest.raises(Overloaded):
+        assign_queue.assign(orders, {'courier_id': 3})
+    orders.release.set()
+    first.join()
+    second.join()
+    assert sorted(results) == [([1], '2021-01-10T10:33:01')] * 2
+    assert assign_queue.stats()['rejected'] == 1
+    # Finished requests free their slots
+    assert assign_queue.assign(orders, {'courier_id': 4}) == ([1], '2021-01-10T10:33:01')
+
+
+def test_single_courier_batch_uses_hours_matcher(tmp_path, monkeypatch):
+    orders, couriers = make_storage(f'sqlite:///{tmp_path}/single.db')
+    calls = []
+
+    def match(intervals, rel_orders):
+        calls.append(len(rel_orders))
+        return match_orders_by_hours(intervals, rel_orders)
+    monkeypatch.setattr(app.data, 'match_orders_by_hours', match)
+    matching_orders, assign_time = AssignQueue(10, 10, 1).assign(orders, couriers.get_profile(5))
+    assert matching_orders
+    assert calls
+
+
+def test_overloaded_response(tmp_path):
+    app = create_app(DATABASE_URI=f'sqlite:///{tmp_path}/admission.db', STORAGE_BACKEND='sql', ORDER_SHARDS=1,
+                     ASSIGN_RETRY_AFTER_SECONDS=2)
+    client = app.test_client()
+    client.post('/couriers', json={'data': [create_courier_dict(1, 'foot', [1], ['10:00-11:00'])]})
+
+    def overloaded(orders, courier):
+        raise Overloaded
+    app.extensions['assign_queue'].assign = overloaded
+    response = client.post('/orders/assign', json={'courier_id': 1})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+
+
+def assign_statements(tmp_path, queue_size: int):
+    app = create_app(DATABASE_URI=f'sqlite:///{tmp_path}/metrics{queue_size}.db', STORAGE_BACKEND='sql',
+                     ORDER_SHARDS=1, ASSIGN_QUEUE_SIZE=queue_size)
+    client = app.test_client()
+    client.post('/couriers', json={'data': [create_courier_dict(1, 'foot', [1], ['10:00-11:00'])]})
+    client.post('/orders', json={'data': [create_order_dict(1, 5, 1, ['10:00-11:00'])]})
+    assert client.post('/orders/assign', json={'courier_id': 1}).json['orders'] == [{'id': 1}]
+    text = client.get('/metrics').get_data(as_text=True)
+    line = next(line for line in text.splitlines()
+                if line.startswith('sql_statements_total{method="POST",endpoint="/orders/assign"}'))
+    return int(line.rsplit(' ', 1)[1])
+
+
+def test_queued_assign_statements_are_counted(tmp_path):
+    # Statements run on the queue thread count towards the request, as without the queue
+    statements = assign_statements(tmp_path, 6)
+    assert statements > 2
+    assert statements == assign_statements(tmp_path, 0)
+
+
+class SlowOrders:
+    def orders_for_courier(self, courier):
+        time.sleep(0.2)
+        return [1], '2021-01-10T10:33:01'
+
+
+def test_queued_assign_is_profiled(tmp_path):
+    app = Flask(__name__)
+    Profiler(slow_seconds=0.1, dump_dir=str(tmp_path), interval=0.001).init_app(app)
+    assign_queue = AssignQueue(2, 10, 1)
+
+    @app.route('/assign')
+    def assign():
+        return jsonify(assign_queue.assign(SlowOrders(), {'courier_id': 1}))
+
+    assert app.test_client().get('/assign').status_code == 200
+    dumps = list(tmp_path.iterdir())
+    assert len(dumps) == 1
+    # The slow request profile shows the batch work done on the queue thread
+    assert 'orders_for_courier (test_admission.py' in dumps[0].read_text()
@@ -0,0 +1,59 @@
+import os
+
+import sqlalchemy as db
+
+from app import create_app
+from tests.utils_for_test import *
+
+
+def test_storage_opens_on_first_request(tmp_path):
+    path = tmp_path / 'factory.db'
+    app = create_app(DATABASE_URI=f'sqlite:///{path}', STORAGE_BACKEND='sql', ORDER_SHARDS=1)
+    assert not path.exists()
+    client = app.test_client()
+    assert client.get('/couriers/1').status_code == 404
+    assert path.exists()
+    storage = app.extensions['storage']
+    couriers = storage.couriers
+    assert client.post('/couriers', json={'data': [create_courier_dict(1, 'foot', [1], ['10:00-11:00'])]}) \
+        .status_code == 201
+    assert storage.couriers is couriers
+
+    # After a fork (gunicorn --preload) the child process opens its own storage
+    storage.pid = os.getpid() + 1
+    assert client.get('/couriers/1').status_code == 200
+    assert storage.couriers is not couriers
+
+
+def test_separate_migration(tmp_path):
+    uri = f'sqlite:///{tmp_path}/factory.db'
+    app = create_app(DATABASE_URI=uri, STORAGE_BACKEND='sql', ORDER_SHARDS=1, AUTO_MIGRATE=False)
+    result = app.test_cli_runner().invoke(args=['migrate'])
+    assert result.exit_code == 0 and 'Schema is up to date' in result.output
+    assert set(db.inspect(db.create_engine(uri)).get_table_names()) >= {'orders', 'couriers', 'orders_archive'}
+    assert app.test_client().get('/couriers/1').status_code == 404
+
+
+def test_settings_reach_storage_and_routes(tmp_path):
+    app = create_app(DATABASE_URI=f'sqlite:///{tmp_path}/factory.db', STORAGE_BACKEND='sql', ORDER_SHARDS=2,
+                     SHARD_DATABASE_URI=f'sqlite:///{tmp_path}/factory_shard{{}}.db', COURIER_CACHE_SIZE=3,
+                     SQL_CHUNK_SIZE=2, FEED_EVENTS_KEEP=4, ARCHIVE_THRESHOLD=5, ARCHIVE_CHECK_EVERY=6,
+                     ORDER_PAGE_SIZE_MAX=1, INGEST_CHUNK_SIZE=2, INGEST_MAX_REPORTED_ERRORS=1, FEED_TIMEOUT_MAX=0)
+    client = app.test_client()
+    client.post('/couriers', json={'data': [create_courier_dict(1, 'car', [1, 2], ['09:00-18:00'])]})
+    storage = app.extensions['storage']
+    assert storage.couriers.cache.maxsize == 3 and storage.couriers.chunk_size == 2
+    for orders in [storage.orders] + storage.orders.shards:
+        assert (orders.chunk_size, orders.events_keep, orders.archive_threshold, orders.archive_check_every) \
+            == (2, 4, 5, 6)
+
+    body = b''.join(b'{"order_id": %d, "weight": 1, "region": %d, "delivery_hours": ["10:00-11:00"]}\n'
+                    % (i, i % 2 + 1) for i in range(1, 6)) + b'x\ny\n'
+    response = client.post('/orders/stream', data=body, content_type='application/x-ndjson')
+    assert response.json['rejected'] == 2 and len(response.json['validation_error']['orders']) == 1
+    assert response.json['accepted'] == 5
+    client.post('/orders/assign', json={'courier_id': 1})
+    response = client.get('/couriers/1/orders', query_string={'limit': 10})
+    assert len(response.json['orders']) == 1 and response.json['next_cursor']
+    # The long-poll timeout is capped at FEED_TIMEOUT_MAX
+    assert client.get('/couriers/1/feed', query_string={'timeout': 30}).status_code == 200
@@ -0,0 +1,91 @@
+import sqlalchemy as db
+
+from app import create_app
+from app.data import init_db, Order, Courier
+from app.utils import encode_cursor, decode_cursor
+from tests.utils_for_test import *
+
+
+def prepare(tmp_path, **settings):
+    engine, orders, couriers = init_db(f'sqlite:///{tmp_path}/archive.db')
+    order_storage, courier_storage = Order(engine, orders, **settings), Courier(engine, couriers)
+    courier_storage.add([create_courier_dict(1, 'car', [1], ['09:00-18:00'])])
+    order_storage.add([create_order_dict(i, 5, 1, ['10:00-11:00']) for i in range(1, 6)])
+    assigned, assign_time = order_storage.orders_for_courier(courier_storage.get_profile(1))
+    assert assigned == [1, 2, 3, 4, 5]
+    return engine, order_storage
+
+
+def hot_ids(engine, order_storage):
+    with engine.connect() as con:
+        return [row[0] for row in con.execute(db.select(order_storage.table.columns.order_id)
+                                              .order_by(order_storage.table.columns.order_id))]
+
+
+def test_archive_completed(tmp_path):
+    engine, order_storage = prepare(tmp_path)
+    assert order_storage.complete_orders([{'courier_id': 1, 'order_id': i, 'complete_time': f'2030-01-01T10:0{i}:00Z'}
+                                          for i in (1, 2, 3)]) == [None] * 3
+    stats = order_storage.get_courier_stats(1)
+    assert order_storage.count_completed() == 3
+    assert order_storage.archive_completed() == 3
+    assert order_storage.count_completed() == 0
+    assert hot_ids(engine, order_storage) == [4, 5]
+
+    # History reads see archived orders
+    assert sorted(order_storage.get_existing_ids([1, 4, 6])) == [1, 4]
+    assert [row['order_id'] for row in order_storage.get_courier_orders(1)] == [1, 2, 3, 4, 5]
+    assert [row['order_id'] for row in order_storage.get_courier_orders(1, completed=True)] == [1, 2, 3]
+    assert order_storage.verify_stats() == []
+    order_storage.rebuild_stats()
+    assert order_storage.get_courier_stats(1) == stats
+
+    # An archived order can still be completed again, the stats are rebuilt from both tables
+    order_storage.validate_assignment(2, 1)
+    order_storage.complete_order(2, '2030-01-01T11:00:00Z')
+    assert order_storage.verify_stats() == []
+    assert order_storage.get_courier_stats(1)[0]['last_complete_time'].hour == 11
+    assert order_storage.add([create_order_dict(1, 5, 1, ['10:00-11:00'])]) == ([1], False)
+
+
+def test_archive_threshold(tmp_path):
+    engine, order_storage = prepare(tmp_path, archive_threshold=2, archive_check_every=2)
+    order_storage.complete_order(1, '2030-01-01T10:01:00Z')
+    assert hot_ids(engine, order_storage) == [1, 2, 3, 4, 5]
+    order_storage.complete_orders([{'courier_id': 1, 'order_id': 2, 'complete_time': '2030-01-01T10:02:00Z'}])
+    assert hot_ids(engine, order_storage) == [3, 4, 5]
+    assert order_storage.verify_stats() == []
+
+
+def test_history_pages_span_archive(tmp_path):
+    engine, order_storage = prepare(tmp_path)
+    order_storage.complete_orders([{'courier_id': 1, 'order_id': i, 'complete_time': f'2030-01-01T10:0{6 - i}:00Z'}
+                                   for i in (2, 4)])
+    order_storage.archive_completed()
+    order_storage.complete_orders([{'courier_id': 1, 'order_id': 5, 'complete_time': '2030-01-01T10:03:00Z'}])
+
+    pages = []
+    after = None
+    while True:
+        rows, after = order_storage.history_page(1, 'all', 2, after)
+        pages.append([row['order_id'] for row in rows])
+        if after is None:
+            break
+        after = decode_cursor(encode_cursor(after))
+    assert pages == [[4, 5], [2, 1], [3]]
+    rows, after = order_storage.history_page(1, 'completed', 10)
+    assert [row['order_id'] for row in rows] == [4, 5, 2] and after is None
+    assert order_storage.history_page(1, 'active', 10)[0][0]['delivery_hours'] == ['10:00-11:00']
+
+
+def test_archive_settings_from_app(tmp_path):
+    app = create_app(DATABASE_URI=f'sqlite:///{tmp_path}/app.db', STORAGE_BACKEND='sql', ORDER_SHARDS=1,
+                     ARCHIVE_THRESHOLD=1, ARCHIVE_CHECK_EVERY=1)
+    client = app.test_client()
+    client.post('/couriers', json={'data': [create_courier_dict(1, 'car', [1], ['09:00-18:00'])]})
+    client.post('/orders', json={'data': [create_order_dict(i, 5, 1, ['10:00-11:00']) for i in (1, 2)]})
+    client.post('/orders/assign', json={'courier_id': 1})
+    assert client.post('/orders/complete', json={'courier_id': 1, 'order_id': 1,
+                                                 'complete_time': '2030-01-01T10:01:00Z'}).status_code == 200
+    storage = app.extensions['storage']
+    assert hot_ids(storage.couriers.engine, storage.orders) == [2]
@@ -0,0 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.data import init_db, Order, Courier
+from tests.utils_for_test import *
+
+
+def test_no_order_assigned_twice(tmp_path):
+    database_uri = f'sqlite:///{tmp_path}/assign.db'
+    engine, orders, couriers = init_db(database_uri)
+    Order(engine, orders).add([create_order_dict(i, 1, 1, ['10:00-12:00']) for i in range(2000)])
+
+    def assign(courier_id):
+        # Separate engine per thread, like separate gunicorn workers
+        engine, orders, couriers = init_db(database_uri)
+        storage = Order(engine, orders)
+        courier = Courier.to_profile({'courier_id': courier_id, 'courier_type': 'car', 'regions': '1',
+                                      'working_hours': '00:00-23:59', 'version': 0})
+        won = []
+        for _ in range(5):
+            matching_orders, assign_time = storage.orders_for_courier(courier)
+            won.extend((order_id, courier_id) for order_id in matching_orders)
+        engine.dispose()
+        return won
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        won = [pair for result in executor.map(assign, range(16)) for pair in result]
+
+    assert len(won) == len({order_id for order_id, courier_id in won})
+    stored = {row['order_id']: row['courier_id'] for row in engine.execute(orders.select())}
+    assert all(stored[order_id] == courier_id for order_id, courier_id in won)
+    assert len(won) == 2000
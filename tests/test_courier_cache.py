@@ -0,0 +1,77 @@
+from app.cache import LRUCache
+from app.data import init_db, Courier
+from tests.utils_for_test import *
+
+
+def test_lru_eviction():
+    cache = LRUCache(2)
+    cache.put(1, 'a')
+    cache.put(2, 'b')
+    assert cache.get(1) == 'a'
+    cache.put(3, 'c')
+    assert cache.get(2) is None
+    assert cache.get(1) == 'a' and cache.get(3) == 'c'
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'size': 2, 'maxsize': 2}
+
+
+def test_ttl_expiry():
+    now = [0.0]
+    cache = LRUCache(10, ttl=5, clock=lambda: now[0])
+    cache.put(1, 'a')
+    assert cache.add(1, 'b') is False
+    now[0] = 3
+    cache.put(2, 'b')
+    assert cache.get(1) == 'a'
+    now[0] = 5
+    assert cache.get(1) is None
+    assert cache.add(1, 'c') is True
+    now[0] = 8
+    # The expired head entry is dropped on the next write
+    cache.put(3, 'd')
+    assert cache.stats()['size'] == 2
+    assert cache.get(2) is None and cache.get(1) == 'c'
+
+
+def test_get_or_add():
+    now = [0.0]
+    cache = LRUCache(10, ttl=5, clock=lambda: now[0])
+    assert cache.get_or_add(1, 'a') == ('a', True)
+    assert cache.get_or_add(1, 'b') == ('a', False)
+    # An entry that expires is replaced in the same call, never reported as present
+    now[0] = 5
+    assert cache.get_or_add(1, 'c') == ('c', True)
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_profile_cache_across_workers(tmp_path):
+    database_uri = f'sqlite:///{tmp_path}/cache.db'
+    # Two storages on the same database, like two gunicorn workers
+    worker_1 = Courier(*init_db(database_uri)[::2])
+    worker_2 = Courier(*init_db(database_uri)[::2])
+    assert worker_1.add([create_courier_dict(1, 'foot', [1, 2], ['09:00-12:00'])]) == ([1], True)
+
+    profile = worker_1.get_profile(1)
+    assert profile['regions'] == [1, 2]
+    assert profile['hours'] == [(540, 720)]
+    assert profile['capacity'] == 10
+    assert worker_1.get_profile(1) is profile
+    assert worker_1.cache.stats()['hits'] == 1
+
+    assert worker_2.get_profile(1)['courier_type'] == 'foot'
+    updated = worker_2.update_data(1, {'courier_type': 'car', 'working_hours': ['10:00-11:00']})
+    assert updated['capacity'] == 50 and updated['regions'] == [1, 2]
+    # Write-through: the updating worker serves the new profile from its cache
+    assert worker_2.get_profile(1) is updated
+
+    # The other worker notices the version change
+    profile = worker_1.get_profile(1)
+    assert profile['courier_type'] == 'car'
+    assert profile['hours'] == [(600, 660)]
+
+
+def test_update_validation(tmp_path):
+    storage = Courier(*init_db(f'sqlite:///{tmp_path}/cache.db')[::2])
+    storage.add([create_courier_dict(1, 'foot', [1], ['09:00-12:00'])])
+    assert storage.update_data(1, {'courier_type': 'plane'}) is None
+    assert storage.update_data(1, {'courier_id': 2}) is None
+    assert storage.get_profile(2) is None
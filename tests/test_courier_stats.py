@@ -0,0 +1,65 @@
+import random
+from datetime import datetime, timedelta
+
+from app.data import init_db, Order
+from app.utils import *
+from tests.utils_for_test import *
+
+
+def test_incremental_stats_match_rebuild(tmp_path):
+    engine, orders, couriers = init_db(f'sqlite:///{tmp_path}/stats.db')
+    storage = Order(engine, orders)
+    storage.add([create_order_dict(i, 1, generate_region(), ['10:00-12:00']) for i in range(60)])
+    assign_time = datetime(2021, 3, 28, 10, 0)
+    for courier_id in range(3):
+        ids = list(range(courier_id * 20, courier_id * 20 + 20))
+        with engine.begin() as con:
+            con.execute(orders.update().where(orders.columns.order_id.in_(ids))
+                        .values(courier_id=courier_id, assign_time=assign_time,
+                                assigned_type_coef=random.choice(list(coefficient_dict.values()))))
+        # Out of order and repeated completions must end up with the same result as a full recount
+        for order_id in random.sample(ids, 20) + random.sample(ids, 3):
+            complete_time = assign_time + timedelta(minutes=random.randint(1, 120))
+            storage.complete_order(order_id, complete_time.isoformat() + 'Z')
+
+    assert storage.verify_stats() == []
+    for courier_id in range(3):
+        completed = storage.get_courier_orders(courier_id, completed=True)
+        stats = storage.get_courier_stats(courier_id)
+        assert calculate_earnings_from_stats(stats) == calculate_earnings(completed)
+        assert calculate_rating_from_stats(stats) == calculate_rating(completed)
+
+
+def test_rebuild_fixes_stats(tmp_path):
+    engine, orders, couriers = init_db(f'sqlite:///{tmp_path}/stats.db')
+    storage = Order(engine, orders)
+    storage.add([create_order_dict(0, 1, 1, ['10:00-12:00'])])
+    with engine.begin() as con:
+        con.execute(orders.update().values(courier_id=5, assign_time=datetime(2021, 3, 28, 10, 0),
+                                           assigned_type_coef=2))
+    storage.complete_order(0, '2021-03-28T10:30:00Z')
+    engine.execute(storage.stats_table.update().values(earnings=0))
+    assert storage.verify_stats() == [5]
+    storage.rebuild_stats()
+    assert storage.verify_stats() == []
+
+
+def test_batch_completion_stats_match_rebuild(tmp_path):
+    engine, orders, couriers = init_db(f'sqlite:///{tmp_path}/stats.db')
+    storage = Order(engine, orders)
+    storage.add([create_order_dict(i, 1, generate_region(), ['10:00-12:00']) for i in range(60)])
+    assign_time = datetime(2021, 3, 28, 10, 0)
+    with engine.begin() as con:
+        con.execute(orders.update().values(courier_id=orders.columns.order_id % 3, assign_time=assign_time,
+                                           assigned_type_coef=5))
+    items = [{'order_id': i, 'courier_id': i % 3,
+              'complete_time': (assign_time + timedelta(minutes=random.randint(1, 120))).isoformat() + 'Z'}
+             for i in random.sample(range(60), 60)]
+    for start in range(0, 60, 15):
+        assert storage.complete_orders(items[start:start + 15]) == [None] * 15
+
+    assert storage.verify_stats() == []
+    for courier_id in range(3):
+        completed = storage.get_courier_orders(courier_id, completed=True)
+        assert len(completed) == 20
+        assert calculate_rating_from_stats(storage.get_courier_stats(courier_id)) == calculate_rating(completed)
@@ -0,0 +1,135 @@
+import threading
+import time
+
+import pytest
+
+from app import create_app
+from app.feed import OrderFeed
+from tests.utils_for_test import *
+
+
+@pytest.fixture(params=['sql', 'sharded', 'memory'])
+def client(request, tmp_path):
+    settings = dict(DATABASE_URI=f'sqlite:///{tmp_path}/feed.db', STORAGE_BACKEND='sql', ORDER_SHARDS=1,
+                    FEED_POLL_SECONDS=0.05)
+    if request.param == 'sharded':
+        settings.update(ORDER_SHARDS=2, SHARD_DATABASE_URI=f'sqlite:///{tmp_path}/feed_shard{{}}.db')
+    elif request.param == 'memory':
+        settings.update(STORAGE_BACKEND='memory', MEMORY_DATA_DIR=str(tmp_path / 'memory'))
+    client = create_app(**settings).test_client()
+    # Foot courier: capacity 10, regions 1 and 2
+    client.post('/couriers', json={'data': [create_courier_dict(1, 'foot', [1, 2], ['10:00-18:00'])]})
+    return client
+
+
+def wait_feed(client, courier_id: int, **params):
+    result = dict()
+    thread = threading.Thread(target=lambda: result.update(
+        client.get(f'/couriers/{courier_id}/feed', query_string=params).json))
+    thread.start()
+    return thread, result
+
+
+def test_new_orders_wake_waiter(client):
+    cursor = client.get('/couriers/1/feed', query_string={'timeout': 0}).json['cursor']
+    thread, result = wait_feed(client, 1, cursor=cursor, timeout=10)
+    time.sleep(0.2)
+    started = time.perf_counter()
+    client.post('/orders', json={'data': [create_order_dict(1, 5, 2, ['12:00-13:00'])]})
+    thread.join()
+    assert time.perf_counter() - started < 5
+    assert result['regions'] == [2]
+    assert result['cursor'] > cursor
+
+
+def test_events_after_cursor_are_not_lost(client):
+    cursor = client.get('/couriers/1/feed', query_string={'timeout': 0}).json['cursor']
+    client.post('/orders', json={'data': [create_order_dict(1, 5, 1, ['12:00-13:00'])]})
+    response = client.get('/couriers/1/feed', query_string={'cursor': cursor, 'timeout': 5})
+    assert response.json['regions'] == [1]
+    # The new cursor is past the event
+    response = client.get('/couriers/1/feed', query_string={'cursor': response.json['cursor'], 'timeout': 0})
+    assert response.json['regions'] == []
+
+
+def test_unsuitable_orders_do_not_wake(client):
+    cursor = client.get('/couriers/1/feed', query_string={'timeout': 0}).json['cursor']
+    # Another region, and too heavy for a foot courier
+    client.post('/orders', json={'data': [create_order_dict(1, 5, 3, ['12:00-13:00']),
+                                          create_order_dict(2, 20, 1, ['12:00-13:00'])]})
+    response = client.get('/couriers/1/feed', query_string={'cursor': cursor, 'timeout': 0.3})
+    assert response.status_code == 200
+    assert response.json['regions'] == []
+    assert response.json['cursor'] >= cursor
+
+
+def test_released_orders_are_published(client):
+    client.post('/couriers', json={'data': [create_courier_dict(2, 'car', [4], ['10:00-18:00'])]})
+    client.post('/orders', json={'data': [create_order_dict(1, 15, 4, ['12:00-13:00'])]})
+    client.post('/orders/assign', json={'courier_id': 2})
+    client.patch('/couriers/1', json={'regions': [4]})
+    client.patch('/couriers/1', json={'courier_type': 'car'})
+    cursor = client.get('/couriers/1/feed', query_string={'timeout': 0}).json['cursor']
+    # The order no longer fits a foot courier and goes back to the pool
+    client.patch('/couriers/2', json={'courier_type': 'foot'})
+    response = client.get('/couriers/1/feed', query_string={'cursor': cursor, 'timeout': 5})
+    assert response.json['regions'] == [4]
+
+
+def test_wrong_params(client):
+    assert client.get('/couriers/1/feed', query_string={'cursor': 'abc'}).status_code == 400
+    assert client.get('/couriers/1/feed', query_string={'timeout': '-1'}).status_code == 400
+    assert client.get('/couriers/1/feed', query_string={'timeout': 'nan'}).status_code == 400
+    assert client.get('/couriers/100/feed', query_string={'timeout': 0}).status_code == 404
+
+
+class EventLog:
+    def __init__(self, events):
+        self.events = events
+
+    def order_events(self, after_seq, limit=None):
+        return [event for event in self.events if event[0] > after_seq]
+
+    def last_event_seq(self):
+        return self.events[-1][0] if self.events else 0
+
+    def prune_events(self, keep):
+        return 0
+
+
+def test_stale_cursor_returns_all_regions():
+    feed = OrderFeed(0.01, 2, 10, 1)
+    orders = EventLog([])
+    feed.start(orders)
+    orders.events.extend([(1, 3, 1.0), (2, 3, 1.0), (3, 3, 1.0)])
+    feed.wake()
+    courier = {'regions': [1, 2], 'capacity': 10}
+    # The buffer keeps the last two events only: events in regions 1 and 2 after seq 0 may have been dropped
+    assert feed.wait(orders, courier, 0, 1) == (3, [1, 2])
+    assert feed.wait(orders, courier, 1, 0.1) == (3, [])
+
+
+def test_no_cursor_ignores_events_before_request():
+    feed = OrderFeed(0.01, 10, 10, 1)
+    orders = EventLog([])
+    feed.start(orders)
+    # Written by another worker: the feed thread of this process has not read it yet
+    orders.events.append((1, 1, 1.0))
+    courier = {'regions': [1], 'capacity': 10}
+    assert feed.wait(orders, courier, None, 0.1) == (1, [])
+    orders.events.append((2, 1, 1.0))
+    feed.wake()
+    assert feed.wait(orders, courier, 1, 1) == (2, [1])
+
+
+def test_too_many_waiters(client):
+    client.application.extensions['order_feed'].max_waiters = 1
+    thread, result = wait_feed(client, 1, timeout=1)
+    while client.application.extensions['order_feed'].waiters < 1:
+        time.sleep(0.001)
+    response = client.get('/couriers/1/feed', query_string={'timeout': 1})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+    # A check without waiting does not take a thread
+    assert client.get('/couriers/1/feed', query_string={'timeout': 0}).status_code == 200
+    thread.join()
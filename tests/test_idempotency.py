@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+from app import create_app
+from tests.utils_for_test import *
+
+
+@pytest.fixture
+def client(tmp_path):
+    app = create_app(DATABASE_URI=f'sqlite:///{tmp_path}/idempotency.db', STORAGE_BACKEND='sql', ORDER_SHARDS=1)
+    return app.test_client()
+
+
+def test_retry_gets_stored_response(client):
+    data = {'data': [create_order_dict(i, 1, 1, ['10:00-12:00']) for i in range(1, 4)]}
+    response = client.post('/orders', json=data, headers={'Idempotency-Key': 'import-1'})
+    assert response.status_code == 201
+    retry = client.post('/orders', json=data, headers={'Idempotency-Key': 'import-1'})
+    assert retry.status_code == 201
+    assert retry.get_data() == response.get_data()
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    # Without the key the retry is a duplicate
+    assert client.post('/orders', json=data).status_code == 400
+    # Keys are per endpoint
+    couriers = {'data': [create_courier_dict(1, 'foot', [1], ['10:00-11:00'])]}
+    assert client.post('/couriers', json=couriers, headers={'Idempotency-Key': 'import-1'}).status_code == 201
+    assert client.get('/stats/cache').get_json()['idempotency']['hits'] == 1
+
+
+def test_key_reused_with_other_body(client):
+    headers = {'Idempotency-Key': 'k'}
+    assert client.post('/orders', json={'data': [create_order_dict(1, 1, 1, ['10:00-12:00'])]},
+                       headers=headers).status_code == 201
+    response = client.post('/orders', json={'data': [create_order_dict(2, 1, 1, ['10:00-12:00'])]}, headers=headers)
+    assert response.status_code == 422
+    assert client.post('/orders', json={}, headers={'Idempotency-Key': 'x' * 256}).status_code == 400
+
+
+def test_request_in_progress(client):
+    app = client.application
+    idempotency = app.extensions['idempotency']
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def slow_view():
+        started.set()
+        release.wait(5)
+        raise RuntimeError('failed')
+
+    def first_request():
+        with app.test_request_context('/orders', method='POST', data=b'{}'):
+            try:
+                idempotency.handle('k', slow_view)
+            except RuntimeError as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=first_request)
+    thread.start()
+    assert started.wait(5)
+    with app.test_request_context('/orders', method='POST', data=b'{}'):
+        response, status = idempotency.handle('k', lambda: None)
+    assert status == 409
+    release.set()
+    thread.join()
+    assert len(errors) == 1
+    # A failed request does not keep its key
+    data = {'data': [create_order_dict(1, 1, 1, ['10:00-12:00'])]}
+    assert client.post('/orders', json=data, headers={'Idempotency-Key': 'k'}).status_code == 201
@@ -0,0 +1,36 @@
+import flask
+import pytest
+
+from app import app
+from app.json_backend import Request, dumps, dumps_stdlib, jsonify, loads
+
+PAYLOADS = [
+    {'orders': [{'id': i} for i in range(1000)], 'assign_time': '2021-01-10T10:33:01.42Z'},
+    {'couriers': [{'courier_id': 1, 'orders': []}], 'validation_error': {'reason': 'No data given'}},
+    {'courier_id': 2, 'regions': [1, 12], 'working_hours': ['11:35-14:05'], 'earnings': 0, 'rating': 4.67},
+    {'reason': 'Курьер не найден', 'tiny': 1e-05, 'huge': 1e+16, 'big': 2 ** 70, 'none': None, 'flag': True},
+    [],
+]
+
+
+@pytest.mark.parametrize('data', PAYLOADS)
+def test_same_bytes_as_flask(data):
+    with app.app_context():
+        expected = flask.jsonify(data).get_data()
+        assert jsonify(data).get_data() == expected
+        assert dumps_stdlib(data) == expected
+    assert loads(dumps(data)) == data
+
+
+def test_request_parsing():
+    with app.test_request_context('/', method='POST', data=b'{"data": [{"order_id": 1, "weight": NaN}]}',
+                                  content_type='application/json'):
+        assert isinstance(flask.request, Request)
+        data = flask.request.json
+        assert data['data'][0]['order_id'] == 1 and data['data'][0]['weight'] != data['data'][0]['weight']
+    with app.test_request_context('/', method='POST', data=b'{"data": ', content_type='application/json'):
+        assert flask.request.get_json(silent=True) is None
+        with pytest.raises(flask.wrappers.BadRequest):
+            flask.request.get_json()
+    with app.test_request_context('/', method='POST', data=b'{}', content_type='text/plain'):
+        assert flask.request.json is None
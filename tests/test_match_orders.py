@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+from app.utils import *
+
+np = pytest.importorskip('numpy')
+
+
+def generate_interval():
+    # Including empty intervals and intervals over midnight
+    return random.randrange(24 * 60), random.randrange(24 * 60)
+
+
+def generate_rows(size: int):
+    rows = []
+    for order_id in range(size):
+        for _ in range(random.randint(1, 3)):
+            rows.append((order_id, *generate_interval()))
+    return rows
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_numpy_matches_python(seed):
+    random.seed(seed)
+    rows = generate_rows(random.randint(0, 2000))
+    intervals = [generate_interval() for _ in range(random.randint(0, 4))]
+    assert match_orders_by_hours_numpy(intervals, rows) == match_orders_by_hours_python(intervals, rows)
+
+
+def test_numpy_matches_python_unsorted():
+    random.seed(0)
+    rows = generate_rows(1000)
+    random.shuffle(rows)
+    intervals = [(540, 720), (1080, 1200)]
+    assert match_orders_by_hours_numpy(intervals, rows) == match_orders_by_hours_python(intervals, rows)
+
+
+def test_python_matches_check_hours():
+    random.seed(0)
+    hours = ['09:00-12:00', '23:00-01:00']
+    for _ in range(1000):
+        start, end = generate_interval()
+        order_hours = [f'{start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}']
+        expected = [0] if check_hours(hours, order_hours) else []
+        assert match_orders_by_hours_python(parse_hours(hours), [(0, start, end)]) == expected
@@ -0,0 +1,61 @@
+import pytest
+
+from app.memory import init_memory
+from tests.utils_for_test import *
+
+
+def fill(couriers, orders):
+    assert couriers.add([create_courier_dict(1, 'bike', [1, 2], ['09:00-18:00']),
+                         create_courier_dict(2, 'foot', [2], ['09:00-12:00'])]) == ([1, 2], True)
+    assert orders.add([create_order_dict(1, 5, 1, ['10:00-11:00']),
+                       create_order_dict(2, 12, 2, ['10:00-11:00']),
+                       create_order_dict(3, 20, 1, ['10:00-11:00']),
+                       create_order_dict(4, 3, 2, ['11:00-12:00'])]) == ([1, 2, 3, 4], True)
+    assigned, assign_time = orders.orders_for_courier(couriers.get_profile(1))
+    assert assigned == [1, 2, 4] and assign_time is not None
+    assert orders.complete_orders([{'courier_id': 1, 'order_id': 1, 'complete_time': '2030-01-01T10:00:00Z'},
+                                   {'courier_id': 2, 'order_id': 2, 'complete_time': '2030-01-01T10:00:00Z'}]) \
+        == [None, 'Courier was not assigned']
+    # Order 2 is too heavy for a foot courier, order 4 is still fine
+    couriers.update_data(1, {'courier_type': 'foot'}, on_update=orders.release_orders)
+
+
+def state(couriers, orders):
+    return ([couriers.profile_data(profile) for profile in couriers.get_profiles([1, 2])],
+            {courier_id: orders.get_courier_orders(courier_id) for courier_id in (1, 2)},
+            orders.get_courier_stats(1))
+
+
+@pytest.mark.parametrize('snapshot_every', [1000, 2])
+def test_recovery(tmp_path, snapshot_every):
+    couriers, orders = init_memory(str(tmp_path), fsync=False, snapshot_every=snapshot_every)
+    fill(couriers, orders)
+    assert [order['order_id'] for order in orders.get_courier_orders(1)] == [1, 4]
+    assert couriers.get_profile(1)['version'] == 1
+    before = state(couriers, orders)
+    assert before[2][0]['completed'] == 1
+    orders.store.close()
+
+    couriers, orders = init_memory(str(tmp_path), fsync=False, snapshot_every=snapshot_every)
+    assert state(couriers, orders) == before
+    assert couriers.get_profile(1)['version'] == 1
+    # Released order 2 is free again and goes to the next courier
+    assert orders.orders_for_couriers(couriers.get_profiles([2, 1]))[0] == {2: [], 1: []}
+    assert orders.orders_for_courier(dict(couriers.get_profile(1), capacity=50, regions=[2]))[0] == [2]
+
+
+def test_torn_write_and_single_process(tmp_path):
+    couriers, orders = init_memory(str(tmp_path), fsync=False)
+    with pytest.raises(RuntimeError):
+        init_memory(str(tmp_path))
+    fill(couriers, orders)
+    before = state(couriers, orders)
+    orders.store.log.write(b'{"seq": 100, "ops": [{"op": "add_ord')
+    orders.store.close()
+
+    couriers, orders = init_memory(str(tmp_path), fsync=False)
+    assert state(couriers, orders) == before
+    assert orders.add([create_order_dict(5, 1, 1, ['10:00-11:00'])]) == ([5], True)
+    orders.store.close()
+    couriers, orders = init_memory(str(tmp_path), fsync=False)
+    assert orders.get_existing_ids([4, 5, 6]) == [4, 5]
@@ -0,0 +1,37 @@
+from flask import Flask, jsonify
+
+from app.data import init_db, Order
+from app.metrics import Metrics
+from tests.utils_for_test import *
+
+
+def test_metrics_per_endpoint(tmp_path):
+    engine, orders, couriers = init_db(f'sqlite:///{tmp_path}/metrics.db')
+    storage = Order(engine, orders)
+    app = Flask(__name__)
+    metrics = Metrics([0.1, 10])
+    metrics.init_app(app)
+    metrics.watch_engine(engine)
+
+    @app.route('/orders/<int:order_id>', methods=['POST'])
+    def post_order(order_id):
+        storage.add([create_order_dict(order_id, 1, 1, ['10:00-11:00'])])
+        return jsonify({}), 201
+
+    # Outside of a request statements are not counted
+    storage.get_existing_ids([1])
+    client = app.test_client()
+    for order_id in range(3):
+        assert client.post(f'/orders/{order_id}').status_code == 201
+    assert client.get('/missing').status_code == 404
+
+    text = metrics.render()
+    labels = 'method="POST",endpoint="/orders/<int:order_id>"'
+    assert f'http_requests_total{{{labels}}} 3' in text
+    assert f'http_request_duration_seconds_bucket{{{labels},le="10"}} 3' in text
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in text
+    assert f'http_request_duration_seconds_count{{{labels}}} 3' in text
+    # Archive id check plus one executemany per table (orders, order_hours, order_events), per request
+    assert f'sql_statements_total{{{labels}}} 12' in text
+    assert 'http_requests_total{method="GET",endpoint=""} 1' in text
+    assert 'sql_statements_total{method="GET",endpoint=""} 0' in text
@@ -0,0 +1,44 @@
+import pstats
+import time
+
+from flask import Flask, jsonify
+
+from app.profiling import Profiler
+
+
+def make_app(profiler: Profiler):
+    app = Flask(__name__)
+    profiler.init_app(app)
+
+    @app.route('/sleep/<int:ms>')
+    def sleep(ms):
+        time.sleep(ms / 1000)
+        return jsonify({})
+
+    return app
+
+
+def test_disabled_profiler_adds_no_hooks(tmp_path):
+    app = make_app(Profiler(dump_dir=str(tmp_path / 'profiles')))
+    assert not app.before_request_funcs and not app.teardown_request_funcs
+    assert not (tmp_path / 'profiles').exists()
+
+
+def test_sampled_requests(tmp_path):
+    client = make_app(Profiler(sample_rate=1, dump_dir=str(tmp_path))).test_client()
+    assert client.get('/sleep/1', headers={'X-Request-Id': 'abc/1'}).status_code == 200
+    dumps = list(tmp_path.iterdir())
+    assert len(dumps) == 1 and dumps[0].name.endswith('-sleep-abc_1.prof')
+    assert pstats.Stats(str(dumps[0])).total_calls > 0
+
+
+def test_slow_requests(tmp_path):
+    client = make_app(Profiler(slow_seconds=0.1, dump_dir=str(tmp_path), interval=0.001)).test_client()
+    client.get('/sleep/1')
+    assert not list(tmp_path.iterdir())
+    client.get('/sleep/200', headers={'X-Request-Id': 'slow'})
+    dumps = list(tmp_path.iterdir())
+    assert len(dumps) == 1 and dumps[0].name.endswith('-sleep-slow.stacks')
+    lines = dumps[0].read_text().splitlines()
+    assert lines and all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+    assert any('sleep (test_profiling.py' in line for line in lines)
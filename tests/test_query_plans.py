@@ -0,0 +1,29 @@
+import sqlalchemy as db
+
+from app.data import init_db, Order
+
+
+def explain(engine, select):
+    sql = str(select.compile(engine, compile_kwargs={'literal_binds': True}))
+    return ' '.join(row[-1] for row in engine.execute('EXPLAIN QUERY PLAN ' + sql))
+
+
+def test_candidates_use_partial_index(tmp_path):
+    engine, orders, couriers = init_db(f'sqlite:///{tmp_path}/plans.db')
+    plan = explain(engine, Order(engine, orders).select_candidates([1, 2], 10))
+    assert 'ix_orders_unassigned' in plan
+    assert 'SCAN orders' not in plan
+
+
+def test_courier_orders_use_index(tmp_path):
+    engine, orders, couriers = init_db(f'sqlite:///{tmp_path}/plans.db')
+    for select in [db.select(orders).where(orders.columns.courier_id == 1),
+                   db.select(orders).where(orders.columns.courier_id == 1, orders.columns.complete == True)]:
+        assert 'ix_orders_courier_complete' in explain(engine, select)
+
+
+def test_indexes_added_to_existing_db(tmp_path):
+    engine, orders, couriers = init_db(f'sqlite:///{tmp_path}/plans.db')
+    engine.execute('DROP INDEX ix_orders_unassigned')
+    engine, orders, couriers = init_db(f'sqlite:///{tmp_path}/plans.db')
+    assert 'ix_orders_unassigned' in explain(engine, Order(engine, orders).select_candidates([1], 10))
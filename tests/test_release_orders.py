@@ -0,0 +1,31 @@
+from app.data import init_db, Order, Courier
+from tests.utils_for_test import *
+
+
+def test_release_on_update(tmp_path):
+    engine, orders, couriers = init_db(f'sqlite:///{tmp_path}/release.db')
+    order_storage, courier_storage = Order(engine, orders), Courier(engine, couriers)
+    courier_storage.add([create_courier_dict(1, 'car', [1, 2], ['09:00-18:00'])])
+    order_storage.add([create_order_dict(1, 5, 1, ['10:00-11:00']),
+                       create_order_dict(2, 20, 1, ['10:00-11:00']),
+                       create_order_dict(3, 5, 2, ['10:00-11:00']),
+                       create_order_dict(4, 5, 1, ['16:00-17:00', '09:30-10:00']),
+                       create_order_dict(5, 5, 1, ['11:00-12:00'])])
+    assigned, assign_time = order_storage.orders_for_courier(courier_storage.get_profile(1))
+    assert sorted(assigned) == [1, 2, 3, 4, 5]
+    order_storage.complete_orders([{'courier_id': 1, 'order_id': 5, 'complete_time': assign_time}])
+    stats = order_storage.get_courier_stats(1)
+
+    # Order 2 is too heavy, order 3 is out of the regions, order 4 is out of the hours.
+    # Order 5 does not fit any more either, but it is already complete
+    profile = courier_storage.update_data(1, {'courier_type': 'foot', 'regions': [1], 'working_hours': ['09:00-11:00']},
+                                          on_update=order_storage.release_orders)
+    assert profile['capacity'] == 10
+    assert {row['order_id']: row['courier_id'] for row in order_storage.get_courier_orders(1)} == {1: 1, 4: 1, 5: 1}
+    assert order_storage.get_courier_stats(1) == stats
+
+    courier_storage.update_data(1, {'working_hours': []}, on_update=order_storage.release_orders)
+    assert [row['order_id'] for row in order_storage.get_courier_orders(1)] == [5]
+    freed = order_storage.select_candidates([1, 2], 50)
+    with engine.connect() as con:
+        assert sorted({row[0] for row in con.execute(freed)}) == [1, 2, 3, 4]
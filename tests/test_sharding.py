@@ -0,0 +1,75 @@
+import sqlalchemy as db
+
+from app.data import init_db, Order, Courier
+from app.sharding import init_sharded
+from tests.utils_for_test import *
+
+
+def run_scenario(orders, couriers):
+    random.seed(3)
+    couriers.add([create_courier_dict(i, generate_courier_type(), generate_set_of_regions(),
+                                      [generate_delivery_hours()]) for i in range(20)])
+    assert orders.add([create_order_dict(i, generate_weight(), generate_region(), [generate_delivery_hours()])
+                       for i in range(300)])[1]
+    single = {i: orders.orders_for_courier(couriers.get_profile(i))[0] for i in range(5)}
+    batch = orders.orders_for_couriers(couriers.get_profiles(list(range(5, 20))))[0]
+    completions = [{'courier_id': courier_id, 'order_id': order_id, 'complete_time': f'2030-01-01T10:{minute:02}:00Z'}
+                   for courier_id, assigned in list(single.items()) + list(batch.items())
+                   for minute, order_id in enumerate(assigned[:3])]
+    assert orders.complete_orders(completions) == [None] * len(completions)
+    couriers.update_data(0, {'regions': [0]}, on_update=orders.release_orders)
+    return single, batch, {i: orders.get_courier_stats(i) for i in range(20)}, orders.get_courier_orders(0)
+
+
+def stats_summary(rows):
+    return sorted((row['region'], row['earnings'], row['completed'], row['last_complete_time']) for row in rows)
+
+
+def test_sharded_matches_single_database(tmp_path):
+    engine, orders, couriers = init_db(f'sqlite:///{tmp_path}/single.db')
+    expected = run_scenario(Order(engine, orders), Courier(engine, couriers))
+
+    engine, sharded, couriers = init_sharded(f'sqlite:///{tmp_path}/main.db', f'sqlite:///{tmp_path}/shard{{}}.db', 3,
+                                             'wal')
+    result = run_scenario(sharded, Courier(engine, couriers))
+    assert result[:2] == expected[:2]
+    assert sum(map(len, result[0].values())) > 0 and sum(map(len, result[1].values())) > 0
+    # Delivery times depend on the assign time, the rest of the stats must be the same
+    assert {courier_id: stats_summary(rows) for courier_id, rows in result[2].items()} == \
+           {courier_id: stats_summary(rows) for courier_id, rows in expected[2].items()}
+    assert [row['order_id'] for row in result[3]] == [row['order_id'] for row in expected[3]]
+
+    # Every order lives in the shard of its region
+    for index, shard in enumerate(sharded.shards):
+        with shard.engine.connect() as con:
+            regions = {row[0] for row in con.execute(shard.table.select().with_only_columns(shard.table.columns.region))}
+        assert regions and all(region % 3 == index for region in regions)
+    assert sharded.verify_stats() == []
+
+
+def test_failed_batch_leaves_no_orders(tmp_path):
+    engine, sharded, couriers = init_sharded(f'sqlite:///{tmp_path}/main.db', f'sqlite:///{tmp_path}/shard{{}}.db', 2,
+                                             'wal')
+    assert sharded.add([create_order_dict(1, 1, 1, ['10:00-11:00'])]) == ([1], True)
+    last_seq = sharded.last_event_seq()
+    # Order 2 goes to shard 0, order 1 already exists in shard 1
+    assert sharded.add([create_order_dict(2, 1, 0, ['10:00-11:00']),
+                        create_order_dict(1, 1, 1, ['10:00-11:00'])]) == ([1], False)
+    # The same id in the shard of another region is a conflict too
+    assert sharded.add([create_order_dict(1, 1, 0, ['10:00-11:00'])]) == ([1], False)
+    assert sharded.get_existing_ids([1, 2]) == [1]
+    assert sharded.last_event_seq() == last_seq
+
+
+def test_shard_failure_rolls_back_other_shards(tmp_path, monkeypatch):
+    engine, sharded, couriers = init_sharded(f'sqlite:///{tmp_path}/main.db', f'sqlite:///{tmp_path}/shard{{}}.db', 2,
+                                             'wal')
+
+    def fail(data):
+        raise db.exc.IntegrityError('INSERT INTO orders', [], ValueError('conflict'))
+    monkeypatch.setattr(sharded.shards[1], 'insert_rows', fail)
+    assert sharded.add([create_order_dict(2, 1, 0, ['10:00-11:00']),
+                        create_order_dict(3, 1, 1, ['10:00-11:00'])]) == ([], False)
+    assert sharded.shards[0].get_existing_ids([2]) == []
+    with sharded.shards[0].engine.connect() as con:
+        assert con.execute(db.select(db.func.count()).select_from(sharded.shards[0].hours_table)).scalar() == 0
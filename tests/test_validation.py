@@ -0,0 +1,68 @@
+import pytest
+
+from app.validation import *
+from tests.utils_for_test import *
+
+
+def order(**kwargs):
+    return dict(create_order_dict(1, 1.5, 1, ['09:00-12:00']), **kwargs)
+
+
+def courier(**kwargs):
+    return dict(create_courier_dict(1, 'foot', [1, 2], ['09:00-12:00']), **kwargs)
+
+
+def test_valid():
+    assert validate_order(order())
+    assert validate_order(order(weight=50, delivery_hours=[]))
+    assert validate_courier(courier())
+    assert validate_courier(courier(regions=[], working_hours=['00:00-23:59', '22:00-01:00']))
+
+
+@pytest.mark.parametrize('elem', [
+    {'order_id': 1},
+    dict(order(), extra=1),
+    order(order_id='1'),
+    order(order_id=True),
+    order(weight=0.001),
+    order(weight=50.01),
+    order(weight='1'),
+    order(weight=float('nan')),
+    order(region=1.0),
+    order(delivery_hours='09:00-12:00'),
+    order(delivery_hours=['9:00-12:00']),
+    order(delivery_hours=['09:00-12:00 ']),
+    order(delivery_hours=['09:00-24:00']),
+    order(delivery_hours=[540]),
+    [1, 2],
+])
+def test_invalid_order(elem):
+    assert not validate_order(elem)
+
+
+@pytest.mark.parametrize('elem', [
+    {'courier_id': 1},
+    dict(courier(), extra=1),
+    courier(courier_id=None),
+    courier(courier_type='plane'),
+    courier(regions=['1']),
+    courier(regions=1),
+    courier(working_hours=['09:00-12:60']),
+])
+def test_invalid_courier(elem):
+    assert not validate_courier(elem)
+
+
+def test_find_invalid():
+    data = [order(order_id=1), order(order_id=2, weight=0), order(order_id=1), order(order_id=3)]
+    assert find_invalid(data, validate_order, 'order_id') == [1, 2]
+
+
+def test_courier_update():
+    assert validate_courier_update({})
+    assert validate_courier_update({'courier_type': 'car'})
+    assert validate_courier_update({'regions': [1], 'working_hours': ['09:00-12:00']})
+    assert not validate_courier_update({'courier_type': 'plane'})
+    assert not validate_courier_update({'courier_type': ['car']})
+    assert not validate_courier_update({'courier_id': 2})
+    assert not validate_courier_update({'some_other_type': 'changed'})
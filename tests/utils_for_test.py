@@ -23,29 +23,50 @@ def create_courier_dict(c_id, c_type, regs, hours):
     }
 
 
-def get_random_from_seq(seq: tp.List[tp.Any]):
-    return random.choice(seq)
+# rng - генератор случайных чисел (random.Random(seed) для воспроизводимых данных), по умолчанию модуль random
 
+def get_random_from_seq(seq: tp.List[tp.Any], rng: tp.Any = random):
+    return rng.choice(seq)
 
-def generate_courier_type():
+
+def generate_courier_type(rng: tp.Any = random):
     lst = ['foot', 'bike', 'car']
-    return get_random_from_seq(lst)
+    return get_random_from_seq(lst, rng)
 
 
-def generate_region():
+def generate_region(rng: tp.Any = random):
     lst = REGION_RANGE
-    return get_random_from_seq(lst)
+    return get_random_from_seq(lst, rng)
+
+
+def generate_set_of_regions(rng: tp.Any = random):
+    n = rng.choice(NUM_OF_REGIONS)
+    return rng.sample(REGION_RANGE, n)
+
+
+def generate_weight(rng: tp.Any = random):
+    return rng.choice(list(range(50))) + 1 / rng.choice(list(range(1, 100)))
 
 
-def generate_set_of_regions():
-    n = random.choice(NUM_OF_REGIONS)
-    return random.sample(REGION_RANGE, n)
+def generate_delivery_hours(rng: tp.Any = random):
+    start = get_random_from_seq(list(range(6, 16)), rng)
+    return f'{"0" * (1 - start // 10)}{start}:00-{start + 8}:00'
 
 
-def generate_weight():
-    return random.choice(list(range(50))) + 1 / random.choice(list(range(100)))
+def generate_couriers(courier_ids: tp.Iterable[int], seed: int):
+    """
+    Курьеры с айди из courier_ids, одни и те же при одном seed. Генератор: большие наборы не держатся в памяти
+    """
+    rng = random.Random(seed)
+    for i in courier_ids:
+        yield create_courier_dict(i, generate_courier_type(rng), generate_set_of_regions(rng),
+                                  [generate_delivery_hours(rng)])
 
 
-def generate_delivery_hours():
-    start = get_random_from_seq(list(range(6, 16)))
-    return f'{"0" * (1 - start // 10)}{start}:00-{start + 8}:00'
\ No newline at end of file
+def generate_orders(order_ids: tp.Iterable[int], seed: int):
+    """
+    Заказы с айди из order_ids, одни и те же при одном seed
+    """
+    rng = random.Random(seed)
+    for i in order_ids:
+        yield create_order_dict(i, generate_weight(rng), generate_region(rng), [generate_delivery_hours(rng)])